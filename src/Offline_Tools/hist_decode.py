@@ -0,0 +1,48 @@
+# hist_decode.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# CPython script to decode a copy of the messages history file "msg_hist.bin"
+# of the Presto MQTT subscriber (mqtt_presto_v9c.py) into JSon lines, one record per line,
+# in the format of the "msg_hist.json" file of the versions before 2026-10-18.
+# The file is only read. It uses hist_ring.py and hist_codec.py from ../Subscriber/Subscriber_v9c/lib.
+#
+# Usage: python hist_decode.py msg_hist.bin [--newest-first] [--topic N] [--stats] > msg_hist.json
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Subscriber", "Subscriber_v9c", "lib"))
+from hist_ring import HistRing  # noqa: E402
+from hist_codec import HistCodec  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode a copy of msg_hist.bin into JSon lines")
+    parser.add_argument("path", help="the messages history file, e.g.: msg_hist.bin")
+    parser.add_argument("--newest-first", action="store_true", help="newest record first")
+    parser.add_argument("--topic", type=int, default=None, help="only the records of this topic index")
+    parser.add_argument("--stats", action="store_true", help="print the file statistics to stderr")
+    args = parser.parse_args()
+
+    ring = HistRing(args.path)
+    if not ring.open_readonly():
+        sys.exit(f"{args.path} is not a messages history file")
+    codec = HistCodec(ring)
+    n = 0
+    for seq, t, topic_idx, kind, data in ring.records(args.newest_first):
+        if args.topic is not None and topic_idx != args.topic:
+            continue
+        record = codec.decode(kind, data, t, topic_idx)
+        if record is None:
+            print(f"⚠️ record {seq}: kind {kind} could not be decoded", file=sys.stderr)
+            continue
+        print(json.dumps(record))
+        n += 1
+    if args.stats:
+        print(f"{n} records decoded. {ring.stats()}, templates: {len(codec)}", file=sys.stderr)
+    ring.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+# presto_analytics.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# CPython library and command line tool to analyse the files on the SD-cards of one or more
+# Presto MQTT subscribers (mqtt_presto_v9c.py and earlier versions):
+# - the messages history: "msg_hist.json" (JSon lines, also "msg_hist.json.old") and "msg_hist.bin" (ring buffer file);
+# - the session logs "mqtt_log_*.txt" and the compressed ones "mqtt_log_*.txt.gz".
+# Each path given is one device (e.g. the copy of the SD-card of one Presto), searched for these files.
+#
+# The JSon lines files are memory mapped and parsed in chunks (split at line ends) by a pool of processes.
+# Each chunk returns NumPy arrays: topic index, uxTime and the sensor readings ("t", "p", "a", "h", NaN if none).
+# The statistics are computed on these arrays, vectorised:
+# - per device and topic: number of messages, message rate, inter-arrival gaps, outage windows
+#   (gaps longer than a threshold) and the statistics of each sensor reading;
+# - per device, from the logs: the sessions (from "WiFi connected" to "Session interrupted" or the next start)
+#   and the outage windows between them.
+# The log files are parsed by the same pool: a text log file in chunks, a compressed one per file,
+# decompressed while it is read.
+#
+# Requires: numpy. The decoding of "msg_hist.bin" uses hist_ring.py and hist_codec.py from ../Subscriber/Subscriber_v9c/lib.
+#
+# Usage: python presto_analytics.py PATH [PATH ...] [--workers N] [--min-gap SECONDS] [--json]
+import argparse
+import gzip
+import json
+import mmap
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Subscriber", "Subscriber_v9c", "lib"))
+from hist_ring import HistRing  # noqa: E402
+from hist_codec import HistCodec  # noqa: E402
+
+FIELDS = ("t", "p", "a", "h")  # the sensor readings: temperature, pressure, altitude, humidity
+FIELD_NAMES = {"t": "temperature", "p": "pressure", "a": "altitude", "h": "humidity"}
+CHUNK_SIZE = 16 * 1024 * 1024  # bytes of a JSon lines file per task of the process pool
+LOG_LINE = re.compile(rb"^ ?(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d) (.*?)\r?$", re.M)
+SESSION_START = b"WiFi connected"
+SESSION_END = b"Session interrupted"
+
+# ---------- messages history ----------
+
+class Series:
+    """ The messages of one device as NumPy arrays, in order of the files read """
+    def __init__(self, topic_idx, t, values, topics: dict):
+        self.topic_idx = topic_idx  # int16
+        self.t = t                  # int64, uxTime
+        self.values = values        # float64, shape (n, len(FIELDS)), NaN where not present
+        self.topics = topics        # topicIdx → topic
+
+    def __len__(self):
+        return len(self.t)
+
+    @staticmethod
+    def concat(parts):
+        parts = [p for p in parts if len(p) > 0]
+        topics = {}
+        for p in parts:
+            topics.update(p.topics)
+        if not parts:
+            return Series(np.empty(0, np.int16), np.empty(0, np.int64), np.empty((0, len(FIELDS))), topics)
+        return Series(np.concatenate([p.topic_idx for p in parts]), np.concatenate([p.t for p in parts]),
+                      np.concatenate([p.values for p in parts]), topics)
+
+def _record_row(record: dict):
+    idx = record.get("topicIdx")
+    t = record.get("t")
+    if not isinstance(idx, int) or not isinstance(t, int):
+        return None
+    row = [np.nan] * len(FIELDS)
+    payload = record.get("payload")
+    if isinstance(payload, dict):
+        for i, k in enumerate(FIELDS):
+            read = payload.get(k)
+            if isinstance(read, dict) and isinstance(read.get("v"), (int, float)):
+                row[i] = read["v"]
+    return idx, t, row
+
+def _rows_to_series(idxs, ts, rows, topics) -> Series:
+    return Series(np.array(idxs, np.int16), np.array(ts, np.int64),
+                  np.array(rows, np.float64).reshape(-1, len(FIELDS)), topics)
+
+# Parse the lines from byte start to end of a JSon lines file. Runs in a process of the pool
+def _parse_chunk(path: str, start: int, end: int) -> Series:
+    idxs, ts, rows, topics = [], [], [], {}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in mm[start:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            r = _record_row(record)
+            if r is None:
+                continue
+            idxs.append(r[0])
+            ts.append(r[1])
+            rows.append(r[2])
+            if r[0] not in topics and isinstance(record.get("topic"), str):
+                topics[r[0]] = record["topic"]
+    return _rows_to_series(idxs, ts, rows, topics)
+
+# Split a file into chunks of about chunk_size bytes, at line ends. Returns a list of (start, end)
+def chunk_ranges(path: str, chunk_size: int = CHUNK_SIZE):
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    ranges = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = mm.find(b"\n", min(start + chunk_size, size) - 1)
+            end = size if end < 0 else end + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+# Read a msg_hist.bin ring buffer file
+def read_hist_bin(path: str) -> Series:
+    ring = HistRing(path)
+    if not ring.open_readonly():
+        return Series.concat([])
+    codec = HistCodec(ring)
+    idxs, ts, rows, topics = [], [], [], {}
+    for seq, t, topic_idx, kind, data in ring.records():
+        record = codec.decode(kind, data, t, topic_idx)
+        if not isinstance(record, dict):
+            continue
+        r = _record_row(record)
+        if r is None:
+            continue
+        idxs.append(r[0])
+        ts.append(r[1])
+        rows.append(r[2])
+        if r[0] not in topics and isinstance(record.get("topic"), str):
+            topics[r[0]] = record["topic"]
+    ring.close()
+    return _rows_to_series(idxs, ts, rows, topics)
+
+def _key(series: Series):
+    return (series.topic_idx.astype(np.int64) << 32) | (series.t & 0xFFFFFFFF)
+
+# Load the messages history files of one device. pool: a ProcessPoolExecutor (None: in this process)
+def load_history(files, pool=None, chunk_size: int = CHUNK_SIZE) -> Series:
+    parts = [[] for _ in files]  # per file, its Series
+    tasks = []
+    for i, path in enumerate(files):
+        if path.endswith(".bin"):
+            parts[i].append(read_hist_bin(path))
+        else:
+            for start, end in chunk_ranges(path, chunk_size):
+                tasks.append((i, path, start, end))
+    if tasks:
+        args = list(zip(*tasks))[1:]
+        results = map(_parse_chunk, *args) if pool is None else pool.map(_parse_chunk, *args)
+        for task, part in zip(tasks, results):
+            parts[task[0]].append(part)
+    # The same record can be in msg_hist.json.old and msg_hist.bin (imported): a record of a file
+    # is dropped if a record of an earlier file has the same topic and t. Within one file all are kept:
+    # two messages of one topic can arrive in the same second
+    series = []
+    seen = np.empty(0, np.int64)
+    for p in parts:
+        s = Series.concat(p)
+        if len(s) == 0:
+            continue
+        key = _key(s)
+        if len(seen) > 0:
+            keep = ~np.isin(key, seen)
+            s = Series(s.topic_idx[keep], s.t[keep], s.values[keep], s.topics)
+            key = key[keep]
+        seen = np.union1d(seen, key)
+        series.append(s)
+    return Series.concat(series)
+
+# Returns the outage windows of a sorted array of uxTimes: the gaps longer than min_gap, as array of shape (n, 2)
+def outage_windows(t, min_gap: float):
+    if len(t) < 2:
+        return np.empty((0, 2), np.int64)
+    gaps = np.diff(t)
+    i = np.nonzero(gaps > min_gap)[0]
+    return np.stack([t[i], t[i + 1]], axis=1)
+
+# Statistics per topic of one device. min_gap: outage threshold in seconds (0: 5 x the median gap, at least 300 s)
+def topic_stats(series: Series, min_gap: float = 0) -> dict:
+    stats = {}
+    for idx in np.unique(series.topic_idx):
+        sel = series.topic_idx == idx
+        t = np.sort(series.t[sel])
+        st = {"topic": series.topics.get(int(idx), ""), "messages": int(len(t)),
+              "first": int(t[0]), "last": int(t[-1])}
+        span = t[-1] - t[0]
+        st["rate_per_hour"] = float(len(t) * 3600 / span) if span > 0 else None
+        if len(t) > 1:
+            gaps = np.diff(t)
+            p50, p95 = np.percentile(gaps, (50, 95))
+            st["gap_s"] = {"median": float(p50), "p95": float(p95), "max": int(gaps.max())}
+            threshold = min_gap if min_gap > 0 else max(5 * p50, 300)
+            windows = outage_windows(t, threshold)
+            st["outages"] = [{"from": int(a), "to": int(b), "seconds": int(b - a)} for a, b in windows]
+        vals = series.values[sel]
+        readings = {}
+        for i, k in enumerate(FIELDS):
+            v = vals[:, i]
+            v = v[~np.isnan(v)]
+            if len(v) > 0:
+                p5, p50, p95 = np.percentile(v, (5, 50, 95))
+                readings[FIELD_NAMES[k]] = {"n": int(len(v)), "min": float(v.min()), "max": float(v.max()),
+                                            "mean": float(v.mean()), "std": float(v.std()),
+                                            "p5": float(p5), "p50": float(p50), "p95": float(p95)}
+        if readings:
+            st["readings"] = readings
+        stats[int(idx)] = st
+    return stats
+
+# ---------- session logs ----------
+
+def _stamps(stamps):
+    return np.array(stamps, dtype="datetime64[s]").astype(np.int64) if stamps else np.empty(0, np.int64)
+
+# Parse the events from byte start to end of a log file, or (end -1) all of a compressed one, line by line.
+# Returns (uxTimes as int64 array, list of texts). Runs in a process of the pool
+def _parse_log_chunk(path: str, start: int, end: int):
+    stamps, texts = [], []
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                m = LOG_LINE.match(line)
+                if m:
+                    stamps.append(m.group(1))
+                    texts.append(m.group(2))
+    else:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for m in LOG_LINE.finditer(mm[start:end]):
+                stamps.append(m.group(1))
+                texts.append(m.group(2))
+    return _stamps(stamps), texts
+
+# Read the events of the mqtt_log_*.txt(.gz) files of one device. pool: a ProcessPoolExecutor (None: in this process).
+# Returns (uxTimes as int64 array, list of texts), sorted
+def load_logs(files, pool=None, chunk_size: int = CHUNK_SIZE):
+    tasks = []
+    for path in files:
+        if os.path.getsize(path) == 0:
+            continue
+        if path.endswith(".gz"):
+            tasks.append((path, 0, -1))  # a gzip stream can not be split
+        else:
+            tasks.extend((path, start, end) for start, end in chunk_ranges(path, chunk_size))
+    if not tasks:
+        return np.empty(0, np.int64), []
+    args = list(zip(*tasks))
+    parts = list(map(_parse_log_chunk, *args) if pool is None else pool.map(_parse_log_chunk, *args))
+    t = np.concatenate([p[0] for p in parts])
+    texts = [x for p in parts for x in p[1]]
+    order = np.argsort(t, kind="stable")
+    return t[order], [texts[i] for i in order]
+
+# The sessions of the subscriber from its log events, as array of shape (n, 2): start, end (uxTime).
+# A session ends at "Session interrupted", or at its last event before the next start
+def log_sessions(t, texts):
+    if len(t) == 0:
+        return np.empty((0, 2), np.int64)
+    start = np.array([x.startswith(SESSION_START) for x in texts])
+    end = np.array([x.startswith(SESSION_END) for x in texts])
+    sid = np.cumsum(start)  # session number of each event, 0: before the first start
+    keep = sid > 0
+    if not keep.any():
+        return np.empty((0, 2), np.int64)
+    sid, ts, end = sid[keep], t[keep], end[keep]
+    n = sid.max()
+    starts = np.full(n, np.iinfo(np.int64).max)
+    ends = np.zeros(n, np.int64)
+    np.minimum.at(starts, sid - 1, ts)
+    np.maximum.at(ends, sid - 1, ts)
+    # An explicit end: the first "Session interrupted" of the session
+    ended = np.full(n, np.iinfo(np.int64).max)
+    np.minimum.at(ended, sid[end] - 1, ts[end])
+    ends = np.where(ended < np.iinfo(np.int64).max, ended, ends)
+    return np.stack([starts, ends], axis=1)
+
+def log_stats(t, texts, min_gap: float = 60) -> dict:
+    sessions = log_sessions(t, texts)
+    st = {"events": int(len(t)), "sessions": int(len(sessions))}
+    if len(sessions) > 0:
+        dur = sessions[:, 1] - sessions[:, 0]
+        st["session_s"] = {"total": int(dur.sum()), "median": float(np.median(dur)), "max": int(dur.max())}
+        down = sessions[1:, 0] - sessions[:-1, 1]
+        i = np.nonzero(down > min_gap)[0]
+        st["outages"] = [{"from": int(sessions[j, 1]), "to": int(sessions[j + 1, 0]), "seconds": int(down[j])}
+                         for j in i]
+    return st
+
+# ---------- devices ----------
+
+# The history and log files under path, as tuple (history files, log files)
+def find_files(path: str):
+    hist, logs = [], []
+    if os.path.isfile(path):
+        walk = [(os.path.dirname(path), [], [os.path.basename(path)])]
+    else:
+        walk = os.walk(path)
+    for root, dirs, files in walk:
+        for fn in sorted(files):
+            full = os.path.join(root, fn)
+            if fn in ("msg_hist.json", "msg_hist.json.old", "msg_hist.bin"):
+                hist.append(full)
+            elif fn.startswith("mqtt_log_") and (fn.endswith(".txt") or fn.endswith(".txt.gz")):
+                logs.append(full)
+    return hist, logs
+
+def analyse(paths, workers: int = 0, min_gap: float = 0) -> dict:
+    report = {}
+    pool = ProcessPoolExecutor(workers or None) if workers != 1 else None
+    try:
+        for path in paths:
+            hist, logs = find_files(path)
+            series = load_history(hist, pool)
+            t, texts = load_logs(logs, pool)
+            report[path] = {"files": {"history": hist, "logs": logs},
+                            "topics": topic_stats(series, min_gap),
+                            "log": log_stats(t, texts)}
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return report
+
+def _iso(t: int) -> str:
+    return str(np.datetime64(int(t), "s"))
+
+def print_report(report: dict):
+    for device, rep in report.items():
+        print(f"=== {device}: {len(rep['files']['history'])} history file(s), {len(rep['files']['logs'])} log file(s)")
+        for idx, st in rep["topics"].items():
+            rate = f"{st['rate_per_hour']:.1f}/h" if st["rate_per_hour"] else "-"
+            print(f"topic {idx} \"{st['topic']}\": {st['messages']} messages, {_iso(st['first'])} .. {_iso(st['last'])}, "
+                  f"rate {rate}")
+            if "gap_s" in st:
+                g = st["gap_s"]
+                print(f"  gaps: median {g['median']:.0f} s, p95 {g['p95']:.0f} s, max {g['max']} s, "
+                      f"outages: {len(st['outages'])}")
+                for o in st["outages"]:
+                    print(f"    {_iso(o['from'])} .. {_iso(o['to'])} ({o['seconds']} s)")
+            for name, r in st.get("readings", {}).items():
+                print(f"  {name:12s} n {r['n']}, min {r['min']:.1f}, max {r['max']:.1f}, mean {r['mean']:.2f}, "
+                      f"std {r['std']:.2f}, p5/p50/p95 {r['p5']:.1f}/{r['p50']:.1f}/{r['p95']:.1f}")
+        lg = rep["log"]
+        print(f"log: {lg['events']} events, {lg['sessions']} sessions")
+        if "session_s" in lg:
+            s = lg["session_s"]
+            print(f"  sessions: total {s['total']} s, median {s['median']:.0f} s, max {s['max']} s")
+            for o in lg["outages"]:
+                print(f"  down {_iso(o['from'])} .. {_iso(o['to'])} ({o['seconds']} s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse the messages history and logs of Presto MQTT subscribers")
+    parser.add_argument("paths", nargs="+", help="per device: a copy of its SD-card (directory) or a file")
+    parser.add_argument("--workers", type=int, default=0, help="processes to parse with (0: all CPUs, 1: no pool)")
+    parser.add_argument("--min-gap", type=float, default=0,
+                        help="outage threshold in seconds (0: 5 x the median gap of the topic, at least 300)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSon")
+    args = parser.parse_args()
+    report = analyse(args.paths, args.workers, args.min_gap)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# presto_logs.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# CPython tool to read the log files of the Presto MQTT subscriber (mqtt_presto_v9c.py) from a copy of its SD-card:
+# - the ring of log files "mqtt_log_00.txt", "mqtt_log_01.txt", .. (see lib/log_ring.py);
+# - the closed log files compressed by the subscriber: "mqtt_log_NN.txt.gz" (gzip, see lib/log_deflate.py);
+# - the timestamp named log files of the previous versions: "mqtt_log_<timestamp>.txt".
+# The log files are printed (or written as text files to the directory given with --out) oldest first:
+# by the generation in their first line ("---Log created on: 2026-10-18T10:00:00--- #17"),
+# the log files without a generation by their name, before the others.
+# The compressed files are decompressed while they are read, in chunks.
+#
+# Usage: python presto_logs.py PATH [PATH ...] [--out DIR] [--list]
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sys
+
+LOG_NAME = re.compile(r"^mqtt_log_.*\.txt(\.gz)?$")
+GEN = re.compile(rb"#(\d+)\s*$")
+
+def open_log(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+# Generation in the first line of a log file, 0 if none
+def log_gen(path: str) -> int:
+    try:
+        with open_log(path) as f:
+            m = GEN.search(f.readline())
+    except (OSError, EOFError):
+        return 0
+    return int(m.group(1)) if m else 0
+
+# The log files under path (a directory or a file), oldest first, as list of (generation, path)
+def find_logs(path: str):
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = [os.path.join(root, fn) for root, dirs, files in os.walk(path) for fn in files if LOG_NAME.match(fn)]
+    return sorted(((log_gen(p), p) for p in paths), key=lambda e: (e[0], os.path.basename(e[1])))
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the (compressed) log files of the Presto MQTT subscriber")
+    parser.add_argument("paths", nargs="+", help="a copy of the SD-card (directory) or log files")
+    parser.add_argument("--out", help="write the log files as text files to this directory, instead of printing them")
+    parser.add_argument("--list", action="store_true", help="only list the log files, oldest first")
+    args = parser.parse_args()
+    for path in args.paths:
+        for gen, p in find_logs(path):
+            if args.list:
+                print(f"{gen:6d} {os.path.getsize(p):8d} {p}")
+                continue
+            try:
+                with open_log(p) as src:
+                    if args.out:
+                        os.makedirs(args.out, exist_ok=True)
+                        fn = os.path.basename(p)
+                        fn = fn[:-3] if fn.endswith(".gz") else fn
+                        with open(os.path.join(args.out, fn), "wb") as dst:
+                            shutil.copyfileobj(src, dst)
+                    else:
+                        shutil.copyfileobj(src, sys.stdout.buffer)
+                        sys.stdout.buffer.write(b"\n")
+            except (OSError, EOFError) as e:
+                print(f"⚠️ unable to read \"{p}\": {e}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
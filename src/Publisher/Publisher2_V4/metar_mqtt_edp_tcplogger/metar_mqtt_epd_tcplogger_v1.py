@@ -35,6 +35,10 @@ In this version the received METAR data will be displayed on a connected Lolin 2
 250 x 122 pixels. Note that the clearing of the display buffers and the build-up of the text on this ePD
 takes some seconds and delays the execution of this script.
 For this notifications of actions regarding the screen are printed to the serial output.
+Update 2026-10-18
+composePayload(), send_msg() and unixToIso8601() log through the leveled logger log_pub (see lib/mlog.py).
+Every tcp_logger.write() pings the target and opens a TCP connection. By default (my_debug False) the
+details of each message are not formatted nor sent, only the warnings, errors and the "MQTT message nr: .. sent" line.
 
 """
 import machine
@@ -55,6 +59,7 @@ import framebuf
 from lib.LOLIN_SSD1680 import SSD1680, EPD_BLACK, EPD_WHITE, EPD_RED
 from lib.fonts import asc2_0806
 from lib.tcp_logger_v1 import TCPLogger
+from lib import mlog
 import gc
 
 my_debug = False
@@ -137,6 +142,15 @@ except Exception as e:
 
 # ===== End TCP setup =====
 
+# Leveled logging of the per message functions (see lib/mlog.py). Each line sent by tcp_logger.write()
+# pings the target and opens a TCP connection, so by default only warnings and errors of "pub" are sent.
+LOG_LEVEL = mlog.DEBUG if my_debug else mlog.INFO  # default threshold
+LOG_LEVELS = {} if my_debug else {"pub": mlog.WARN}
+LOG_MEM_LINES = 0  # > 0: keep the last LOG_MEM_LINES lines in RAM
+mlog.configure(LOG_LEVEL, LOG_LEVELS, tcp_logger.write,
+               mlog.RingSink(LOG_MEM_LINES) if LOG_MEM_LINES > 0 else None)
+log_pub = mlog.get_logger("pub")  # composePayload(), send_msg(), unixToIso8601()
+
 # === Print intro using tcp_logger ===
 tcp_logger.write("\nPimoroni\n")
 tcp_logger.write("Pico LiPo 2XL W\n")
@@ -558,8 +572,8 @@ def composePayload(local_or_utc: bool = False) -> int:
     # Root fields
 
     # Define nested objects
-    if not my_debug:
-        tcp_logger.write(TAG+f"PUBLISHER_ID = {PUBLISHER_ID}\n")
+    if log_pub.inf:
+        log_pub.info(TAG+"PUBLISHER_ID = {}\n", PUBLISHER_ID)
     hd = {"ow": PUBLISHER_ID, # owner
       "de": "Ext",            # description (room, office, Ext for Extern (e.g.: Internet) etc.)
       "dc": "wx",             # device_class
@@ -581,8 +595,8 @@ def composePayload(local_or_utc: bool = False) -> int:
 
     # Convert to JSON string 
     written = ujson.dumps(payLoad).encode('utf-8')  # Return the int value written
-    if my_debug:
-        tcp_logger.write(TAG+f"written = {written}\n")
+    if log_pub.dbg:
+        log_pub.debug(TAG+"written = {}\n", written)
     return written
 
 def send_msg() -> bool:
@@ -604,43 +618,43 @@ def send_msg() -> bool:
     n = msgStr.find("hd")
     
     if le > 0:
-        if not my_debug:
+        if log_pub.inf:
             #tcp_logger.write(f"contents payLoad: {payLoad}")
             topicLength = len(topic)
-            tcp_logger.write(TAG+f"Topic length: {topicLength}\n")
-            tcp_logger.write(TAG+f"length written: {le}\n")
-            tcp_logger.write(TAG+f"MQTT message ID: {mqttMsgID}\n")
-            tcp_logger.write(TAG+f"in IS8601 = {unixToIso8601(mqttMsgID, False)} UTC\n")  # use UTC
-            tcp_logger.write(TAG+f"Topic = \"{topic}\"")
+            log_pub.info(TAG+"Topic length: {}\n", topicLength)
+            log_pub.info(TAG+"length written: {}\n", le)
+            log_pub.info(TAG+"MQTT message ID: {}\n", mqttMsgID)
+            log_pub.info(TAG+"in IS8601 = {} UTC\n", unixToIso8601(mqttMsgID, False))  # use UTC
+            log_pub.info(TAG+"Topic = \"{}\"", topic)
             if n >= 2:
-                tcp_logger.write(TAG+f"msg = {msg[:n-2]}\n") # {payLoad}")  -- do the split at "hd"
-                tcp_logger.write(f"\t{msg[n-2:]}\n")  
+                log_pub.info(TAG+"msg = {}\n", msg[:n-2]) # {payLoad}")  -- do the split at "hd"
+                log_pub.info("\t{}\n", msg[n-2:])
             else:
-                tcp_logger.write(TAG+f"msg = {msg[:65]}\n") # {payLoad}") # no "hd" found, so just split at 65 char's
-                tcp_logger.write(f"\t{msg[65:]}\n")
-        if my_debug:
-            tcp_logger.write(TAG+f"topic type: {type(topic)}\n")  # should be <class 'bytes'>
-            tcp_logger.write(TAG+f"msg type: {type(msg)}\n")      # should be <class 'bytes'>
+                log_pub.info(TAG+"msg = {}\n", msg[:65]) # {payLoad}") # no "hd" found, so just split at 65 char's
+                log_pub.info("\t{}\n", msg[65:])
+        if log_pub.dbg:
+            log_pub.debug(TAG+"topic type: {}\n", type(topic))  # should be <class 'bytes'>
+            log_pub.debug(TAG+"msg type: {}\n", type(msg))      # should be <class 'bytes'>
 
         try_cnt = 0
         while not mqtt.sock:
-            tcp_logger.write(TAG+"⚠️ Socket is not connected! Going to connect...\n")
+            log_pub.warn(TAG+"⚠️ Socket is not connected! Going to connect...\n")
             mqtt.connect()
             time.sleep(0.1)
             try_cnt += 1
             if try_cnt > 50:
-                tcp_logger.write(TAG+"⚠️ Unable to mqtt.connect!\n")
+                log_pub.error(TAG+"⚠️ Unable to mqtt.connect!\n")
                 break
         if try_cnt <= 50:
             if mqtt.sock:
-                if my_debug:
-                    tcp_logger.write(TAG+f"we have a socket: type(mqtt.sock) = {type(mqtt.sock)}\n")
+                if log_pub.dbg:
+                    log_pub.debug(TAG+"we have a socket: type(mqtt.sock) = {}\n", type(mqtt.sock))
                 mqtt.publish(topic,msg,qos=0)
         else:
-            tcp_logger.write(TAG+"⚠️ failed to publish mqtt metar message. No mqtt.sock!\n")
+            log_pub.error(TAG+"⚠️ failed to publish mqtt metar message. No mqtt.sock!\n")
             return ret
     else:
-        tcp_logger.write(TAG+"⚠️ Failed to compose JSON msg\n")
+        log_pub.error(TAG+"⚠️ Failed to compose JSON msg\n")
         return ret
     
     tcp_logger.write(TAG+"✅ MQTT message nr: {:3d} sent\n".format(msgSentCnt))
@@ -740,8 +754,8 @@ def unixToIso8601(unixTime, local_or_utc: bool =False) -> str:
 
     # Apply offset in seconds
     offset_seconds = int(offset * 3600)
-    if my_debug:
-        tcp_logger.write(TAG+f"offset_seconds = {offset_seconds}\n")
+    if log_pub.dbg:
+        log_pub.debug(TAG+"offset_seconds = {}\n", offset_seconds)
     adjusted_time = unixTime + offset_seconds
 
     # Convert to time tuple
@@ -754,19 +768,19 @@ def unixToIso8601(unixTime, local_or_utc: bool =False) -> str:
     offset_hours = int(offset_abs)
     offset_minutes = int(round((offset_abs - offset_hours) * 60))
     offsetStr = f"{sign}{offset_hours:02d}:{offset_minutes:02d}"
-    if my_debug:
-        tcp_logger.write(TAG + f"offset_hours {offset_hours}\n")
-        tcp_logger.write(TAG + f"offset_minutes {offset_minutes}\n")
-        tcp_logger.write(TAG + f"offsetStr {offsetStr}\n")
+    if log_pub.dbg:
+        log_pub.debug(TAG + "offset_hours {}\n", offset_hours)
+        log_pub.debug(TAG + "offset_minutes {}\n", offset_minutes)
+        log_pub.debug(TAG + "offsetStr {}\n", offsetStr)
         
 
     # Build ISO 8601 string
     iso_str = f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}{offsetStr}"
 
-    if my_debug:
-        tcp_logger.write(TAG + f"unixTime = {unixTime}\n")
-        tcp_logger.write(TAG + f"adjusted_time = {adjusted_time}\n")
-        tcp_logger.write(TAG + f"iso_str = {iso_str}\n")
+    if log_pub.dbg:
+        log_pub.debug(TAG + "unixTime = {}\n", unixTime)
+        log_pub.debug(TAG + "adjusted_time = {}\n", adjusted_time)
+        log_pub.debug(TAG + "iso_str = {}\n", iso_str)
 
     return iso_str
 
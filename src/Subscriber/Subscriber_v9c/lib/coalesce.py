@@ -0,0 +1,69 @@
+""" Micropython latest-value-wins coalescing of received messages before rendering """
+# coalesce.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# Every received message is still handled by split_msg(): saved to its entity object,
+# its lights side effects applied and its record written to the history file on SD.
+# Only the rendering is coalesced: split_msg() leaves the newest values of a topic
+# in the MsgRecord of its topic handler, the handler is marked here as dirty,
+# and the main loop draws the most recently updated topic at most once per tick.
+# Messages of a topic that were superseded before they were drawn are counted per topic.
+#
+# This file contains one class:
+# - Coalescer.
+
+import time
+
+class Coalescer:
+    def __init__(self, tick_ms: int = 500):
+        self.tick_ms = tick_ms
+        self._dirty = {}      # topic handler → number of messages since the last render
+        self._latest = None   # the most recently marked topic handler
+        self._topic = None    # the received topic of that message
+        self._redraw = False  # a full redraw (display color change) is pending
+        self._last_ms = time.ticks_add(time.ticks_ms(), -tick_ms)
+        # Counters
+        self.marked = 0       # messages marked
+        self.rendered = 0     # renders done
+        self.superseded = {}  # topic → messages not drawn because a newer one arrived
+
+    def mark(self, hdlr, topic: str, redraw: bool = False):
+        self._dirty[hdlr] = self._dirty.get(hdlr, 0) + 1
+        self._latest = hdlr
+        self._topic = topic
+        if redraw:
+            self._redraw = True
+        self.marked += 1
+
+    def pending(self) -> bool:
+        return self._latest is not None
+
+    # Milliseconds until the next render is allowed
+    def wait_ms(self, now_ms: int) -> int:
+        return max(0, self.tick_ms - time.ticks_diff(now_ms, self._last_ms))
+
+    # Returns (topic handler to draw, received topic, redraw flag) and clears the dirty topics
+    def take(self, now_ms: int):
+        hdlr = self._latest
+        topic = self._topic
+        redraw = self._redraw
+        for h, n in self._dirty.items():
+            skipped = n - 1 if h is hdlr else n
+            if skipped > 0:
+                self.superseded[h.topic] = self.superseded.get(h.topic, 0) + skipped
+        self._dirty.clear()
+        self._latest = None
+        self._topic = None
+        self._redraw = False
+        self._last_ms = now_ms
+        self.rendered += 1
+        return hdlr, topic, redraw
+
+    def stats(self) -> str:
+        return "marked: {}, rendered: {}, tick: {} ms, superseded per topic: {}".format(
+            self.marked, self.rendered, self.tick_ms, self.superseded)
@@ -0,0 +1,108 @@
+""" Micropython cache of the names and sizes of the files in a directory (the /sd volume) """
+# fs_cache.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# ck_log(), ref_file_exists(), get_active_log_filename(), list_logfiles() and del_logfiles() called
+# os.listdir("/sd/") to check whether one file exists. On a FAT card with many log files that reads
+# the whole directory every time. FsCache reads the directory once (with os.ilistdir(), that also gives
+# the file sizes on MicroPython) and keeps a table name → size in RAM.
+# The main script tells the cache when it creates, writes, renames or removes a file (created(), resized(),
+# rename(), remove(), removed()), so existence checks are dictionary lookups.
+# A size that is not known (None, e.g. after invalidate(name)) is read with os.stat() once.
+# Files created by other modules (e.g. the history and rollup files) are not tracked:
+# only ask the cache for the files the main script manages, or call invalidate() to read the directory again.
+#
+# This file contains one class:
+# - FsCache.
+
+import os
+
+class FsCache:
+    def __init__(self, prefix: str = "/sd/"):
+        self.prefix = prefix
+        self._sizes = None  # name → size in bytes (None: not known), None until the directory has been read
+        # Counters
+        self.lookups = 0
+        self.scans = 0  # directory reads
+        self.stats_read = 0  # os.stat() calls
+
+    def _table(self) -> dict:
+        if self._sizes is None:
+            sizes = {}
+            try:
+                if hasattr(os, "ilistdir"):
+                    for entry in os.ilistdir(self.prefix):
+                        # entry: (name, type, inode[, size]), type 0x8000: file
+                        sizes[entry[0]] = entry[3] if len(entry) > 3 and entry[1] == 0x8000 else None
+                else:
+                    for name in os.listdir(self.prefix):
+                        sizes[name] = None
+            except OSError as e:
+                print(f"FsCache._table(): ⚠️ unable to read directory: \"{self.prefix}\": {e}")
+            self._sizes = sizes
+            self.scans += 1
+        return self._sizes
+
+    def exists(self, name: str) -> bool:
+        self.lookups += 1
+        return name in self._table()
+
+    # Size of file name in bytes, -1 if it does not exist
+    def size(self, name: str) -> int:
+        self.lookups += 1
+        sizes = self._table()
+        if name not in sizes:
+            return -1
+        if sizes[name] is None:
+            try:
+                sizes[name] = os.stat(self.prefix + name)[6]  # File size in bytes
+                self.stats_read += 1
+            except OSError:
+                del sizes[name]
+                return -1
+        return sizes[name]
+
+    # Sorted names of the files that start with pfx and end with sfx
+    def names(self, pfx: str = "", sfx: str = "") -> list:
+        self.lookups += 1
+        return sorted(n for n in self._table() if n.startswith(pfx) and n.endswith(sfx))
+
+    # File name has been created (or written) by the caller. size: its size, None if not known
+    def created(self, name: str, size: int = None):
+        self._table()[name] = size
+
+    # File name has been written to, its new size: size (None: not known)
+    def resized(self, name: str, size: int = None):
+        sizes = self._table()
+        if name in sizes:
+            sizes[name] = size
+
+    # Forget the size of name, or with name None all: the directory is read again at the next lookup
+    def invalidate(self, name: str = None):
+        if name is None:
+            self._sizes = None
+        else:
+            self.resized(name, None)
+
+    def rename(self, old: str, new: str):
+        os.rename(self.prefix + old, self.prefix + new)
+        sizes = self._table()
+        sizes[new] = sizes.pop(old, None)
+
+    # File name has been removed by the caller
+    def removed(self, name: str):
+        if self._sizes is not None:
+            self._sizes.pop(name, None)
+
+    def remove(self, name: str):
+        os.remove(self.prefix + name)
+        self.removed(name)
+
+    def stats(self) -> str:
+        return "files: {}, lookups: {}, directory reads: {}, stat calls: {}".format(
+            len(self._sizes) if self._sizes is not None else 0, self.lookups, self.scans, self.stats_read)
@@ -0,0 +1,204 @@
+""" Micropython (and CPython) packed encoding of the records of the messages history file """
+# hist_codec.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# Files to be used with:
+# - mqtt_presto_v9c.py (micropython);
+# - Offline_Tools/hist_decode.py (CPython).
+#
+# A history record, like:
+# {"topic": "sensors/Feath/ambient", "topicIdx": 0, "t": 1757271875, "rcvd": "2025-09-07T19:04:35",
+#  "hd": {"ow": "Feath", "de": "Lab", "dc": "BME280", "sc": "meas", "vt": "f", "t": 1757271875},
+#  "payload": {"t": {"u": "C", "mx": 50, "mn": -10, "v": 28.9}, "p": {...}, "a": {...}, "h": {...}}}
+# is about 400 bytes of JSon text, of which only the msgID and four values change from message to message.
+#
+# HistCodec splits a record into:
+# - a template: the record with each changing value (a leaf with a key in DYNAMIC_KEYS)
+#   replaced by a placeholder, an empty list: "v": [];
+# - the values, each as its type code (1 byte) and the value packed with struct, in the order of the sorted keys.
+# The type code is in the record, not in the template: a publisher sends 1006 or 1005.9 for the same value,
+# that would otherwise give a template per combination of int and float values.
+# Each template is stored once, in the meta area of the history ring file (see hist_ring.py).
+# The record is stored as: template id (2 bytes) + values. For the record above: 27 bytes.
+# "t" and "topicIdx" are in the slot header of the ring file, "rcvd" is derived from "t".
+# When the meta area is full, a record is stored as JSon text (REC_JSON).
+#
+# This file contains one class:
+# - HistCodec.
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+import struct
+import time
+
+from hist_ring import REC_JSON, REC_PACKED
+
+DYNAMIC_KEYS = ("t", "v", "raw", "st", "cr")
+TEMPLATE_KEYS = ("topic", "hd", "payload")  # the record keys that are part of the template
+
+# Value type codes
+VT_FLOAT = "f"  # 4 bytes float
+VT_INT   = "i"  # 4 bytes signed integer
+VT_LONG  = "q"  # 8 bytes signed integer
+VT_BOOL  = "b"  # 1 byte
+VT_STR   = "s"  # 2 bytes length + utf-8 text
+VT_JSON  = "j"  # 2 bytes length + JSon text, for a list
+VT_NONE  = "n"  # no bytes
+
+INT32_MIN = -2147483648
+INT32_MAX = 2147483647
+DATETIME_EMPTY = "0000-00-00T00:00:00"
+
+# JSon text of obj with the keys of dicts sorted, so that equal templates give equal texts
+def _canon(obj) -> str:
+    if isinstance(obj, dict):
+        return "{" + ",".join(json.dumps(k) + ":" + _canon(obj[k]) for k in sorted(obj)) + "}"
+    if isinstance(obj, list):
+        return "[" + ",".join(_canon(v) for v in obj) + "]"
+    return json.dumps(obj)
+
+def _value_type(v) -> str:
+    if isinstance(v, bool):
+        return VT_BOOL
+    if isinstance(v, int):
+        return VT_INT if INT32_MIN <= v <= INT32_MAX else VT_LONG
+    if isinstance(v, float):
+        return VT_FLOAT
+    if isinstance(v, str):
+        return VT_STR
+    if v is None:
+        return VT_NONE
+    return VT_JSON
+
+def _pack_value(vt: str, v) -> bytes:
+    if vt == VT_FLOAT:
+        return struct.pack("<f", v)
+    if vt == VT_INT:
+        return struct.pack("<i", v)
+    if vt == VT_LONG:
+        return struct.pack("<q", v)
+    if vt == VT_BOOL:
+        return b"\x01" if v else b"\x00"
+    if vt == VT_NONE:
+        return b""
+    b = (v if vt == VT_STR else json.dumps(v)).encode("utf-8")
+    return struct.pack("<H", len(b)) + b
+
+# Returns (value, new position)
+def _unpack_value(vt: str, data, pos: int):
+    if vt == VT_FLOAT:
+        v = struct.unpack_from("<f", data, pos)[0]
+        return float("{:.6g}".format(v)), pos + 4  # the float as it was sent, not its 32-bit approximation
+    if vt == VT_INT:
+        return struct.unpack_from("<i", data, pos)[0], pos + 4
+    if vt == VT_LONG:
+        return struct.unpack_from("<q", data, pos)[0], pos + 8
+    if vt == VT_BOOL:
+        return data[pos] != 0, pos + 1
+    if vt == VT_NONE:
+        return None, pos
+    n = struct.unpack_from("<H", data, pos)[0]
+    pos += 2
+    text = bytes(data[pos:pos + n]).decode("utf-8")
+    return (text if vt == VT_STR else json.loads(text)), pos + n
+
+# Split obj into template and values (appended to parts)
+def _split(obj: dict, parts: list) -> dict:
+    tpl = {}
+    for k in sorted(obj):
+        v = obj[k]
+        if isinstance(v, dict):
+            tpl[k] = _split(v, parts)
+        elif k in DYNAMIC_KEYS:
+            vt = _value_type(v)
+            tpl[k] = []
+            parts.append(vt.encode() + _pack_value(vt, v))
+        else:
+            tpl[k] = v
+    return tpl
+
+# Fill the template with the values in data. Returns (object, new position)
+def _join(tpl: dict, data, pos: int):
+    obj = {}
+    for k in sorted(tpl):
+        v = tpl[k]
+        if isinstance(v, dict):
+            obj[k], pos = _join(v, data, pos)
+        elif k in DYNAMIC_KEYS and isinstance(v, list):
+            obj[k], pos = _unpack_value(chr(data[pos]), data, pos + 1)
+        else:
+            obj[k] = v
+    return obj, pos
+
+# The "rcvd" field of a record, as made by convert_to_dtStr() in the subscriber script
+def rcvd_str(t: int) -> str:
+    if t <= 0:
+        return ""
+    if t >= INT32_MAX:
+        return DATETIME_EMPTY
+    tm = time.gmtime(t)
+    return "{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}".format(tm[0], tm[1], tm[2], tm[3], tm[4], tm[5])
+
+class HistCodec:
+    def __init__(self, ring):
+        self.ring = ring
+        self._ids = {}   # template text → template id
+        self._tpls = []  # template id → template
+        # Counters
+        self.packed = 0
+        self.unpacked = 0  # records stored as JSon text because the meta area is full
+        self.load()
+
+    def __len__(self):
+        return len(self._tpls)
+
+    # Read the templates from the meta area of the ring file
+    def load(self):
+        self._ids = {}
+        self._tpls = []
+        for entry in self.ring.meta_entries():
+            text = bytes(entry).decode("utf-8")
+            self._ids[text] = len(self._tpls)
+            self._tpls.append(json.loads(text))
+
+    # Returns (record kind, data) for HistRing.append()
+    def encode(self, record: dict):
+        parts = []
+        tpl = _split({k: record[k] for k in TEMPLATE_KEYS if k in record}, parts)
+        text = _canon(tpl)
+        tid = self._ids.get(text)
+        if tid is None:
+            if len(self._tpls) > 0xFFFF or not self.ring.meta_append(text.encode("utf-8")):
+                self.unpacked += 1
+                return REC_JSON, json.dumps(record)
+            tid = len(self._tpls)
+            self._ids[text] = tid
+            self._tpls.append(tpl)
+        self.packed += 1
+        return REC_PACKED, struct.pack("<H", tid) + b"".join(parts)
+
+    # Returns the record as dict, or None if it cannot be decoded
+    def decode(self, kind: int, data, t: int, topic_idx: int):
+        if kind == REC_JSON:
+            try:
+                return json.loads(data)
+            except ValueError:
+                return None
+        if kind != REC_PACKED or len(data) < 2:
+            return None
+        tid = struct.unpack_from("<H", data, 0)[0]
+        if tid >= len(self._tpls):
+            return None
+        record, _ = _join(self._tpls[tid], data, 2)
+        record["t"] = t
+        record["topicIdx"] = topic_idx
+        record["rcvd"] = rcvd_str(t)
+        return record
+
+    def stats(self) -> str:
+        return "templates: {}, packed: {}, stored as JSon: {}, meta area used: {}/{} bytes".format(
+            len(self._tpls), self.packed, self.unpacked, self.ring.meta_used, self.ring.meta_size)
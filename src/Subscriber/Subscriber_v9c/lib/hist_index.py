@@ -0,0 +1,215 @@
+""" Micropython sparse timestamp index and range queries over the messages history file """
+# hist_index.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# The records of the messages history file (see hist_ring.py) are in order of arrival (sequence number),
+# mostly, but not always, in order of their timestamp "t": a stale message (see msg_filter.py) is older.
+# HistIndex keeps, per block of BLOCK records (by sequence number), one entry:
+#   (block number, lowest t, highest t, highest t of this block and all blocks before it).
+# The last field only goes up, so a query finds its first block with a binary search.
+# From there only the blocks of which the lowest..highest t overlaps the query are read from SD,
+# 12 bytes of slot header per record, and the data of the records that match.
+# The index is saved in a sidecar file (default: "/sd/msg_hist.idx") together with the sequence number
+# of the history file. After a restart, the records appended after the last save are added from their
+# slot headers. When the sidecar file is missing or invalid, the index is rebuilt from all slot headers.
+# A record can span a time range, like a block of readings of ts_store.py (slot header t: its lowest t).
+# For such records t_high(slot, slot header) returns the highest t of the record, so the highest t
+# of an entry covers all its records. candidates() gives the sequence numbers to look at for a window.
+#
+# This file contains one class:
+# - HistIndex.
+
+import os
+import struct
+
+IDX_MAGIC = b"MHI1"
+IDX_HDR_FMT = "<4sIHH"  # magic, next sequence number of the history file, block size, number of entries
+IDX_ENTRY_FMT = "<IIII"  # block number, lowest t, highest t, running highest t
+BLOCK = 16
+
+class HistIndex:
+    def __init__(self, ring, path: str = "/sd/msg_hist.idx", block: int = BLOCK, t_high=None):
+        self.ring = ring
+        self.path = path
+        self.block = block
+        self.t_high = t_high  # function(slot, slot header) → highest t of the record, None: the t of the slot header
+        self._entries = []  # [block number, lowest t, highest t, running highest t], oldest block first
+        self._seq = ring.seq  # next sequence number to add
+        # Counters
+        self.queries = 0
+        self.slots_read = 0  # slot headers read by queries
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Add the record with sequence number seq and timestamp t, just appended to the history file.
+    # t_hi: the highest t of a record that spans a time range
+    def add(self, seq: int, t: int, t_hi: int = None):
+        if t_hi is None or t_hi < t:
+            t_hi = t
+        e = self._entries
+        b = seq // self.block
+        if e and e[-1][0] == b:
+            last = e[-1]
+            if t < last[1]:
+                last[1] = t
+            if t_hi > last[2]:
+                last[2] = t_hi
+                if t_hi > last[3]:
+                    last[3] = t_hi
+        else:
+            e.append([b, t, t_hi, max(e[-1][3], t_hi) if e else t_hi])
+        self._seq = seq + 1
+        self._prune()
+
+    # Drop the entries of the blocks of which all records have been overwritten
+    def _prune(self):
+        first = self.ring.first_seq
+        n = 0
+        for entry in self._entries:
+            if (entry[0] + 1) * self.block > first:
+                break
+            n += 1
+        if n > 0:
+            del self._entries[:n]
+
+    # Add the records from sequence number seq on from their slot headers. Returns the number of records added
+    def _add_from(self, seq: int) -> int:
+        ring = self.ring
+        n = 0
+        for s in range(max(seq, ring.first_seq), ring.seq):
+            slot = ring.slot_of(s)
+            hdr = ring.read_slot_header(slot)
+            if hdr is not None and hdr[0] == s and hdr[3] != 0:
+                self.add(s, hdr[1], self.t_high(slot, hdr) if self.t_high is not None else None)
+                n += 1
+        self._seq = ring.seq
+        return n
+
+    def rebuild(self) -> int:
+        self._entries = []
+        return self._add_from(self.ring.first_seq)
+
+    # Read the sidecar file and add the records appended since it was saved.
+    # Returns False if it is missing or invalid (then call rebuild())
+    def load(self) -> bool:
+        try:
+            with open(self.path, "rb") as f:
+                magic, seq, block, n = struct.unpack(IDX_HDR_FMT, f.read(struct.calcsize(IDX_HDR_FMT)))
+                if magic != IDX_MAGIC or block != self.block or seq > self.ring.seq:
+                    return False
+                size = struct.calcsize(IDX_ENTRY_FMT)
+                entries = []
+                for _ in range(n):
+                    entries.append(list(struct.unpack(IDX_ENTRY_FMT, f.read(size))))
+        except (OSError, ValueError):
+            return False
+        self._entries = entries
+        self._prune()
+        self._add_from(seq)
+        return True
+
+    def save(self) -> bool:
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(struct.pack(IDX_HDR_FMT, IDX_MAGIC, self._seq, self.block, len(self._entries)))
+                for entry in self._entries:
+                    f.write(struct.pack(IDX_ENTRY_FMT, *entry))
+            os.rename(tmp, self.path)  # the sidecar file is replaced in one step
+        except OSError:
+            return False
+        return True
+
+    # Generator of the records in the blocks of entries[i] for i in idxs that match topic_idx and t0 <= t <= t1,
+    # as tuples (seq, t, topic_idx, kind, data)
+    def _scan(self, idxs, t0: int, t1: int, topic_idx=None, newest_first: bool = False):
+        ring = self.ring
+        for i in idxs:
+            b, bmin, bmax, _ = self._entries[i]
+            if bmax < t0 or bmin > t1:
+                continue  # no record of this block in the window
+            first = max(b * self.block, ring.first_seq)
+            last = min((b + 1) * self.block, ring.seq)
+            seqs = range(last - 1, first - 1, -1) if newest_first else range(first, last)
+            for seq in seqs:
+                slot = ring.slot_of(seq)
+                hdr = ring.read_slot_header(slot)
+                self.slots_read += 1
+                if hdr is None or hdr[0] != seq or hdr[3] == 0:
+                    continue
+                if t0 <= hdr[1] <= t1 and (topic_idx is None or hdr[2] == topic_idx):
+                    rec = ring.read_slot(slot)
+                    if rec is not None:
+                        yield rec
+
+    # Index of the first entry of which the running highest t is >= t
+    def _bisect(self, t: int) -> int:
+        e = self._entries
+        lo, hi = 0, len(e)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if e[mid][3] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # Generator of the sequence numbers of the records in the blocks that can have a record with t0 <= t <= t1,
+    # in order of arrival. Nothing is read from SD
+    def candidates(self, t0: int, t1: int):
+        self.queries += 1
+        ring = self.ring
+        for i in range(self._bisect(t0), len(self._entries)):
+            b, bmin, bmax, _ = self._entries[i]
+            if bmax < t0 or bmin > t1:
+                continue
+            yield from range(max(b * self.block, ring.first_seq), min((b + 1) * self.block, ring.seq))
+
+    # Generator of the records of topic_idx (None: all topics) with t0 <= t <= t1, in order of arrival,
+    # as tuples (seq, t, topic_idx, kind, data)
+    def range(self, t0: int, t1: int, topic_idx=None):
+        self.queries += 1
+        # A record in a block before the first one found has t <= its running highest t < t0
+        yield from self._scan(range(self._bisect(t0), len(self._entries)), t0, t1, topic_idx)
+
+    # Generator of the n most recent records of topic_idx (None: all topics), newest first
+    def latest(self, n: int, topic_idx=None):
+        self.queries += 1
+        if n <= 0:
+            return
+        for rec in self._scan(range(len(self._entries) - 1, -1, -1), 0, 0xFFFFFFFF, topic_idx, True):
+            yield rec
+            n -= 1
+            if n == 0:
+                return
+
+    # Returns the record of topic_idx (None: all topics) with the highest t <= t, e.g.: the temperature at 03:00,
+    # as tuple (seq, t, topic_idx, kind, data), or None
+    def at(self, t: int, topic_idx=None):
+        self.queries += 1
+        e = self._entries
+        best = None
+        i = self._bisect(t)
+        # From the first block with a running highest t >= t on, only blocks with stale records can match
+        for rec in self._scan(range(i, len(e)), 0, t, topic_idx):
+            if best is None or rec[1] > best[1]:
+                best = rec
+        i -= 1
+        while i >= 0:
+            if best is not None and best[1] >= e[i][3]:
+                break  # no record in this block or before it has a higher t
+            for rec in self._scan((i,), 0, t, topic_idx):
+                if best is None or rec[1] > best[1]:
+                    best = rec
+            i -= 1
+        return best
+
+    def stats(self) -> str:
+        return "blocks: {} of {} records, queries: {}, slot headers read: {}".format(
+            len(self._entries), self.block, self.queries, self.slots_read)
@@ -0,0 +1,481 @@
+""" Micropython fixed-slot ring buffer file for the messages history """
+# hist_ring.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# The messages history is kept in a file of fixed size, created (preallocated) once.
+# Each record takes one slot. When all slots are used, the oldest record is overwritten.
+# An append writes one slot and the header: no rewrite of the file is ever needed
+# to keep it within its size, and the size of the file on SD does not change.
+#
+# File layout:
+# - header, HDR_SIZE bytes, see HDR_FMT:
+#     magic, version, slot size, capacity (slots), size and used bytes of the meta area,
+#     head (index of the next slot to write), count (records in the file), seq (sequence number of the next record);
+# - meta area of meta_size bytes, for file level data. 0 bytes: no meta area.
+#     A list of entries, each: length (2 bytes) + data. meta_used bytes are in use;
+# - capacity slots of slot_size bytes. A slot starts with a slot header, see SLOT_FMT:
+#     sequence number, timestamp (uxTime), topic index, record kind, length of the data.
+#
+# Group commit: appended records are collected in a RAM buffer of group_bytes (whole slots).
+# The buffer is written in one write, followed by the header and one flush, when it is full,
+# when the next slot wraps around to slot 0, or when commit() is called.
+# With group_bytes 0 every append writes its slot and the header.
+# read_slot() and read_slot_header() take a slot still in the buffer from the buffer,
+# so lookups (hist_index.py, rollup.py, ts_store.py) do not write it.
+#
+# After a power loss between the write of slots and the write of the header,
+# open() finds these records by their sequence numbers and takes them in.
+# Records still in the RAM buffer are lost.
+#
+# The rewrites of the file are streamed, one slot (or one group of slots) in RAM at a time,
+# and can be resumed after a reboot:
+# - a file with another geometry is copied into "<path>.tmp", which replaces the file with one os.rename().
+#   Records keep their sequence numbers, so an interrupted copy continues after the last record in "<path>.tmp";
+# - the import of a JSon lines file saves its progress (byte offset, sequence number) in a progress file
+#   after each group of records. An interrupted import drops the records after the last saved progress
+#   (see rewind()) and continues at the saved byte offset.
+#
+# This file contains one class:
+# - HistRing.
+
+import os
+import struct
+try:
+    import ujson
+except ImportError:
+    import json as ujson  # CPython, see Offline_Tools/hist_decode.py
+
+MAGIC = b"MHR1"
+VERSION = 1
+HDR_FMT = "<4sBBHIIIIII"
+HDR_SIZE = struct.calcsize(HDR_FMT)    # 32 bytes
+SLOT_FMT = "<IIBBH"
+SLOT_HDR_SIZE = struct.calcsize(SLOT_FMT)  # 12 bytes
+
+# Record kinds
+REC_NONE = 0  # empty slot
+REC_JSON = 1  # the record as JSon text
+REC_PACKED = 2  # the record packed with struct, see hist_codec.py
+REC_ROLLUP = 3  # aggregates of a bucket of sensor readings, see rollup.py
+REC_TS_BLOCK = 4  # a block of sensor readings, stored by column, see ts_store.py
+
+TOPIC_NONE = 255  # topic index of a record without topic
+
+class HistRing:
+    def __init__(self, path: str, slot_size: int = 512, capacity: int = 180, meta_size: int = 0,
+                 group_bytes: int = 0):
+        if slot_size <= SLOT_HDR_SIZE:
+            raise ValueError("slot_size must be larger than {}".format(SLOT_HDR_SIZE))
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.path = path
+        self.slot_size = slot_size
+        self.capacity = capacity
+        self.meta_size = meta_size
+        self.meta_used = 0
+        self.head = 0
+        self.count = 0
+        self.seq = 1
+        self._f = None
+        self._ro = False  # opened by open_readonly()
+        self.group_slots = max(1, min(group_bytes // slot_size, capacity))
+        self._buf = bytearray(slot_size * self.group_slots)  # group commit buffer
+        self._mv = memoryview(self._buf)
+        self._rbuf = bytearray(slot_size)  # to read a slot
+        self._rmv = memoryview(self._rbuf)
+        self._pend = 0       # number of slots in the buffer, not yet written
+        self._pend_slot = 0  # slot of the first of them
+        # Counters
+        self.appended = 0
+        self.too_large = 0
+        self.commits = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def max_data(self) -> int:
+        return self.slot_size - SLOT_HDR_SIZE
+
+    # Number of appended records not yet written to the file
+    @property
+    def pending(self) -> int:
+        return self._pend
+
+    # Sequence number of the oldest record in the file
+    @property
+    def first_seq(self) -> int:
+        return self.seq - self.count
+
+    def _slot_pos(self, slot: int) -> int:
+        return HDR_SIZE + self.meta_size + slot * self.slot_size
+
+    def _write_header(self):
+        f = self._f
+        f.seek(0)
+        f.write(struct.pack(HDR_FMT, MAGIC, VERSION, 0, self.slot_size, self.capacity,
+                            self.meta_size, self.meta_used, self.head, self.count, self.seq))
+
+    # Read the header of the file. Returns the header fields as a tuple, or None if it is not a history ring file
+    @staticmethod
+    def read_header(path: str):
+        try:
+            with open(path, "rb") as f:
+                hdr = f.read(HDR_SIZE)
+        except OSError:
+            return None
+        if len(hdr) < HDR_SIZE:
+            return None
+        fields = struct.unpack(HDR_FMT, hdr)
+        if fields[0] != MAGIC or fields[1] != VERSION:
+            return None
+        return fields
+
+    # Create the file with all slots empty
+    def _create(self, path: str):
+        with open(path, "wb") as f:
+            f.write(struct.pack(HDR_FMT, MAGIC, VERSION, 0, self.slot_size, self.capacity,
+                                self.meta_size, 0, 0, 0, 1))
+            zeros = bytearray(self.slot_size)
+            n = self.meta_size
+            while n > 0:
+                k = min(n, self.slot_size)
+                f.write(zeros[:k])
+                n -= k
+            for _ in range(self.capacity):
+                f.write(zeros)
+
+    # Open the file. Creates it when missing. A file with another slot size, capacity or
+    # meta area size is converted: the newest records are copied into a new file.
+    # If the meta area of the file does not fit in the new meta area size, the file keeps its geometry.
+    # Returns True if an existing file has been opened or converted
+    def open(self) -> bool:
+        fields = self.read_header(self.path)
+        if fields is None:
+            self._create(self.path)
+            ret = False
+        else:
+            ret = True
+            if fields[3] != self.slot_size or fields[4] != self.capacity or fields[5] != self.meta_size:
+                try:
+                    self._convert(fields)
+                except ValueError as e:
+                    print(f"HistRing.open(): ⚠️ {e}. Keeping the slot size, capacity and meta area size of the file")
+                    self._use_geometry(fields, self.group_slots * self.slot_size)
+        self._f = open(self.path, "r+b")
+        self._load_header()
+        return ret
+
+    # Take the slot size, capacity and meta area size from the header fields of the file
+    def _use_geometry(self, fields, group_bytes: int = 0):
+        self.slot_size, self.capacity, self.meta_size = fields[3], fields[4], fields[5]
+        self.group_slots = max(1, min(group_bytes // self.slot_size, self.capacity))
+        self._buf = bytearray(self.slot_size * self.group_slots)
+        self._mv = memoryview(self._buf)
+        self._rbuf = bytearray(self.slot_size)
+        self._rmv = memoryview(self._rbuf)
+
+    # Open an existing file read-only, with the geometry from its header, e.g.: a copy on a PC.
+    # A slot written after the last header update is not taken in. Returns False if it is not a history ring file
+    def open_readonly(self) -> bool:
+        fields = self.read_header(self.path)
+        if fields is None:
+            return False
+        self._use_geometry(fields)
+        self.meta_used, self.head, self.count, self.seq = fields[6], fields[7], fields[8], fields[9]
+        self._f = open(self.path, "rb")
+        self._ro = True
+        return True
+
+    def _load_header(self):
+        f = self._f
+        f.seek(0)
+        fields = struct.unpack(HDR_FMT, f.read(HDR_SIZE))
+        self.meta_used, self.head, self.count, self.seq = fields[6], fields[7], fields[8], fields[9]
+        # Slots written after the last header update?
+        found = 0
+        while found < self.capacity:
+            hdr = self._read_slot_header(self.head)
+            if hdr is None or hdr[0] != self.seq or hdr[3] == REC_NONE:
+                break
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.seq += 1
+            found += 1
+        if found > 0:
+            self._write_header()
+            f.flush()
+
+    def _read_slot_header(self, slot: int):
+        f = self._f
+        f.seek(self._slot_pos(slot))
+        b = f.read(SLOT_HDR_SIZE)
+        if len(b) < SLOT_HDR_SIZE:
+            return None
+        return struct.unpack(SLOT_FMT, b)
+
+    # True if path is a (partial) copy of old made by _convert() for this geometry, to continue with
+    def _can_resume(self, path: str, old, first: int) -> bool:
+        fields = self.read_header(path)
+        if fields is None or fields[3] != self.slot_size or fields[4] != self.capacity or fields[5] != self.meta_size:
+            return False
+        if fields[6] != old.meta_used or not first <= fields[9] <= old.seq:
+            return False  # meta area not copied yet, or a copy of other records
+        try:
+            return os.stat(path)[6] == self._slot_pos(self.capacity)  # created completely
+        except OSError:
+            return False
+
+    # Position in the group commit buffer of a slot not yet written, or -1
+    def _pending_pos(self, slot: int) -> int:
+        i = slot - self._pend_slot
+        if 0 <= i < self._pend:
+            return i * self.slot_size
+        return -1
+
+    # Returns the slot header of a slot as tuple (seq, t, topic_idx, kind, length), or None.
+    # A slot not yet written is read from the group commit buffer
+    def read_slot_header(self, slot: int):
+        pos = self._pending_pos(slot)
+        if pos >= 0:
+            return struct.unpack_from(SLOT_FMT, self._buf, pos)
+        return self._read_slot_header(slot)
+
+    # Returns the slot of the record with sequence number seq, or -1 if it is not in the file
+    def slot_of(self, seq: int) -> int:
+        if not self.seq - self.count <= seq < self.seq:
+            return -1
+        return (self.head - (self.seq - seq)) % self.capacity
+
+    # Copy the newest records of an existing file with another geometry into a new file
+    def _convert(self, fields):
+        tmp = self.path + ".tmp"
+        old = HistRing(self.path, fields[3], fields[4], fields[5])
+        old.meta_used, old.head, old.count, old.seq = fields[6], fields[7], fields[8], fields[9]
+        old._f = open(self.path, "rb")
+        old._ro = True
+        first = old.seq - min(old.count, self.capacity)  # sequence number of the first record to copy
+        if self._can_resume(tmp, old, first):
+            self._f = open(tmp, "r+b")
+            self._load_header()  # takes in the slots copied after the last header update
+        else:
+            self._create(tmp)
+            self._f = open(tmp, "r+b")
+            self.meta_used = 0
+            for entry in old.meta_entries():
+                if not self.meta_append(entry, False):
+                    self._f.close()
+                    self._f = None
+                    old.close()
+                    os.remove(tmp)
+                    raise ValueError("the meta area of {} does not fit in {} bytes".format(self.path, self.meta_size))
+            self.head, self.count, self.seq = 0, 0, first
+            self.commit()  # from here on the copy can be resumed
+        for seq, t, topic_idx, kind, data in old.records():
+            if seq < self.seq:
+                continue  # not to copy, or already copied
+            self.seq = seq  # keep the sequence number of the record
+            self.append(kind, data, t, topic_idx, False)
+        self.seq = old.seq
+        self.commit()
+        self._f.close()
+        self._f = None
+        old.close()
+        os.rename(tmp, self.path)
+
+    def close(self):
+        if self._f is not None:
+            if not self._ro:
+                self.commit()
+            self._f.close()
+            self._f = None
+
+    # Write the slots in the buffer, in one write
+    def _write_pending(self):
+        if self._pend > 0:
+            f = self._f
+            f.seek(self._slot_pos(self._pend_slot))
+            f.write(self._mv[:self._pend * self.slot_size])
+            self._pend = 0
+
+    # Write the buffered records and the header, and flush the file
+    def commit(self):
+        if self._f is not None:
+            self._write_pending()
+            self._write_header()
+            self._f.flush()
+            self.commits += 1
+
+    def flush(self):
+        self.commit()
+
+    # Append an entry to the meta area. Returns False if it does not fit
+    def meta_append(self, data, sync: bool = True) -> bool:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        n = len(data)
+        if n > 0xFFFF or self.meta_used + 2 + n > self.meta_size:
+            return False
+        f = self._f
+        f.seek(HDR_SIZE + self.meta_used)
+        f.write(struct.pack("<H", n))
+        f.write(data)
+        self.meta_used += 2 + n
+        if sync:
+            self.commit()  # the header must not count slots still in the buffer
+        return True
+
+    # Generator of the entries of the meta area, as bytes
+    def meta_entries(self):
+        f = self._f
+        pos = 0
+        while pos + 2 <= self.meta_used:
+            f.seek(HDR_SIZE + pos)
+            n = struct.unpack("<H", f.read(2))[0]
+            if pos + 2 + n > self.meta_used:
+                break
+            yield f.read(n)
+            pos += 2 + n
+
+    # Append a record. data is bytes or str. Returns its sequence number, or -1 if it does not fit in a slot.
+    # The record is written when the buffer is full, then also the header if sync is True
+    def append(self, kind: int, data, t: int = 0, topic_idx: int = TOPIC_NONE, sync: bool = True) -> int:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        n = len(data)
+        if n > self.max_data:
+            self.too_large += 1
+            return -1
+        if self._pend == 0:
+            self._pend_slot = self.head
+        pos = self._pend * self.slot_size
+        struct.pack_into(SLOT_FMT, self._buf, pos, self.seq, t, topic_idx & 0xFF, kind, n)
+        self._buf[pos + SLOT_HDR_SIZE:pos + SLOT_HDR_SIZE + n] = data
+        self._pend += 1
+        seq = self.seq
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        self.seq += 1
+        self.appended += 1
+        if self._pend == self.group_slots or self.head == 0: # buffer full, or the next slot is not adjacent
+            if sync:
+                self.commit()
+            else:
+                self._write_pending()
+        return seq
+
+    # Drop the newest records, from sequence number seq on. Returns the number of records dropped
+    def rewind(self, seq: int) -> int:
+        self._write_pending()
+        n = min(self.seq - seq, self.count)
+        if n <= 0:
+            return 0
+        self.head = (self.head - n) % self.capacity
+        self.count -= n
+        self.seq -= n
+        f = self._f
+        f.seek(self._slot_pos(self.head))
+        f.write(bytes(SLOT_HDR_SIZE))  # or open() would take the dropped records in again
+        self._write_header()
+        f.flush()
+        return n
+
+    # Returns the saved progress of import_json_lines() as tuple (byte offset, sequence number), or None
+    @staticmethod
+    def _read_progress(path: str):
+        try:
+            with open(path, "r") as f:
+                offset, seq = f.read().split()
+            return int(offset), int(seq)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_progress(path: str, offset: int, seq: int):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("{} {}\n".format(offset, seq))
+        os.rename(tmp, path)  # the progress file is replaced in one step
+
+    # Append the records of a JSon lines history file (msg_hist.json of the versions before this file),
+    # one line at a time. With progress_path an interrupted import continues where it was.
+    # Returns the number of records appended
+    def import_json_lines(self, path: str, progress_path: str = None, checkpoint: int = 32) -> int:
+        offset = 0
+        if progress_path is not None:
+            progress = self._read_progress(progress_path)
+            if progress is not None:
+                offset = progress[0]
+                self.rewind(progress[1])
+        n = 0
+        since = 0  # records appended since the last saved progress
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                offset += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = ujson.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                t = record.get("t", 0)
+                idx = record.get("topicIdx", TOPIC_NONE)
+                if self.append(REC_JSON, line, t if isinstance(t, int) and t > 0 else 0,
+                               idx if isinstance(idx, int) else TOPIC_NONE) > 0:
+                    n += 1
+                    since += 1
+                if progress_path is not None and self._pend == 0 and since >= checkpoint:
+                    self._save_progress(progress_path, offset, self.seq)  # the records up to here are committed
+                    since = 0
+        self.commit()
+        if progress_path is not None:
+            self._save_progress(progress_path, offset, self.seq)
+        return n
+
+    # Generator of the records, oldest first (or newest first), as tuples: (seq, t, topic_idx, kind, data)
+    def records(self, newest_first: bool = False):
+        cap = self.capacity
+        first = (self.head - self.count) % cap
+        for i in range(self.count):
+            slot = (self.head - 1 - i) % cap if newest_first else (first + i) % cap
+            rec = self.read_slot(slot)
+            if rec is not None:
+                yield rec
+
+    # Returns the record in a slot as tuple (seq, t, topic_idx, kind, data), or None if the slot is empty.
+    # A slot not yet written is read from the group commit buffer: a lookup does not write the buffer
+    def read_slot(self, slot: int):
+        pos = self._pending_pos(slot)
+        if pos >= 0:
+            buf, mv, n = self._buf, self._mv, self.slot_size
+        else:
+            pos = 0
+            buf, mv = self._rbuf, self._rmv
+            f = self._f
+            f.seek(self._slot_pos(slot))
+            n = f.readinto(mv)
+            if n is None or n < SLOT_HDR_SIZE:
+                return None
+        seq, t, topic_idx, kind, ln = struct.unpack_from(SLOT_FMT, buf, pos)
+        if kind == REC_NONE or ln > n - SLOT_HDR_SIZE:
+            return None
+        pos += SLOT_HDR_SIZE
+        return seq, t, topic_idx, kind, bytes(mv[pos:pos + ln])
+
+    def stats(self) -> str:
+        return "records: {}/{}, slot: {} bytes, meta area: {}/{} bytes, file: {} bytes, next seq: {}, appended: {}, too large: {}, commits: {} (group of {} slots), pending: {}".format(
+            self.count, self.capacity, self.slot_size, self.meta_used, self.meta_size, self._slot_pos(self.capacity),
+            self.seq, self.appended, self.too_large, self.commits, self.group_slots, self._pend)
@@ -0,0 +1,128 @@
+""" Micropython selective JSon decoding from a receive buffer """
+# json_scan.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# loads_sections() walks over the top level of a JSon object in a buffer
+# (bytes, bytearray or memoryview), without decoding it to a str first.
+# Only the values of the requested keys are given to ujson.loads(),
+# each as a memoryview slice of the buffer, so no copy of the message is made.
+# Other top level values are skipped.
+#
+# Example: loads_sections(b'{"hd": {"t": 1}, "xyz": [1, 2], "reads": {}}', compile_keys(("hd", "reads")))
+# returns: {"hd": {"t": 1}, "reads": {}}
+
+try:
+    from ujson import loads
+except ImportError:
+    from json import loads
+
+_QUOTE  = 0x22  # "
+_BSLASH = 0x5C  # \
+_COMMA  = 0x2C  # ,
+_COLON  = 0x3A  # :
+_OBJ_OPEN   = 0x7B  # {
+_OBJ_CLOSE  = 0x7D  # }
+_LIST_OPEN  = 0x5B  # [
+_LIST_CLOSE = 0x5D  # ]
+_WS = (0x20, 0x09, 0x0A, 0x0D)
+_END_OF_SCALAR = (_COMMA, _OBJ_CLOSE, _LIST_CLOSE, 0x20, 0x09, 0x0A, 0x0D)
+
+# Returns the keys as tuple of (key as bytes, key as str) pairs, ready for loads_sections()
+def compile_keys(keys) -> tuple:
+    return tuple((k.encode("utf-8"), k) for k in keys)
+
+def _skip_ws(buf, i: int, n: int) -> int:
+    while i < n and buf[i] in _WS:
+        i += 1
+    return i
+
+# i is the index of the opening quote. Returns the index after the closing quote
+def _skip_str(buf, i: int, n: int) -> int:
+    i += 1
+    while i < n:
+        c = buf[i]
+        if c == _QUOTE:
+            return i + 1
+        i += 2 if c == _BSLASH else 1
+    raise ValueError("unterminated string")
+
+# i is the index of the first byte of the value. Returns the index after the value
+def _skip_value(buf, i: int, n: int) -> int:
+    c = buf[i]
+    if c == _QUOTE:
+        return _skip_str(buf, i, n)
+    if c == _OBJ_OPEN or c == _LIST_OPEN:
+        depth = 0
+        while i < n:
+            c = buf[i]
+            if c == _QUOTE:
+                i = _skip_str(buf, i, n)
+                continue
+            if c == _OBJ_OPEN or c == _LIST_OPEN:
+                depth += 1
+            elif c == _OBJ_CLOSE or c == _LIST_CLOSE:
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+        raise ValueError("unterminated object")
+    while i < n and buf[i] not in _END_OF_SCALAR:  # number, true, false or null
+        i += 1
+    return i
+
+# Returns the str key of the pair in keys that equals buf[start:end], or None
+def _find_key(buf, start: int, end: int, keys):
+    ln = end - start
+    for kb, ks in keys:
+        if len(kb) == ln:
+            j = 0
+            while j < ln and buf[start + j] == kb[j]:
+                j += 1
+            if j == ln:
+                return ks
+    return None
+
+# Returns a dict with the decoded values of the requested top level keys.
+# Returns None if the buffer does not hold a JSon object (e.g. the integer payload of a $SYS topic).
+# Raises ValueError on a malformed object.
+def loads_sections(buf, keys, n: int = -1):
+    mv = memoryview(buf)
+    if n < 0:
+        n = len(mv)
+    i = _skip_ws(mv, 0, n)
+    if i >= n or mv[i] != _OBJ_OPEN:
+        return None
+    result = {}
+    i = _skip_ws(mv, i + 1, n)
+    if i < n and mv[i] == _OBJ_CLOSE:
+        return result
+    while i < n:
+        if mv[i] != _QUOTE:
+            raise ValueError("key expected at: {}".format(i))
+        k_start = i + 1
+        i = _skip_str(mv, i, n)
+        k_end = i - 1
+        i = _skip_ws(mv, i, n)
+        if i >= n or mv[i] != _COLON:
+            raise ValueError("':' expected at: {}".format(i))
+        i = _skip_ws(mv, i + 1, n)
+        if i >= n:
+            break
+        v_start = i
+        i = _skip_value(mv, i, n)
+        key = _find_key(mv, k_start, k_end, keys)
+        if key is not None:
+            result[key] = loads(mv[v_start:i])
+        i = _skip_ws(mv, i, n)
+        if i < n and mv[i] == _COMMA:
+            i = _skip_ws(mv, i + 1, n)
+        elif i < n and mv[i] == _OBJ_CLOSE:
+            return result
+        else:
+            break
+    raise ValueError("unterminated object")
@@ -0,0 +1,123 @@
+""" Micropython streaming compression of closed log files with the deflate module """
+# log_deflate.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# The log files repeat the same few texts ("Connected to MQTT broker: ...", "Subscribed to topic: ...").
+# After a rotation (see log_ring.py) LogDeflate compresses the closed log file "mqtt_log_NN.txt"
+# into "mqtt_log_NN.txt.gz" (gzip format, read on a PC with gzip, zcat or src/Offline_Tools/presto_logs.py)
+# and removes the text file. The main script calls step() from a task: each call reads one chunk
+# of chunk bytes and writes it through a deflate.DeflateIO stream with a window of 2^wbits bytes,
+# so neither the file nor a large window is ever in RAM, and the other tasks run between the chunks.
+# The compressed file is written as "<name>.gz.tmp" and renamed when it is complete.
+# Compression needs a MicroPython firmware with the deflate module built with compression support
+# (MICROPY_PY_DEFLATE_COMPRESS). Without it, available is False and the log files stay uncompressed.
+#
+# This file contains one class:
+# - LogDeflate.
+
+import os
+try:
+    import deflate
+except ImportError:
+    deflate = None
+
+class LogDeflate:
+    def __init__(self, prefix: str = "/sd/", wbits: int = 10, chunk: int = 512):
+        self.prefix = prefix
+        self.wbits = wbits
+        self._buf = bytearray(chunk)
+        self._queue = []  # names of the log files to compress
+        self._name = None  # the log file being compressed
+        self._src = None
+        self._dst = None
+        self._z = None
+        self.last_size = 0  # size of the last compressed file
+        # Counters
+        self.files = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        return deflate is not None and hasattr(deflate, "DeflateIO") and hasattr(deflate, "GZIP")
+
+    # Number of log files to compress, including the one being compressed
+    @property
+    def pending(self) -> int:
+        return len(self._queue) + (1 if self._name is not None else 0)
+
+    def queue(self, name: str):
+        if self.available and name != self._name and name not in self._queue:
+            self._queue.append(name)
+
+    # Stop compressing the log file name, e.g.: its slot is used again
+    def cancel(self, name: str):
+        if name in self._queue:
+            self._queue.remove(name)
+        if name == self._name:
+            self._close()
+            try:
+                os.remove(self.prefix + name + ".gz.tmp")
+            except OSError:
+                pass
+
+    def _close(self):
+        for f in (self._z, self._dst, self._src):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._z = self._dst = self._src = None
+        self._name = None
+
+    def _start(self, name: str) -> bool:
+        try:
+            self._src = open(self.prefix + name, "rb")
+            self._dst = open(self.prefix + name + ".gz.tmp", "wb")
+            self._z = deflate.DeflateIO(self._dst, deflate.GZIP, self.wbits)
+        except (OSError, ValueError) as e:
+            print(f"LogDeflate._start(): ⚠️ unable to compress \"{name}\": {e}")
+            self.errors += 1
+            self._close()
+            return False
+        self._name = name
+        return True
+
+    # Compress the next chunk. Returns the name of the log file when it has been compressed
+    # (and "<name>.gz" written and "<name>" removed), otherwise None
+    def step(self):
+        if self._name is None:
+            if not self._queue or not self._start(self._queue.pop(0)):
+                return None
+        name = self._name
+        try:
+            n = self._src.readinto(self._buf)
+            if n:
+                self._z.write(memoryview(self._buf)[:n])
+                self.bytes_in += n
+                return None
+            self._z.close()  # writes the end of the gzip stream; the file is closed by _close()
+            self._z = None
+            self.last_size = self._dst.tell()
+            self._close()
+            os.rename(self.prefix + name + ".gz.tmp", self.prefix + name + ".gz")
+            os.remove(self.prefix + name)
+        except OSError as e:
+            print(f"LogDeflate.step(): ⚠️ error while compressing \"{name}\": {e}")
+            self.errors += 1
+            self._close()
+            return None
+        self.files += 1
+        self.bytes_out += self.last_size
+        return name
+
+    def stats(self) -> str:
+        return "available: {}, files compressed: {}, bytes in: {}, out: {}, pending: {}, errors: {}".format(
+            self.available, self.files, self.bytes_in, self.bytes_out, self.pending, self.errors)
@@ -0,0 +1,123 @@
+""" Micropython numbered ring of log files with a fixed number of slots """
+# log_ring.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# Each log rotation created a new file "mqtt_log_<timestamp>.txt", so the number of log files on SD
+# grew with the uptime, and the name of the active one was kept in "mqtt_latest_log_fn.txt",
+# that had to be read and checked against a listing of the directory at every start.
+# LogRing uses a fixed number of log files, the slots: "mqtt_log_00.txt" .. "mqtt_log_<slots - 1>.txt".
+# A rotation moves to the next slot and starts it again (the oldest log is overwritten).
+# The active slot is kept in a header file of 12 bytes (default: "/sd/mqtt_log_ring.bin"),
+# read at startup instead of listing the directory.
+# The first line of every slot has its generation (the number of rotations so far):
+#   "---Log created on: 2026-10-18T10:00:00--- #17"
+# When the header file is missing or invalid, or the number of slots has been changed,
+# the active slot is found by reading the first line of each slot.
+#
+# This file contains one class:
+# - LogRing.
+
+import os
+import struct
+
+RING_MAGIC = b"MLR1"
+RING_FMT = "<4sHHI"  # magic, number of slots, active slot, generation of the active slot
+LOG_NAME_FMT = "mqtt_log_{:02d}.txt"
+
+class LogRing:
+    def __init__(self, prefix: str = "/sd/", slots: int = 8, header_fn: str = "mqtt_log_ring.bin"):
+        self.prefix = prefix
+        self.slots = max(2, slots)
+        self.header_path = prefix + header_fn
+        self.active = 0  # active slot
+        self.gen = 0     # generation of the active slot, 0: no slot used yet
+        # Counters
+        self.rotations = 0
+        self.recovered = False  # the active slot was found by reading the slots
+
+    def name(self, slot: int = None) -> str:
+        return LOG_NAME_FMT.format(self.active if slot is None else slot)
+
+    @property
+    def path(self) -> str:
+        return self.prefix + self.name()
+
+    # Read the header file. If it is missing or invalid, find the active slot from the slots.
+    # Returns False if no slot has been used yet (then call rotate())
+    def load(self) -> bool:
+        try:
+            with open(self.header_path, "rb") as f:
+                magic, slots, active, gen = struct.unpack(RING_FMT, f.read(struct.calcsize(RING_FMT)))
+            if magic == RING_MAGIC and slots == self.slots and active < slots and gen > 0:
+                self.active = active
+                self.gen = gen
+                return True
+        except (OSError, ValueError):
+            pass
+        return self.recover()
+
+    # Generation in the first line of a slot, 0 if the slot does not exist or has no generation
+    def slot_gen(self, slot: int) -> int:
+        try:
+            with open(self.prefix + self.name(slot), "r") as f:
+                line = f.readline()
+        except OSError:
+            return 0
+        i = line.rfind("#")
+        if i < 0:
+            return 0
+        try:
+            return int(line[i + 1:].strip())
+        except ValueError:
+            return 0
+
+    # Find the active slot: the one with the highest generation. Saves the header file
+    def recover(self) -> bool:
+        self.recovered = True
+        self.active = 0
+        self.gen = 0
+        for slot in range(self.slots):
+            gen = self.slot_gen(slot)
+            if gen > self.gen:
+                self.active = slot
+                self.gen = gen
+        if self.gen == 0:
+            return False
+        self.save()
+        return True
+
+    def save(self) -> bool:
+        tmp = self.header_path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(struct.pack(RING_FMT, RING_MAGIC, self.slots, self.active, self.gen))
+            os.rename(tmp, self.header_path)  # the header file is replaced in one step
+        except OSError:
+            return False
+        return True
+
+    # Move to the next slot and start it with its first line: "---Log created on: <ts>--- #<generation>".
+    # Returns the size of the slot in bytes, -1 on error
+    def rotate(self, ts: str) -> int:
+        if self.gen > 0:
+            self.active = (self.active + 1) % self.slots
+        self.gen += 1
+        line = "---Log created on: {}--- #{}\n".format(ts, self.gen)
+        try:
+            with open(self.path, "w") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"LogRing.rotate(): ⚠️ unable to create the log file: \"{self.path}\": {e}")
+            return -1
+        self.save()
+        self.rotations += 1
+        return len(line)
+
+    def stats(self) -> str:
+        return "slots: {}, active: \"{}\", generation: {}, rotations: {}{}".format(
+            self.slots, self.name(), self.gen, self.rotations, ", recovered from the slots" if self.recovered else "")
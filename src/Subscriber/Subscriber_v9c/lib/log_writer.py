@@ -0,0 +1,103 @@
+""" Micropython buffered log writer with a persistent file handle """
+# log_writer.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# add_to_log() did, for every line: os.stat() of the log file (for its size), os.listdir("/sd/") (ck_log()),
+# open in append mode, write and close. Four FAT operations per line, in the task that handles the MQTT messages.
+# LogWriter keeps the log file open, knows its size in RAM (one os.stat() when the file is opened)
+# and collects the lines in a buffer of buf_size bytes (default: 512, one SD sector).
+# The buffer is written to the file when it is full, by flush() (called by the main script on a timer),
+# and by close() (at a log rotation and at exit).
+# size includes the lines in the buffer, so the main script can check the maximum log size without os.stat().
+#
+# This file contains one class:
+# - LogWriter.
+
+import os
+import time
+
+class LogWriter:
+    def __init__(self, buf_size: int = 512):
+        self.buf_size = buf_size
+        self.path = None
+        self.size = 0       # size of the log file in bytes, including the buffer
+        self._f = None
+        self._buf = bytearray()
+        self._t = 0         # ticks_ms when the oldest line in the buffer was added
+        # Counters
+        self.lines = 0
+        self.writes = 0     # writes to the file
+        self.errors = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._buf)
+
+    # Open the log file at path for appending (and close the one open). Returns False if it does not exist
+    def open(self, path: str) -> bool:
+        if self._f is not None and path == self.path:
+            return True
+        self.close()
+        try:
+            self.size = os.stat(path)[6]  # File size in bytes
+            self._f = open(path, "ab")
+        except OSError as e:
+            print(f"LogWriter.open(): ⚠️ unable to open the log file: \"{path}\": {e}")
+            self.errors += 1
+            return False
+        self.path = path
+        return True
+
+    # Add text to the buffer. Writes the buffer when it is full
+    def write(self, txt: str) -> bool:
+        if self._f is None:
+            return False
+        if len(self._buf) == 0:
+            self._t = time.ticks_ms()
+        data = txt.encode("utf-8")
+        self._buf.extend(data)
+        self.size += len(data)
+        self.lines += 1
+        if len(self._buf) >= self.buf_size:
+            return self.flush()
+        return True
+
+    # Milliseconds the oldest line in the buffer has waited
+    def age_ms(self) -> int:
+        return time.ticks_diff(time.ticks_ms(), self._t) if len(self._buf) > 0 else 0
+
+    # Write the buffer to the file
+    def flush(self) -> bool:
+        if self._f is None or len(self._buf) == 0:
+            return True
+        try:
+            self._f.write(self._buf)
+            self._f.flush()
+        except OSError as e:
+            print(f"LogWriter.flush(): ⚠️ error while writing to the log file: {e}")
+            self.errors += 1
+            return False
+        finally:
+            self._buf = bytearray()  # a line that could not be written is not written again
+        self.writes += 1
+        return True
+
+    def close(self):
+        if self._f is None:
+            return
+        self.flush()
+        try:
+            self._f.close()
+        except OSError:
+            pass
+        self._f = None
+        self.path = None
+
+    def stats(self) -> str:
+        return "lines: {}, writes: {}, errors: {}, buffered: {} bytes".format(
+            self.lines, self.writes, self.errors, len(self._buf))
@@ -0,0 +1,125 @@
+""" Micropython leveled logging with per module thresholds, that does not format disabled messages """
+# mlog.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython scripts:
+# - mqtt_presto_v9c.py
+# - metar_mqtt_epd_tcplogger_v1.py (a copy in its lib folder)
+#
+# The functions that handle every message (mqtt_callback(), split_msg(), draw(), NP_color()) printed many lines
+# per message, mostly under "if not my_debug:", so in normal use. The f-strings were formatted even when
+# nobody read the output, and a print to the USB serial port blocks until it has been sent.
+# A Logger has a name (e.g.: "rx", "draw") and a threshold level: DEBUG, INFO, WARN, ERROR or OFF.
+# The thresholds are set per name with configure() or set_level().
+#   log.info(TAG+"payload: {}", payload)  # formatted with str.format() only when INFO is enabled
+#   if log.dbg:                            # for a block of lines: nothing is evaluated when DEBUG is disabled
+#       log.debug(TAG+"rec = {}", rec)
+# The flags dbg, inf and wrn tell whether DEBUG, INFO and WARN are enabled. The arguments of a call
+# (TAG+"...", type(), repr(), a function call) are built before the call: in a hot path, test the flag first.
+# Lines that pass go to the output function (default: print, None: no output)
+# and to the optional sink, a RingSink that keeps the last lines in RAM, e.g. to print them after an error.
+#
+# This file contains two classes:
+# - RingSink;
+# - Logger.
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+OFF = 50
+
+class RingSink:
+    def __init__(self, size: int = 32):
+        self._lines = [None] * max(1, size)
+        self._head = 0  # index of the next line
+        self.count = 0  # number of lines added
+
+    def add(self, line: str):
+        self._lines[self._head] = line
+        self._head = (self._head + 1) % len(self._lines)
+        self.count += 1
+
+    # The lines in the ring, oldest first
+    def lines(self) -> list:
+        n = len(self._lines)
+        if self.count < n:
+            return self._lines[:self.count]
+        return self._lines[self._head:] + self._lines[:self._head]
+
+    def dump(self, out=print):
+        for line in self.lines():
+            out(line)
+
+class Logger:
+    def __init__(self, name: str, level: int = INFO, out=print, sink=None):
+        self.name = name
+        self.out = out
+        self.sink = sink
+        self.set_level(level)
+
+    def set_level(self, level: int):
+        self.level = level
+        self.dbg = level <= DEBUG
+        self.inf = level <= INFO
+        self.wrn = level <= WARN
+        self.err = level <= ERROR
+
+    def _emit(self, msg: str, args):
+        if args:
+            msg = msg.format(*args)
+        if self.out is not None:
+            self.out(msg)
+        if self.sink is not None:
+            self.sink.add(msg)
+
+    def debug(self, msg: str, *args):
+        if self.dbg:
+            self._emit(msg, args)
+
+    def info(self, msg: str, *args):
+        if self.inf:
+            self._emit(msg, args)
+
+    def warn(self, msg: str, *args):
+        if self.wrn:
+            self._emit(msg, args)
+
+    def error(self, msg: str, *args):
+        if self.err:
+            self._emit(msg, args)
+
+_loggers = {}  # name → Logger
+_levels = {}   # name → threshold level
+_default = INFO
+_out = print
+_sink = None
+
+# Set the default threshold, the thresholds per name (dict), the output function and the sink of all loggers
+def configure(default: int = INFO, levels: dict = None, out=print, sink=None):
+    global _default, _levels, _out, _sink
+    _default = default
+    _levels = dict(levels) if levels else {}
+    _out = out
+    _sink = sink
+    for name, log in _loggers.items():
+        log.out = out
+        log.sink = sink
+        log.set_level(_levels.get(name, default))
+
+def set_level(name: str, level: int):
+    _levels[name] = level
+    if name in _loggers:
+        _loggers[name].set_level(level)
+
+def get_logger(name: str) -> Logger:
+    log = _loggers.get(name)
+    if log is None:
+        log = Logger(name, _levels.get(name, _default), _out, _sink)
+        _loggers[name] = log
+    return log
+
+def sink():
+    return _sink
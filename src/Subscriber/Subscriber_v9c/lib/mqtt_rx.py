@@ -0,0 +1,84 @@
+""" Micropython MQTT client that receives messages into a reusable buffer """
+# mqtt_rx.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# umqtt.simple.MQTTClient reads the payload of every PUBLISH into a new bytes object.
+# MQTTClientRx reads it into a bytearray that is allocated once and gives the callback
+# a memoryview on that buffer. The callback must decode the message before it returns,
+# because the buffer is overwritten by the next message.
+# A message that does not fit in the buffer is read into a new bytes object, as before.
+#
+# This file contains one class:
+# - MQTTClientRx.
+
+import struct
+from umqtt.simple import MQTTClient
+
+class MQTTClientRx(MQTTClient):
+    def __init__(self, client_id, server, port=0, recv_buffer: int = 1024, **kw):
+        super().__init__(client_id, server, port, **kw)
+        self.rx_buf = bytearray(recv_buffer)
+        self.rx_mv = memoryview(self.rx_buf)
+        self.rx_msgs = 0  # number of messages received
+        self.rx_big = 0   # number of messages larger than the buffer
+        self.rx_max = 0   # size of the largest message
+
+    def _read_into_buf(self, sz: int):
+        mv = self.rx_mv
+        n = 0
+        while n < sz:
+            r = self.sock.readinto(mv[n:sz])
+            if not r:
+                raise OSError(-1)
+            n += r
+        return mv[:sz]
+
+    # Same as MQTTClient.wait_msg(), except for the read of the payload
+    def wait_msg(self):
+        res = self.sock.read(1)
+        self.sock.setblocking(True)
+        if res is None:
+            return None
+        if res == b"":
+            raise OSError(-1)
+        if res == b"\xd0":  # PINGRESP
+            sz = self.sock.read(1)[0]
+            assert sz == 0
+            return None
+        op = res[0]
+        if op & 0xF0 != 0x30:
+            return op
+        sz = self._recv_len()
+        topic_len = self.sock.read(2)
+        topic_len = (topic_len[0] << 8) | topic_len[1]
+        topic = self.sock.read(topic_len)
+        sz -= topic_len + 2
+        if op & 6:
+            pid = self.sock.read(2)
+            pid = pid[0] << 8 | pid[1]
+            sz -= 2
+        self.rx_msgs += 1
+        if sz > self.rx_max:
+            self.rx_max = sz
+        if sz <= len(self.rx_buf):
+            msg = self._read_into_buf(sz)
+        else:
+            self.rx_big += 1
+            msg = self.sock.read(sz)
+        self.cb(topic, msg)
+        if op & 6 == 2:
+            pkt = bytearray(b"\x40\x02\x00\x00")
+            struct.pack_into("!H", pkt, 2, pid)
+            self.sock.write(pkt)
+        elif op & 6 == 4:
+            assert 0
+        return op
+
+    def rx_stats(self) -> str:
+        return "received: {}, buffer: {} bytes, largest message: {} bytes, larger than buffer: {}".format(
+            self.rx_msgs, len(self.rx_buf), self.rx_max, self.rx_big)
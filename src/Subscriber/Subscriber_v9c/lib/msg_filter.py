@@ -0,0 +1,99 @@
+""" Micropython filters for received MQTT messages """
+# msg_filter.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# After a reconnect (see setup()) the broker delivers the retained messages again.
+# DedupWindow remembers, per topic handler, the keys of the last messages in a small ring.
+# The key is the msgID ("t" in the head of the payload, the uxTime of the publisher).
+# For the lights topics two messages can have the same msgID (two button presses within
+# one second), for these the value "v" is part of the key.
+# mqtt_callback() drops a message of which the key is in the ring (check()), before it is queued.
+# The key is added to the ring (mark()) only when the message has been queued: a message refused
+# by the queue is not remembered, so its retransmission by the broker is not dropped as a duplicate.
+#
+# Publishers with clocks that disagree, or a late delivery, can bring a message that is older
+# than the last handled message of the same topic. HighWaterMarks keeps per topic handler the
+# highest msgID handled. An older message is still saved in the messages history file,
+# but it does not change the state of the objects, the lights or the display.
+#
+# This file contains two classes:
+# - DedupWindow;
+# - HighWaterMarks.
+
+class DedupWindow:
+    def __init__(self, size: int = 8):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        self._rings = {}  # topic handler → [list of keys, index of the next slot]
+        # Counters
+        self.dropped = 0
+        self.dropped_per_topic = {}
+
+    def _key(self, ts, value):
+        return ts if value is None else hash((ts, value))
+
+    # Returns True if the message has been seen before (and counts it as dropped).
+    # The key is not remembered: call mark() when the message has been queued
+    def check(self, hdlr, ts, value=None) -> bool:
+        if not isinstance(ts, int) or ts <= 0:
+            return False  # no valid msgID
+        ring = self._rings.get(hdlr)
+        if ring is None or self._key(ts, value) not in ring[0]:
+            return False
+        self.dropped += 1
+        self.dropped_per_topic[hdlr.topic] = self.dropped_per_topic.get(hdlr.topic, 0) + 1
+        return True
+
+    # Remember the key of a message that has been queued
+    def mark(self, hdlr, ts, value=None):
+        if not isinstance(ts, int) or ts <= 0:
+            return
+        ring = self._rings.get(hdlr)
+        if ring is None:
+            ring = [[None] * self.size, 0]
+            self._rings[hdlr] = ring
+        ring[0][ring[1]] = self._key(ts, value)
+        ring[1] = (ring[1] + 1) % self.size
+
+    # Returns True if the message has been seen before. Otherwise remembers its key and returns False
+    def seen(self, hdlr, ts, value=None) -> bool:
+        if self.check(hdlr, ts, value):
+            return True
+        self.mark(hdlr, ts, value)
+        return False
+
+    def clear(self):
+        self._rings.clear()
+
+    def stats(self) -> str:
+        return "duplicates dropped: {}, per topic: {}".format(self.dropped, self.dropped_per_topic)
+
+class HighWaterMarks:
+    def __init__(self):
+        self._marks = {}  # topic handler → highest msgID handled
+        # Counters
+        self.stale = 0
+        self.stale_per_topic = {}
+
+    def get(self, hdlr) -> int:
+        return self._marks.get(hdlr, 0)
+
+    # Returns False if ts is older than the high-water mark of the topic. Otherwise raises the mark to ts
+    def advance(self, hdlr, ts) -> bool:
+        if not isinstance(ts, int) or ts <= 0:
+            return True  # no valid msgID, nothing to compare
+        if ts < self._marks.get(hdlr, 0):
+            self.stale += 1
+            self.stale_per_topic[hdlr.topic] = self.stale_per_topic.get(hdlr.topic, 0) + 1
+            return False
+        self._marks[hdlr] = ts
+        return True
+
+    def stats(self) -> str:
+        return "stale messages: {}, per topic: {}".format(self.stale, self.stale_per_topic)
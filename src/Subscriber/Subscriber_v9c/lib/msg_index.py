@@ -0,0 +1,87 @@
+""" Micropython index of the latest record per topic of the messages history file """
+# msg_index.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# find_latest_by_topic() had to read and decode every line of the messages history file
+# to find the newest record of one topic. LatestIndex keeps a table topicIdx → latest record in RAM.
+# The table is saved in a small sidecar file on SD (default: "/sd/msg_latest.json") every time
+# a record is written to the history file, or, with update(record, False), once per group of records
+# by a call of save() when dirty is True. So it is available again after a restart.
+# Only when the sidecar file is missing or invalid, the table is rebuilt by one pass over the records
+# of the history file (see hist_ring.py).
+#
+# This file contains one class:
+# - LatestIndex.
+
+import os
+import ujson
+
+class LatestIndex:
+    def __init__(self, path: str = "/sd/msg_latest.json"):
+        self.path = path
+        self._latest = {}  # topicIdx → latest record (dict)
+        self.dirty = False  # updated since the last save()
+        self.saves = 0
+
+    def __len__(self):
+        return len(self._latest)
+
+    # Returns the latest record of topic_idx, or an empty dict
+    def get(self, topic_idx: int) -> dict:
+        return self._latest.get(topic_idx, {})
+
+    # Read the sidecar file. Returns False if it is missing or invalid
+    def load(self) -> bool:
+        try:
+            with open(self.path, "r") as f:
+                data = ujson.loads(f.read())
+        except (OSError, ValueError):
+            return False
+        if not isinstance(data, dict):
+            return False
+        self._latest = {int(k): v for k, v in data.items() if isinstance(v, dict)}
+        return True
+
+    def save(self) -> bool:
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(ujson.dumps({str(k): v for k, v in self._latest.items()}))
+            os.rename(tmp, self.path)  # the sidecar file is replaced in one step
+        except OSError:
+            return False
+        self.dirty = False
+        self.saves += 1
+        return True
+
+    # Take a record written to the history file. Saves the sidecar file if it is the latest of its topic
+    def update(self, record: dict, save: bool = True) -> bool:
+        idx = record.get("topicIdx")
+        t = record.get("t", 0)
+        if not isinstance(idx, int) or not isinstance(t, int):
+            return False
+        cur = self._latest.get(idx)
+        if cur is not None and t <= cur.get("t", 0):
+            return False  # not newer than the record in the index
+        self._latest[idx] = record
+        if save:
+            self.save()
+        else:
+            self.dirty = True
+        return True
+
+    # Rebuild the table from the records (dicts) of the history file. Returns the number of records read
+    def rebuild(self, records) -> int:
+        self._latest = {}
+        n = 0
+        for record in records:
+            if isinstance(record, dict):
+                self.update(record, False)
+                n += 1
+        self.save()
+        return n
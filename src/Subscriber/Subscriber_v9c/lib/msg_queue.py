@@ -0,0 +1,193 @@
+""" Micropython bounded ring queue for received MQTT messages """
+# msg_queue.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# mqtt_callback() pushes each decoded message into the queue.
+# The main loop drains the queue in batches and calls split_msg() for each message.
+# In this way a second PUBLISH, delivered by client.check_msg() before the first one
+# has been handled, does not overwrite the first one.
+#
+# All slots are allocated once, at creation of the queue.
+# When the queue is full, the drop policy decides which message is lost:
+# - DROP_OLDEST: the oldest message in the queue is overwritten;
+# - DROP_NEWEST: the new message is refused;
+# - DROP_TOPIC:  the oldest queued message of the same topic is removed.
+#                If there is none, the oldest message is removed.
+#
+# MsgLanes combines a MsgRing per priority lane. pop() always takes from the
+# highest priority lane that is not empty, so a control message (lights toggle,
+# color or display color inc/dec) does not wait behind queued telemetry.
+# The lane of a message is the "lane" attribute of its topic handler.
+#
+# This file contains two classes:
+# - MsgRing;
+# - MsgLanes.
+
+DROP_OLDEST = 0
+DROP_NEWEST = 1
+DROP_TOPIC  = 2
+
+DROP_POLICY_NAMES = {DROP_OLDEST: "oldest", DROP_NEWEST: "newest", DROP_TOPIC: "topic"}
+
+LANE_CTL  = 0  # control topics, handled first
+LANE_BULK = 1  # telemetry topics: sensors, metar
+
+class MsgRing:
+    def __init__(self, capacity: int = 16, policy: int = DROP_OLDEST):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if policy not in DROP_POLICY_NAMES:
+            raise ValueError("unknown drop policy: {}".format(policy))
+        self.capacity = capacity
+        self.policy = policy
+        # Parallel slot lists, allocated once
+        self._hdlr    = [None] * capacity
+        self._topic   = [None] * capacity
+        self._payload = [None] * capacity
+        self._ts      = [0] * capacity
+        self._head = 0   # index of the oldest message
+        self._cnt = 0    # number of messages in the queue
+        # The message taken by pop()
+        self.hdlr = None
+        self.topic = None
+        self.payload = None
+        self.ts = 0
+        # Counters
+        self.pushed = 0
+        self.popped = 0
+        self.overflows = 0   # number of times a push found the queue full
+        self.dropped = 0     # number of messages lost
+        self.high_water = 0  # maximum number of messages in the queue
+
+    def __len__(self):
+        return self._cnt
+
+    def is_full(self) -> bool:
+        return self._cnt >= self.capacity
+
+    def clear(self):
+        for i in range(self.capacity):
+            self._hdlr[i] = None
+            self._topic[i] = None
+            self._payload[i] = None
+        self._head = 0
+        self._cnt = 0
+
+    def _remove_at(self, n: int):
+        # Remove the n-th message (0 = oldest) by shifting the older messages one slot up
+        cap = self.capacity
+        i = (self._head + n) % cap
+        while n > 0:
+            j = (i - 1) % cap
+            self._hdlr[i] = self._hdlr[j]
+            self._topic[i] = self._topic[j]
+            self._payload[i] = self._payload[j]
+            self._ts[i] = self._ts[j]
+            i = j
+            n -= 1
+        self._hdlr[i] = None
+        self._topic[i] = None
+        self._payload[i] = None
+        self._head = (self._head + 1) % cap
+        self._cnt -= 1
+
+    # Returns False if the message has been refused (policy DROP_NEWEST and queue full)
+    def push(self, hdlr, topic: str, payload, ts: int = 0) -> bool:
+        cap = self.capacity
+        if self._cnt >= cap:
+            self.overflows += 1
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return False
+            n = 0
+            if self.policy == DROP_TOPIC:
+                i = self._head
+                while n < self._cnt and self._hdlr[i] is not hdlr:
+                    i = (i + 1) % cap
+                    n += 1
+                if n >= self._cnt:
+                    n = 0  # no message of this topic queued, drop the oldest
+            self._remove_at(n)
+        i = (self._head + self._cnt) % cap
+        self._hdlr[i] = hdlr
+        self._topic[i] = topic
+        self._payload[i] = payload
+        self._ts[i] = ts
+        self._cnt += 1
+        self.pushed += 1
+        if self._cnt > self.high_water:
+            self.high_water = self._cnt
+        return True
+
+    # Take the oldest message. It is available in self.hdlr, self.topic, self.payload and self.ts
+    def pop(self) -> bool:
+        if self._cnt == 0:
+            return False
+        i = self._head
+        self.hdlr = self._hdlr[i]
+        self.topic = self._topic[i]
+        self.payload = self._payload[i]
+        self.ts = self._ts[i]
+        self._hdlr[i] = None
+        self._topic[i] = None
+        self._payload[i] = None
+        self._head = (i + 1) % self.capacity
+        self._cnt -= 1
+        self.popped += 1
+        return True
+
+    def stats(self) -> str:
+        return "queued: {}/{}, pushed: {}, popped: {}, overflows: {}, dropped: {}, high water: {}, policy: {}".format(
+            self._cnt, self.capacity, self.pushed, self.popped, self.overflows, self.dropped,
+            self.high_water, DROP_POLICY_NAMES[self.policy])
+
+class MsgLanes:
+    def __init__(self, capacities: tuple = (8, 16), policy: int = DROP_OLDEST):
+        self.lanes = [MsgRing(c, policy) for c in capacities]
+        # The message taken by pop()
+        self.hdlr = None
+        self.topic = None
+        self.payload = None
+        self.ts = 0
+        self.lane = -1
+
+    def __len__(self):
+        n = 0
+        for ring in self.lanes:
+            n += len(ring)
+        return n
+
+    # True if one of the lanes is full
+    def is_full(self) -> bool:
+        for ring in self.lanes:
+            if ring.is_full():
+                return True
+        return False
+
+    def clear(self):
+        for ring in self.lanes:
+            ring.clear()
+
+    def push(self, hdlr, topic: str, payload, ts: int = 0) -> bool:
+        return self.lanes[hdlr.lane].push(hdlr, topic, payload, ts)
+
+    # Take the oldest message of the highest priority lane that is not empty
+    def pop(self) -> bool:
+        for lane, ring in enumerate(self.lanes):
+            if ring.pop():
+                self.hdlr = ring.hdlr
+                self.topic = ring.topic
+                self.payload = ring.payload
+                self.ts = ring.ts
+                self.lane = lane
+                ring.hdlr = ring.topic = ring.payload = None
+                return True
+        return False
+
+    def stats(self) -> str:
+        return ", ".join("lane {}: [{}]".format(i, ring.stats()) for i, ring in enumerate(self.lanes))
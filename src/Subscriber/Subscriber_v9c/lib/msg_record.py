@@ -0,0 +1,55 @@
+""" Micropython flat record for the fields of a received MQTT message """
+# msg_record.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# Each topic handler owns one MsgRecord, created at startup.
+# split_msg() fills the record in place, draw() reads its fields by attribute.
+# This replaces the list of single key dicts (payloadLst), like [{"ow": "Feath"}, {"temp": "..."}],
+# which had to be searched for every field that draw() needed.
+#
+# This file contains one class:
+# - MsgRecord.
+
+from topic_dispatch import KIND_SENSOR, KIND_TOGGLE, KIND_AMB, KIND_DISP, KIND_METAR
+
+# Fields of the "hd" (head) nested JSon object, common to all topics.
+# "t" is the msgID (uxTime) as text, "ux" the same as int
+HEAD_FIELDS = ("ow", "de", "dc", "sc", "vt", "t", "ux")
+
+CTL_FIELDS = ("v", "mn", "mx")  # value, minimum and maximum of a lights command
+
+# Fields per topic kind, in addition to the HEAD_FIELDS
+KIND_FIELDS = {KIND_SENSOR: ("temp", "pres", "alti", "humi"),  # formatted lines, e.g.: "Temperature: 28.9 °C"
+               KIND_TOGGLE: CTL_FIELDS,
+               KIND_AMB:    CTL_FIELDS,
+               KIND_DISP:   CTL_FIELDS,
+               KIND_METAR:  ("raw", "st", "cr")}                # metar raw text, account status and credits
+
+class MsgRecord:
+    __slots__ = ("kind", "fields",
+                 "ow", "de", "dc", "sc", "vt", "t", "ux",
+                 "temp", "pres", "alti", "humi",
+                 "v", "mn", "mx",
+                 "raw", "st", "cr")
+
+    def __init__(self, kind: int = -1):
+        self.kind = kind
+        self.fields = HEAD_FIELDS + KIND_FIELDS.get(kind, ())  # the field table of this topic
+        for fld in HEAD_FIELDS + KIND_FIELDS[KIND_SENSOR] + CTL_FIELDS + KIND_FIELDS[KIND_METAR]:
+            setattr(self, fld, "")
+
+    def clear(self):
+        for fld in self.fields:
+            setattr(self, fld, "")
+
+    # Read a field by name. Returns "" for a field that is not in this record
+    def get(self, key: str):
+        return getattr(self, key, "")
+
+    def as_dict(self) -> dict:
+        return {fld: getattr(self, fld) for fld in self.fields}
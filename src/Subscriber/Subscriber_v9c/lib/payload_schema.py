@@ -0,0 +1,168 @@
+""" Micropython per topic payload schemas, compiled into decode functions """
+# payload_schema.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# The payload of each topic kind is described by a schema (see SCHEMAS below):
+# the sections of the payload, the fields in each section, their type and label format.
+# At startup compile_schema() turns a schema into one decode function per topic handler.
+# split_msg() calls this function to fill the MsgRecord of the handler.
+# To add a new device class: add its topic kind in topic_dispatch.py,
+# its record fields in msg_record.py and its schema below.
+#
+# Example payload of topic "sensors/Feath/ambient":
+# {"hd": {"ow": "Feath", "de": "Lab", "dc": "BME280", "sc": "meas", "vt": "f", "t": 1757271875},
+#  "reads": {"t": {"u": "C", "mx": 50, "mn": -10, "v": 28.9}, "p": {"u": "mB", "mx": 1200, "mn": 800, "v": 1006}, ...}}
+
+from topic_dispatch import KIND_SENSOR, KIND_TOGGLE, KIND_AMB, KIND_DISP, KIND_METAR
+
+# Field types
+FT_TEXT    = 0  # copy the value, optionally translated by a label table
+FT_READING = 1  # sensor reading {"u": unit, "v": value} formatted according to "vt" in the head
+FT_INT     = 2  # integer value. Converted from str when the unit "u" of the section is "s"
+
+UX_MIN = 0           # 1970-01-01 00:00:00 UTC
+UX_MAX = 2147483647  # 2038-01-19 03:14:07 UTC (maximum value for a signed integer 32-bit number)
+
+# Label tables for the head fields
+DC_LABELS = {"colr": "color", "dclr": "dcolor", "wx": "weather"}  # device class
+SC_LABELS = {"meas": "measurement", "inc": "incr", "dec": "decr", "ligh": "lights"}  # state class
+VT_LABELS = {"f": "float", "i": "int", "s": "str", "b": "bool"}  # value type
+ACC_STATUS_LABELS = {1: "Active"}  # metar-taf.com account status
+
+# Head (section "hd") field: (record attribute, label table, label if not in table)
+# A default of None means: keep the received value
+HEAD_SCHEMA = {"ow": ("ow", None, None),
+               "de": ("de", None, None),
+               "dc": ("dc", DC_LABELS, None),
+               "sc": ("sc", SC_LABELS, "unknown"),
+               "vt": ("vt", VT_LABELS, None)}
+
+# Section name None stands for the payload key of the topic handler, e.g.: "colorInc" or "dclrDec"
+CTL_SECTION = {"v":  (FT_INT, "v"),
+               "mn": (FT_INT, "mn"),
+               "mx": (FT_INT, "mx")}
+
+# Per topic kind: {section name: {field key: (field type, record attribute, ...)}}
+# FT_READING: (FT_READING, attribute, label, float format, fixed unit or None to use the unit "u")
+# FT_TEXT:    (FT_TEXT, attribute, label table, label if not in table)
+SCHEMAS = {
+    KIND_SENSOR: {"reads": {"t": (FT_READING, "temp", "Temperature: ", "{:4.1f}", "°C"),  # "°C" cannot be sent by MQTT (AFAIK)
+                            "p": (FT_READING, "pres", "Pressure: ", "{:6.1f}", None),
+                            "a": (FT_READING, "alti", "Altitude: ", "{:5.1f}", None),
+                            "h": (FT_READING, "humi", "Humidity: ", "{:5.1f}", None)}},
+    KIND_TOGGLE: {None: CTL_SECTION},
+    KIND_AMB:    {None: CTL_SECTION},
+    KIND_DISP:   {None: CTL_SECTION},
+    KIND_METAR:  {"acc":   {"st": (FT_TEXT, "st", ACC_STATUS_LABELS, "Inactive"),
+                            "cr": (FT_TEXT, "cr", None, None)},
+                  "metar": {"raw": (FT_TEXT, "raw", None, None)}}
+}
+
+def _text_fn(attr, table, default):
+    if table is None:
+        def fn(rec, v):
+            setattr(rec, attr, v)
+    else:
+        def fn(rec, v):
+            lbl = table.get(v)
+            if lbl is None:
+                lbl = v if default is None else default
+            setattr(rec, attr, lbl)
+    return fn
+
+# Reading formatters, one per value type, with the label and the format already filled in
+def _reading_fns(label, ffmt, fixed_unit):
+    if fixed_unit:
+        f_fmt = label + ffmt + " " + fixed_unit
+        sfx = " " + fixed_unit
+        return {"f": lambda v, u: f_fmt.format(v),
+                "i": lambda v, u: label + str(v) + sfx,
+                "s": lambda v, u: label + v + sfx}
+    f_fmt = label + ffmt + " {:s}"
+    return {"f": lambda v, u: f_fmt.format(v, u),
+            "i": lambda v, u: label + str(v) + u,
+            "s": lambda v, u: label + v + u}
+
+def _compile_head():
+    fns = {}
+    for key, (attr, table, default) in HEAD_SCHEMA.items():
+        fns[key] = _text_fn(attr, table, default)
+
+    def decode_head(head, rec) -> int:
+        for key, value in head.items():
+            fn = fns.get(key)
+            if fn is not None:
+                fn(rec, value)
+        ux = head.get("t", 0)
+        if not isinstance(ux, int):
+            ux = 0
+        rec.ux = ux
+        rec.t = str(ux) if UX_MIN < ux < UX_MAX else "invalid"
+        return ux
+    return decode_head
+
+def _compile_section(fields: dict):
+    readings = []  # (key, attr, formatters per vt)
+    texts = []     # (key, fn)
+    ints = []      # (key, attr)
+    for key, spec in fields.items():
+        ft = spec[0]
+        if ft == FT_READING:
+            readings.append((key, spec[1], _reading_fns(spec[2], spec[3], spec[4])))
+        elif ft == FT_TEXT:
+            texts.append((key, _text_fn(spec[1], spec[2], spec[3])))
+        elif ft == FT_INT:
+            ints.append((key, spec[1]))
+        else:
+            raise ValueError("unknown field type: {}".format(ft))
+
+    def decode_section(data: dict, rec, vt: str):
+        for key, attr, fmts in readings:
+            reading = data.get(key)
+            if isinstance(reading, dict):
+                fmt = fmts.get(vt)
+                if fmt is not None:
+                    setattr(rec, attr, fmt(reading.get("v", "??"), reading.get("u", "")))
+        for key, fn in texts:
+            if key in data:
+                fn(rec, data[key])
+        if ints:
+            to_int = data.get("u") == "s"
+            for key, attr in ints:
+                if key in data:
+                    v = data[key]
+                    setattr(rec, attr, int(v) if to_int else v)
+    return decode_section
+
+# Returns the top level keys of the payload that the schema needs, e.g.: ("hd", "reads").
+# An empty tuple for a topic kind without schema
+def schema_keys(kind: int, payload_key: str = "") -> tuple:
+    schema = SCHEMAS.get(kind)
+    if schema is None:
+        return ()
+    return ("hd",) + tuple(payload_key if name is None else name for name in schema)
+
+# Returns a function decode(payload, rec) -> bool that fills rec (a MsgRecord) from the payload dict
+def compile_schema(kind: int, payload_key: str = ""):
+    decode_head = _compile_head()
+    sections = []
+    for name, fields in SCHEMAS.get(kind, {}).items():
+        sections.append((payload_key if name is None else name, _compile_section(fields)))
+
+    def decode(payload: dict, rec) -> bool:
+        head = payload.get("hd", {})
+        if not isinstance(head, dict):
+            return False
+        decode_head(head, rec)
+        vt = head.get("vt", "")
+        for name, decode_section in sections:
+            data = payload.get(name)
+            if isinstance(data, dict):
+                decode_section(data, rec, vt)
+        return True
+    return decode
@@ -0,0 +1,184 @@
+""" Micropython (and CPython) multi-resolution rollups of sensor readings """
+# rollup.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# The messages history file keeps the raw sensor messages for a limited time.
+# Rollups keeps, per sensor topic and per reading ("t", "p", "a", "h"), the count, min, max and mean
+# of the values per minute, per hour and per day (the tiers). A view over a long time reads
+# one record per bucket from a small file, instead of all raw records.
+# The rollups are updated incrementally: a reading goes into the open minute bucket of its topic.
+# When a reading of the next minute arrives, the minute bucket is closed: written to the file
+# of the minutes tier and merged into the open hour bucket, and so on up to the days tier.
+# A reading for a bucket that has been closed already (a late message) is counted, not added.
+#
+# Each tier is a history ring file (see hist_ring.py) with one slot per closed bucket:
+# slot header t = start of the bucket (uxTime), topic index, kind REC_ROLLUP, and per reading AGG_FMT.
+# The oldest buckets are overwritten. The open buckets are saved in a small sidecar file
+# (default: "/sd/msg_roll.json") at each commit(), so they survive a restart.
+#
+# This file contains one class:
+# - Rollups.
+
+import os
+import struct
+try:
+    import ujson
+except ImportError:
+    import json as ujson  # CPython
+
+from hist_ring import HistRing, REC_ROLLUP
+
+AGG_FMT = "<1sHfff"  # reading key (1 character), count, min, max, mean
+AGG_SIZE = struct.calcsize(AGG_FMT)  # 15 bytes
+
+# Default tiers: (bucket size in seconds, file name, capacity in buckets)
+TIERS = ((60, "msg_roll_1m.bin", 1440),     # one day of minutes for one sensor topic
+         (3600, "msg_roll_1h.bin", 744),    # one month of hours
+         (86400, "msg_roll_1d.bin", 366))   # one year of days
+
+# Pack the aggregates {key: [count, min, max, sum]} of a bucket. At most max_data bytes
+def pack_aggs(aggs: dict, max_data: int) -> bytes:
+    parts = []
+    for k in sorted(aggs):
+        if len(parts) * AGG_SIZE + AGG_SIZE > max_data:
+            break
+        n, mn, mx, sm = aggs[k]
+        parts.append(struct.pack(AGG_FMT, k.encode("utf-8"), min(n, 0xFFFF), mn, mx, sm / n))
+    return b"".join(parts)
+
+# Returns the aggregates of a bucket record as dict {key: (count, min, max, mean)}
+def unpack_aggs(data) -> dict:
+    aggs = {}
+    for pos in range(0, len(data) - AGG_SIZE + 1, AGG_SIZE):
+        k, n, mn, mx, mean = struct.unpack_from(AGG_FMT, data, pos)
+        aggs[k.decode("utf-8")] = (n, float("{:.6g}".format(mn)), float("{:.6g}".format(mx)),
+                                   float("{:.6g}".format(mean)))
+    return aggs
+
+class Rollups:
+    def __init__(self, prefix: str = "/sd/", tiers=TIERS, state_path: str = "/sd/msg_roll.json",
+                 slot_size: int = 80, group_bytes: int = 0):
+        self.sizes = [size for size, fn, cap in tiers]
+        self.rings = [HistRing(prefix + fn, slot_size, cap, 0, group_bytes) for size, fn, cap in tiers]
+        self.state_path = state_path
+        self._open = [{} for _ in tiers]  # per tier: topicIdx → [bucket start, {key: [count, min, max, sum]}]
+        self.dirty = False
+        # Counters
+        self.added = 0
+        self.late = 0  # readings for a bucket already closed
+        self.closed = [0] * len(tiers)
+
+    def open(self):
+        for ring in self.rings:
+            ring.open()
+
+    def close(self):
+        for ring in self.rings:
+            ring.close()
+
+    # Write the closed buckets to the files of the tiers and the open buckets to the sidecar file
+    def commit(self):
+        for ring in self.rings:
+            ring.commit()
+        if self.dirty:
+            self.save()
+
+    # Read the open buckets from the sidecar file. Returns False if it is missing or invalid
+    def load(self) -> bool:
+        try:
+            with open(self.state_path, "r") as f:
+                data = ujson.loads(f.read())
+        except (OSError, ValueError):
+            return False
+        if not isinstance(data, list) or len(data) != len(self._open):
+            return False
+        self._open = [{int(k): v for k, v in tier.items()} for tier in data]
+        return True
+
+    def save(self) -> bool:
+        tmp = self.state_path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(ujson.dumps([{str(k): v for k, v in tier.items()} for tier in self._open]))
+            os.rename(tmp, self.state_path)  # the sidecar file is replaced in one step
+        except OSError:
+            return False
+        self.dirty = False
+        return True
+
+    # Add the readings of a sensor message received at uxTime t. reads: the "reads" part of the payload,
+    # e.g.: {"t": {"u": "C", "mx": 50, "mn": -10, "v": 28.9}, "p": {...}, ...}
+    def add_reads(self, topic_idx: int, t: int, reads: dict) -> bool:
+        if not isinstance(t, int) or t <= 0 or not isinstance(reads, dict):
+            return False
+        aggs = {}
+        for k, read in reads.items():
+            if len(k) == 1 and isinstance(read, dict):
+                v = read.get("v")
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    aggs[k] = [1, v, v, v]
+        if not aggs:
+            return False
+        if not self._feed(0, topic_idx, t, aggs):
+            self.late += 1
+            return False
+        self.added += 1
+        return True
+
+    # Merge the aggregates of a reading (tier 0) or of a closed bucket of the tier below into tier i.
+    # Returns False if the bucket of t has been closed already
+    def _feed(self, i: int, topic_idx: int, t: int, aggs: dict) -> bool:
+        start = t - t % self.sizes[i]
+        cur = self._open[i].get(topic_idx)
+        if cur is not None and start < cur[0]:
+            return False
+        if cur is not None and start > cur[0]:
+            self._close(i, topic_idx, cur)
+            cur = None
+        if cur is None:
+            self._open[i][topic_idx] = [start, {k: list(a) for k, a in aggs.items()}]
+        else:
+            have = cur[1]
+            for k, a in aggs.items():
+                h = have.get(k)
+                if h is None:
+                    have[k] = list(a)
+                else:
+                    h[0] += a[0]
+                    if a[1] < h[1]:
+                        h[1] = a[1]
+                    if a[2] > h[2]:
+                        h[2] = a[2]
+                    h[3] += a[3]
+        self.dirty = True
+        return True
+
+    # Write a bucket to the file of tier i and merge it into tier i + 1
+    def _close(self, i: int, topic_idx: int, bucket):
+        ring = self.rings[i]
+        ring.append(REC_ROLLUP, pack_aggs(bucket[1], ring.max_data), bucket[0], topic_idx)
+        self.closed[i] += 1
+        if i + 1 < len(self.rings):
+            self._feed(i + 1, topic_idx, bucket[0], bucket[1])
+
+    # Generator of the buckets of tier i (0: minutes, 1: hours, 2: days) of topic_idx (None: all topics)
+    # that start from t0 to t1, oldest first, as tuples (start, topicIdx, {key: (count, min, max, mean)}).
+    # With include_open also the open buckets, at the end
+    def buckets(self, i: int, topic_idx: int = None, t0: int = 0, t1: int = 0xFFFFFFFF, include_open: bool = True):
+        for seq, t, idx, kind, data in self.rings[i].records():
+            if kind == REC_ROLLUP and t0 <= t <= t1 and (topic_idx is None or idx == topic_idx):
+                yield t, idx, unpack_aggs(data)
+        if include_open:
+            for idx in sorted(self._open[i]):
+                start, aggs = self._open[i][idx]
+                if t0 <= start <= t1 and (topic_idx is None or idx == topic_idx):
+                    yield start, idx, {k: (a[0], a[1], a[2], a[3] / a[0]) for k, a in aggs.items()}
+
+    def stats(self) -> str:
+        return "readings added: {}, late: {}, buckets closed per tier: {}, open buckets: {}".format(
+            self.added, self.late, self.closed, [len(o) for o in self._open])
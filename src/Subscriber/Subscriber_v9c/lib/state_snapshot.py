@@ -0,0 +1,95 @@
+""" Micropython snapshot of the entity objects and display state for a warm start """
+# state_snapshot.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# After a reset the display showed "Waiting for Messages..." until a publisher sent again,
+# for the METAR topic that can take more than 30 minutes.
+# StateSnapshot saves, per topic handler that received a message, the fields of its MsgRecord
+# and the state of its entity object (see mqtt_entities.py), together with the display state
+# (a dict of global variables given by the main script), in one small JSon file (default: "/sd/presto_state.json").
+# The main script saves it periodically and at exit, and loads it at startup,
+# before WiFi and MQTT are set up, to draw the last message at once.
+# A handler is only restored when its topic is still the same (see secrets.json).
+#
+# This file contains one class:
+# - StateSnapshot.
+
+import os
+import ujson
+
+SNAP_VERSION = 1
+# Properties of the entity subclasses, saved when the object has them
+ENTITY_PROPS = ("lights_toggle", "amb_color", "disp_color", "disp_color_index", "metar", "temperature")
+
+class StateSnapshot:
+    def __init__(self, path: str = "/sd/presto_state.json"):
+        self.path = path
+        self.t = 0  # uxTime of the snapshot loaded or saved last
+        self.saves = 0
+
+    @staticmethod
+    def _entity_state(obj) -> dict:
+        state = {"head": obj.head, "payload": obj.payload, "acc": obj.acc}
+        for name in ENTITY_PROPS:
+            if hasattr(obj, name):
+                state[name] = getattr(obj, name)
+        return state
+
+    @staticmethod
+    def _restore_entity(obj, state: dict):
+        obj.head = state.get("head")
+        obj.payload = state.get("payload")
+        obj.acc = state.get("acc")
+        for name in ENTITY_PROPS:
+            if name in state and hasattr(obj, name):
+                setattr(obj, name, state[name])  # the setters check the type
+
+    # Save the state of the topic handlers (their MsgRecord and entity object) and the display state glob
+    def save(self, handlers, t: int, glob: dict) -> bool:
+        hdlrs = {}
+        for hdlr in handlers:
+            if hdlr.rec is None or hdlr.rec.t == "":
+                continue  # no message received on this topic
+            h = {"topic": hdlr.topic, "rec": hdlr.rec.as_dict()}
+            if hdlr.obj is not None:
+                h["obj"] = self._entity_state(hdlr.obj)
+            hdlrs[str(hdlr.idx)] = h
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(ujson.dumps({"v": SNAP_VERSION, "t": t, "g": glob, "h": hdlrs}))
+            os.rename(tmp, self.path)  # the snapshot file is replaced in one step
+        except OSError:
+            return False
+        self.t = t
+        self.saves += 1
+        return True
+
+    # Restore the state of the topic handlers. Returns the display state (dict), or None if there is no valid snapshot
+    def load(self, handlers):
+        try:
+            with open(self.path, "r") as f:
+                snap = ujson.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        if not isinstance(snap, dict) or snap.get("v") != SNAP_VERSION:
+            return None
+        hdlrs = snap.get("h", {})
+        for hdlr in handlers:
+            h = hdlrs.get(str(hdlr.idx))
+            if h is None or h.get("topic") != hdlr.topic:
+                continue
+            if hdlr.rec is not None:
+                rec = h.get("rec", {})
+                for fld in hdlr.rec.fields:
+                    if fld in rec:
+                        setattr(hdlr.rec, fld, rec[fld])
+            if hdlr.obj is not None and isinstance(h.get("obj"), dict):
+                self._restore_entity(hdlr.obj, h["obj"])
+        self.t = snap.get("t", 0)
+        return snap.get("g", {})
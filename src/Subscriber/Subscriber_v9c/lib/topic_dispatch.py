@@ -0,0 +1,187 @@
+""" Micropython topic dispatcher for MQTT messages """
+# topic_dispatch.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# The dispatcher is built once, at startup, from the "topicN" keys in secrets.json.
+# A received topic is resolved to a TopicHandler object by:
+# - an exact match lookup in a dict (O(1));
+# - when not found, a walk through a trie of the filters that contain
+#   the MQTT wildcards "+" (one level) or "#" (all remaining levels).
+# Example filters: "sensors/+/ambient", "$SYS/broker/#"
+#
+# This file contains two classes:
+# - TopicHandler;
+# - TopicDispatcher.
+
+# Kinds of topics. They replace the checks on the topic index,
+# like: topicIdx == 6 or topicIdx in (2,3)
+KIND_UNKNOWN = 0
+KIND_SENSOR  = 1  # sensors/Feath/ambient
+KIND_TOGGLE  = 2  # lights/Feath/toggle
+KIND_AMB     = 3  # lights/Feath/color_inc, lights/Feath/color_dec
+KIND_DISP    = 4  # lights/Feath/dclr_inc,  lights/Feath/dclr_dec
+KIND_METAR   = 5  # weather/PL2XLW/metar
+KIND_SYS     = 6  # $SYS/broker/...
+
+KIND_NAMES = {KIND_UNKNOWN: "unknown",
+              KIND_SENSOR:  "sensor",
+              KIND_TOGGLE:  "toggle",
+              KIND_AMB:     "amb",
+              KIND_DISP:    "disp",
+              KIND_METAR:   "metar",
+              KIND_SYS:     "sys"}
+
+# last level of a lights topic → key of the nested JSon object in the payload
+_LIGHTS_KEYS = {"toggle":    "toggle",
+                "color_inc": "colorInc",
+                "color_dec": "colorDec",
+                "dclr_inc":  "dclrInc",
+                "dclr_dec":  "dclrDec"}
+
+def topic_kind(topic: str) -> int:
+    if topic.startswith("$SYS"):
+        return KIND_SYS
+    if topic.startswith("sensors"):
+        return KIND_SENSOR
+    if topic.startswith("weather"):
+        return KIND_METAR
+    if topic.startswith("lights"):
+        if topic.endswith("toggle"):
+            return KIND_TOGGLE
+        if topic.endswith("color_inc") or topic.endswith("color_dec"):
+            return KIND_AMB
+        if topic.endswith("dclr_inc") or topic.endswith("dclr_dec"):
+            return KIND_DISP
+    return KIND_UNKNOWN
+
+def topic_payload_key(topic: str, kind: int) -> str:
+    if kind == KIND_SENSOR:
+        return "reads"
+    if kind == KIND_METAR:
+        return "metar"
+    if kind in (KIND_TOGGLE, KIND_AMB, KIND_DISP):
+        return _LIGHTS_KEYS.get(topic[topic.rfind("/")+1:], "")
+    return ""
+
+class TopicHandler:
+    __slots__ = ("idx", "topic", "kind", "key", "step", "obj", "rec", "decode", "keys", "lane", "hits")
+
+    def __init__(self, idx: int = -1, topic: str = "", kind: int = -1):
+        self.idx = idx        # the N of "topicN" in secrets.json
+        self.topic = topic    # the topic (filter) as defined in secrets.json
+        self.kind = topic_kind(topic) if kind < 0 else kind
+        self.key = topic_payload_key(topic, self.kind)  # e.g.: "reads", "colorInc"
+        if topic.endswith("_inc"):
+            self.step = "inc"
+        elif topic.endswith("_dec"):
+            self.step = "dec"
+        else:
+            self.step = ""
+        self.obj = None       # the entity object, e.g.: sensor_obj. Set by the main script
+        self.rec = None       # the MsgRecord with the fields of the latest message. Set by the main script
+        self.decode = None    # the compiled payload schema, see payload_schema.py. Set by the main script
+        self.keys = ()        # the payload keys to decode, see json_scan.py. Set by the main script
+        self.lane = 1         # the priority lane of the message queue, see msg_queue.py. Set by the main script
+        self.hits = 0         # number of messages dispatched to this handler
+
+    @property
+    def kind_name(self) -> str:
+        return KIND_NAMES.get(self.kind, "unknown")
+
+    def __repr__(self):
+        return "TopicHandler({}, '{}', {})".format(self.idx, self.topic, self.kind_name)
+
+class TopicDispatcher:
+    # A trie node is a list: [children dict, handler if filter ends here, handler for "#"]
+    def __init__(self):
+        self._exact = {}
+        self._root = [{}, None, None]
+        self._n_wild = 0
+        self._by_idx = {}
+        self.handlers = []
+        self.misses = 0
+
+    @staticmethod
+    def is_wildcard(topic_filter: str) -> bool:
+        return "+" in topic_filter or "#" in topic_filter
+
+    def add(self, topic_filter: str, idx: int = -1, kind: int = -1) -> TopicHandler:
+        h = TopicHandler(idx, topic_filter, kind)
+        if self.is_wildcard(topic_filter):
+            node = self._root
+            levels = topic_filter.split("/")
+            last = len(levels) - 1
+            for i, lvl in enumerate(levels):
+                if lvl == "#":
+                    if i != last:
+                        raise ValueError("'#' must be the last level of: " + topic_filter)
+                    node[2] = h
+                    break
+                nxt = node[0].get(lvl)
+                if nxt is None:
+                    nxt = [{}, None, None]
+                    node[0][lvl] = nxt
+                node = nxt
+                if i == last:
+                    node[1] = h
+            self._n_wild += 1
+        else:
+            self._exact[topic_filter] = h
+        if idx >= 0:
+            self._by_idx[idx] = h
+        self.handlers.append(h)
+        return h
+
+    def get(self, idx: int) -> TopicHandler:
+        return self._by_idx.get(idx)
+
+    def first(self, kind: int) -> TopicHandler:
+        for h in self.handlers:
+            if h.kind == kind:
+                return h
+        return None
+
+    def match(self, topic: str) -> TopicHandler:
+        h = self._exact.get(topic)
+        if h is None and self._n_wild > 0:
+            h = self._match_trie(topic)
+        if h is None:
+            self.misses += 1
+        else:
+            h.hits += 1
+        return h
+
+    def _match_trie(self, topic: str) -> TopicHandler:
+        levels = topic.split("/")
+        n = len(levels)
+        # MQTT rule: topics starting with "$" are not matched by a filter starting with a wildcard
+        sys_topic = topic.startswith("$")
+        # Depth first walk. Per node the alternatives are pushed in reverse order of preference:
+        # "#", "+", literal level. An entry with level -1 stands for the "#" handler of that node.
+        stack = [(self._root, 0)]
+        while stack:
+            node, i = stack.pop()
+            if i < 0:
+                return node[2]
+            wild_ok = not (sys_topic and i == 0)
+            if i == n:
+                if node[1] is not None:
+                    return node[1]
+                if node[2] is not None and wild_ok:  # "a/#" also matches "a"
+                    return node[2]
+                continue
+            if node[2] is not None and wild_ok:
+                stack.append((node, -1))
+            if wild_ok:
+                nxt = node[0].get("+")
+                if nxt is not None:
+                    stack.append((nxt, i + 1))
+            nxt = node[0].get(levels[i])
+            if nxt is not None:
+                stack.append((nxt, i + 1))
+        return None
@@ -0,0 +1,296 @@
+""" Micropython (and CPython) columnar delta encoded time series store for the sensor readings """
+# ts_store.py
+# Date: 2026-10-18
+# by Paulus Schulinck (Github handle: @PaulskPt)
+# License: MIT
+#
+# File to be used with micropython script:
+# - mqtt_presto_v9c.py
+#
+# Consecutive readings of the BME280 differ by tenths (28.9 → 28.8, 1006 → 1005.9) and arrive once a minute.
+# TsStore keeps the readings of the sensor topics in blocks of rows, per topic, stored column by column:
+# - the timestamps as delta-of-delta: a reading exactly one interval after the previous one costs 1 byte;
+# - each reading ("t", "p", "a", "h") as its own column of deltas of the value scaled to an integer
+#   (value * scale, scale 10: one decimal), e.g.: 28.9 → 28.8 is -1, 1 byte.
+# Numbers are written as zigzag varints (1 byte for -64..63). A row of 4 readings takes ~5 bytes.
+# A block is sealed when it is full (it fits in one slot of the file) or when the set of readings changes.
+# Sealed blocks are kept in a history ring file (see hist_ring.py), record kind REC_TS_BLOCK,
+# slot header t = lowest timestamp of the block. The oldest blocks are overwritten.
+#
+# Block layout (little-endian):
+# - BLK_HDR_FMT: number of rows, number of columns, lowest t, highest t, length of the timestamps column;
+# - per column COL_HDR_FMT: reading key, scale, lowest and highest scaled value, length of the column;
+# - the timestamps column, then the value columns.
+# A query skips a block by its header: on its timestamps, or on the lowest and highest value of a column.
+# A sparse timestamp index (see hist_index.py) over the blocks, with the lowest and highest t of each block,
+# gives the blocks that can have readings in the window of a query: only their slot headers are read.
+# It is saved in a sidecar file (default: the file name with ".idx", e.g.: "/sd/msg_ts.idx") by close().
+#
+# The rows of the open (not sealed) blocks are in RAM only. After a restart the main script
+# adds them again from the messages history file (see last_t()).
+#
+# This file contains two classes:
+# - TsBlock;
+# - TsStore.
+
+import struct
+
+from hist_ring import HistRing, REC_TS_BLOCK
+from hist_index import HistIndex
+
+BLK_HDR_FMT = "<HBIIH"
+BLK_HDR_SIZE = struct.calcsize(BLK_HDR_FMT)  # 13 bytes
+COL_HDR_FMT = "<1sHiiH"
+COL_HDR_SIZE = struct.calcsize(COL_HDR_FMT)  # 13 bytes
+VARINT_MAX = 5  # bytes of a varint of a 32-bit number
+SCALE = 10      # default scale of the readings: one decimal
+IDX_BLOCK = 8   # blocks per entry of the index
+
+def _put_varint(buf: bytearray, n: int):
+    n = (n << 1) ^ (n >> 63)  # zigzag: 0, -1, 1, -2 → 0, 1, 2, 3
+    while n > 0x7F:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+# Returns (number, new position)
+def _get_varint(data, pos: int):
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            break
+        shift += 7
+    return (n >> 1) ^ -(n & 1), pos
+
+# Returns the header of a block as tuple (rows, lowest t, highest t, {key: (scale, lowest, highest)}),
+# the lowest and highest values unscaled
+def block_header(data):
+    n, ncols, t_min, t_max, _ = struct.unpack_from(BLK_HDR_FMT, data, 0)
+    cols = {}
+    pos = BLK_HDR_SIZE
+    for _ in range(ncols):
+        k, scale, vmin, vmax, _ = struct.unpack_from(COL_HDR_FMT, data, pos)
+        cols[k.decode("utf-8")] = (scale, vmin / scale, vmax / scale)
+        pos += COL_HDR_SIZE
+    return n, t_min, t_max, cols
+
+# Generator of the rows of a block as tuples (t, {key: value}). keys: the readings wanted (None: all)
+def block_rows(data, keys=None):
+    n, ncols, t_min, t_max, ts_len = struct.unpack_from(BLK_HDR_FMT, data, 0)
+    pos = BLK_HDR_SIZE
+    col_pos = BLK_HDR_SIZE + ncols * COL_HDR_SIZE + ts_len  # start of the first value column
+    cols = []  # [key, scale, position in data, previous scaled value]
+    for _ in range(ncols):
+        k, scale, vmin, vmax, ln = struct.unpack_from(COL_HDR_FMT, data, pos)
+        k = k.decode("utf-8")
+        if keys is None or k in keys:
+            cols.append([k, scale, col_pos, 0])
+        col_pos += ln
+        pos += COL_HDR_SIZE
+    t = t_min
+    delta = 0
+    for i in range(n):
+        d, pos = _get_varint(data, pos)
+        if i == 0:
+            t += d
+        else:
+            delta += d
+            t += delta
+        row = {}
+        for col in cols:
+            d, col[2] = _get_varint(data, col[2])
+            col[3] += d
+            row[col[0]] = col[3] / col[1]
+        yield t, row
+
+class TsBlock:
+    def __init__(self, keys, scales: dict = None):
+        self.keys = tuple(sorted(keys))
+        self.scales = tuple((scales or {}).get(k, SCALE) for k in self.keys)
+        self.n = 0
+        self.t_min = 0
+        self.t_max = 0
+        self._t_first = 0
+        self._t_prev = 0
+        self._delta = 0
+        self._ts = bytearray()
+        self._cols = [bytearray() for _ in self.keys]
+        self._prev = [0] * len(self.keys)  # previous scaled value per column
+        self._min = [0] * len(self.keys)
+        self._max = [0] * len(self.keys)
+
+    # Size of the block, encoded
+    def size(self) -> int:
+        return BLK_HDR_SIZE + len(self.keys) * COL_HDR_SIZE + len(self._ts) + sum(len(c) for c in self._cols)
+
+    # Size of the block with one more row, at most
+    def size_next(self) -> int:
+        return self.size() + VARINT_MAX * (1 + len(self.keys))
+
+    # Add a row. values: {key: value} with the keys of the block
+    def add(self, t: int, values: dict):
+        if self.n == 0:
+            self._t_first = t
+            self.t_min = self.t_max = t
+            # The first timestamp is stored relative to the lowest t of the block, see seal()
+        else:
+            d = t - self._t_prev
+            _put_varint(self._ts, d - self._delta)
+            self._delta = d
+            if t < self.t_min:
+                self.t_min = t
+            if t > self.t_max:
+                self.t_max = t
+        self._t_prev = t
+        for i, k in enumerate(self.keys):
+            v = int(round(values[k] * self.scales[i]))
+            _put_varint(self._cols[i], v - self._prev[i])
+            self._prev[i] = v
+            if self.n == 0 or v < self._min[i]:
+                self._min[i] = v
+            if self.n == 0 or v > self._max[i]:
+                self._max[i] = v
+        self.n += 1
+
+    # Returns the block encoded
+    def seal(self) -> bytes:
+        ts = bytearray()
+        _put_varint(ts, self._t_first - self.t_min)
+        ts += self._ts
+        parts = [struct.pack(BLK_HDR_FMT, self.n, len(self.keys), self.t_min, self.t_max, len(ts))]
+        for i, k in enumerate(self.keys):
+            parts.append(struct.pack(COL_HDR_FMT, k.encode("utf-8"), self.scales[i], self._min[i], self._max[i],
+                                     len(self._cols[i])))
+        parts.append(ts)
+        parts.extend(self._cols)
+        return b"".join(parts)
+
+class TsStore:
+    def __init__(self, path: str, slot_size: int = 512, capacity: int = 720, scales: dict = None,
+                 idx_path: str = None):
+        self.ring = HistRing(path, slot_size, capacity)
+        if idx_path is None:
+            idx_path = (path[:path.rfind(".")] if "." in path else path) + ".idx"
+        self.index = HistIndex(self.ring, idx_path, IDX_BLOCK, self._t_high)
+        self.scales = scales or {}
+        self._open = {}  # topicIdx → TsBlock not sealed yet
+        # Counters
+        self.added = 0
+        self.sealed = 0
+        self.blocks_read = 0
+        self.blocks_skipped = 0
+
+    def open(self) -> bool:
+        ok = self.ring.open()
+        if not self.index.load():
+            self.index.rebuild()  # reads each block once
+            self.index.save()
+        return ok
+
+    def close(self):
+        self.ring.close()
+        self.index.save()
+
+    # Highest t of the block in slot (slot header hdr), for the index
+    def _t_high(self, slot: int, hdr) -> int:
+        if hdr[3] != REC_TS_BLOCK:
+            return hdr[1]
+        rec = self.ring.read_slot(slot)
+        return block_header(rec[4])[2] if rec is not None else hdr[1]
+
+    # Add the readings of a sensor message received at uxTime t. reads: the "reads" part of the payload,
+    # e.g.: {"t": {"u": "C", "mx": 50, "mn": -10, "v": 28.9}, "p": {...}, ...}
+    def add_reads(self, topic_idx: int, t: int, reads: dict) -> bool:
+        if not isinstance(t, int) or t <= 0 or not isinstance(reads, dict):
+            return False
+        values = {}
+        for k, read in reads.items():
+            if len(k) == 1 and isinstance(read, dict):
+                v = read.get("v")
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    values[k] = v
+        if not values:
+            return False
+        blk = self._open.get(topic_idx)
+        if blk is not None and (blk.keys != tuple(sorted(values)) or blk.size_next() > self.ring.max_data
+                                or blk.n == 0xFFFF):
+            self.seal(topic_idx)
+            blk = None
+        if blk is None:
+            blk = TsBlock(values, self.scales)
+            self._open[topic_idx] = blk
+        blk.add(t, values)
+        self.added += 1
+        return True
+
+    # Write the open block of topic_idx to the file
+    def seal(self, topic_idx: int):
+        blk = self._open.pop(topic_idx, None)
+        if blk is not None and blk.n > 0:
+            seq = self.ring.append(REC_TS_BLOCK, blk.seal(), blk.t_min, topic_idx)
+            if seq > 0:
+                self.index.add(seq, blk.t_min, blk.t_max)
+            self.sealed += 1
+
+    # Highest timestamp of the readings of topic_idx in the file or in its open block, 0 if none
+    def last_t(self, topic_idx: int) -> int:
+        blk = self._open.get(topic_idx)
+        if blk is not None and blk.n > 0:
+            return blk.t_max
+        for seq, t, idx, kind, data in self.ring.records(True):
+            if kind == REC_TS_BLOCK and idx == topic_idx:
+                return block_header(data)[2]
+        return 0
+
+    # Generator of the readings of topic_idx from uxTime t0 to t1 (inclusive), in order of arrival,
+    # as tuples (t, {key: value}). keys: the readings wanted (None: all).
+    # With vmin/vmax (and one key): only blocks that can have a value of keys[0] from vmin to vmax are read
+    def query(self, topic_idx: int, t0: int = 0, t1: int = 0xFFFFFFFF, keys=None, vmin=None, vmax=None):
+        ring = self.ring
+        blocks = []
+        for seq in self.index.candidates(t0, t1):  # only the blocks of which the index entry overlaps t0..t1
+            slot = ring.slot_of(seq)
+            hdr = ring.read_slot_header(slot)
+            if hdr is None or hdr[0] != seq or hdr[3] != REC_TS_BLOCK or hdr[2] != topic_idx or hdr[1] > t1:
+                continue  # another topic, or all readings after t1
+            blocks.append(slot)
+        for slot in blocks:
+            rec = ring.read_slot(slot)
+            if rec is None:
+                continue
+            data = rec[4]
+            if not self._block_wanted(block_header(data), t0, t1, keys, vmin, vmax):
+                self.blocks_skipped += 1
+                continue
+            self.blocks_read += 1
+            for t, row in block_rows(data, keys):
+                if t0 <= t <= t1:
+                    yield t, row
+        blk = self._open.get(topic_idx)
+        if blk is not None and blk.n > 0 and self._block_wanted((blk.n, blk.t_min, blk.t_max, None), t0, t1):
+            for t, row in block_rows(blk.seal(), keys):
+                if t0 <= t <= t1:
+                    yield t, row
+
+    @staticmethod
+    def _block_wanted(hdr, t0: int, t1: int, keys=None, vmin=None, vmax=None) -> bool:
+        n, t_min, t_max, cols = hdr
+        if t_max < t0 or t_min > t1:
+            return False
+        if cols is not None and keys and (vmin is not None or vmax is not None):
+            col = cols.get(keys[0])
+            if col is None:
+                return False
+            if vmin is not None and col[2] < vmin:
+                return False
+            if vmax is not None and col[1] > vmax:
+                return False
+        return True
+
+    def stats(self) -> str:
+        return "readings added: {}, blocks sealed: {}, open blocks: {}, queries read {} blocks, skipped {}, index: {}".format(
+            self.added, self.sealed, len(self._open), self.blocks_read, self.blocks_skipped, self.index.stats())
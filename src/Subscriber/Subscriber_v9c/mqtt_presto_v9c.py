@@ -42,16 +42,94 @@
 # Update 2025-09-02, try to set HiRes
 # In version 9a taken out the flag use_sirfico_method and the non use_sirfico_method code sections
 # Update version 9b. Added function splitMetarforDisplay()
+# 2026-10-18 Version 9c. Received topics are resolved by a TopicDispatcher (see lib/topic_dispatch.py),
+#   built once from the "topicN" keys in secrets.json. It returns a TopicHandler object.
+#   The topic index checks like topicIdx == 6 or topicIdx in (2,3) are replaced by checks on the handler kind.
+# 2026-10-18 mqtt_callback() pushes the decoded messages into a bounded ring queue (see lib/msg_queue.py).
+#   The loop() part drains this queue in batches. A burst of messages is no longer overwritten.
+# 2026-10-18 The list of single key dicts payloadLst and function get_payload_member() are replaced by
+#   a MsgRecord (see lib/msg_record.py) per topic handler. split_msg() fills it in place, draw() reads its fields.
+# 2026-10-18 The chain of if key == "ow", if vt == "f", if label == "t" branches in split_msg() is replaced by
+#   payload schemas per topic kind (see lib/payload_schema.py), compiled once at startup into decode functions.
+# 2026-10-18 Payloads are received into a reusable buffer (see lib/mqtt_rx.py). mqtt_callback() decodes only the
+#   sections the payload schema needs, directly from that buffer (see lib/json_scan.py), without a bytes → str copy.
+# 2026-10-18 Rendering is coalesced (see lib/coalesce.py): every message is still handled by split_msg() and saved,
+#   but only the newest message is drawn, at most once per RENDER_TICK_MS.
+# 2026-10-18 The loop() part runs as asyncio tasks for receive, processing, rendering and maintenance.
+#   rx_task() awaits the readability of the MQTT socket instead of spinning on client.check_msg().
+# 2026-10-18 Priority lanes: control topics are taken from msg_queue before telemetry. Records for the messages
+#   history file are queued by split_msg() and written by persist_task() when no messages are waiting.
+# 2026-10-18 Repeated messages (same topic and msgID), like retained messages after a reconnect,
+#   are dropped in mqtt_callback() (see lib/msg_filter.py).
+# 2026-10-18 A message older than the last handled message of its topic (per topic high-water mark of the msgID)
+#   is saved to the history file, but does not change objects, lights, datetime_rcvd/hh_rcvd or the display.
+# 2026-10-18 find_latest_by_topic() reads from an index of the latest record per topic (see lib/msg_index.py),
+#   kept in RAM and in the sidecar file "msg_latest.json" on SD, instead of reading the whole history file.
+# 2026-10-18 The messages history file is a ring buffer file of fixed size slots: "msg_hist.bin" (see lib/hist_ring.py).
+#   clean_file_if_too_large() is removed. An existing "msg_hist.json" is imported once and renamed to "msg_hist.json.old".
+# 2026-10-18 Records are saved packed (see lib/hist_codec.py): the fixed parts of a record (topic, owner, device, units, limits)
+#   are stored once as a template in the meta area of "msg_hist.bin", a record holds only its template id and values.
+#   Offline_Tools/hist_decode.py decodes a copy of "msg_hist.bin" on a PC.
+# 2026-10-18 Group commit of the records: the history file collects records in a RAM buffer of HIST_COMMIT_BYTES
+#   and writes them, with the header and "msg_latest.json", when the buffer is full or the oldest record
+#   has waited HIST_COMMIT_DELAY_MS. Also before a redraw and at exit. See commit_records().
+# 2026-10-18 The conversion of "msg_hist.bin" to another HIST_SLOT_SIZE, HIST_CAPACITY_RECORDS or HIST_META_SIZE and
+#   the import of "msg_hist.json" are streamed and continue where they were after a reboot (see lib/hist_ring.py).
+# 2026-10-18 Range queries over the messages history: hist_range(), hist_latest() and hist_at(), backed by a sparse
+#   timestamp index of the history file (see lib/hist_index.py), saved in the sidecar file "msg_hist.idx".
+# 2026-10-18 Rollups (see lib/rollup.py): count, min, max and mean of each sensor reading per minute, hour and day,
+#   updated with every saved sensor record and kept in "msg_roll_1m.bin", "msg_roll_1h.bin" and "msg_roll_1d.bin".
+# 2026-10-18 The sensor readings are also kept in a columnar, delta encoded time series file "msg_ts.bin"
+#   (see lib/ts_store.py), ~6 bytes per reading, for long histories. Query with ts_store.query().
+#   A query only reads the blocks found with its sparse timestamp index, saved in "msg_ts.idx".
+# 2026-10-18 Warm start: the entity objects and the display state are saved in "presto_state.json" (see lib/state_snapshot.py)
+#   every SAVE_STATE_INTERVAL_T seconds and at exit. At startup the last message is drawn from it before WiFi
+#   and MQTT are set up. The WiFi setup has been moved to just before setup() for this.
+# 2026-10-18 add_to_log() writes through a LogWriter (see lib/log_writer.py): the log file stays open, its size is kept
+#   in RAM and lines are buffered up to LOG_BUF_SIZE bytes, written by log_task() after LOG_FLUSH_MS, at rotation and at exit.
+# 2026-10-18 The names and sizes of the files in "/sd/" are kept in a cache, sd_cache (see lib/fs_cache.py).
+#   ck_log(), ref_file_exists(), get_active_log_filename(), list_logfiles() and del_logfiles() use it
+#   instead of reading the directory with os.listdir() for every check.
+# 2026-10-18 The log files are a ring of LOG_RING_SLOTS numbered files "mqtt_log_00.txt" .. (see lib/log_ring.py).
+#   A rotation overwrites the oldest one. The active one is read from the header file "mqtt_log_ring.bin" at startup.
+#   This replaces the timestamp named log files and the reference file "mqtt_latest_log_fn.txt".
+#   del_logfiles() deletes the log files of the previous versions.
+# 2026-10-18 After a rotation, the closed log file is compressed by deflate_task() into "mqtt_log_NN.txt.gz"
+#   (gzip, see lib/log_deflate.py), chunk by chunk with a window of 2^LOG_DEFLATE_WBITS bytes, between the other tasks.
+#   Read them on a PC with src/Offline_Tools/presto_logs.py. Set LOG_DEFLATE = False to keep them uncompressed.
+# 2026-10-18 The functions that handle every message (mqtt_callback(), split_msg(), draw(), NP_color(), ..) log through
+#   leveled loggers (see lib/mlog.py): log_rx, log_msg, log_draw and log_np, with a threshold per logger in LOG_LEVELS.
+#   Disabled lines are not formatted. By default (my_debug False) these loggers only show warnings and errors.
+#   LOG_MEM_LINES > 0 keeps the last lines in RAM; they are printed by task_error() and at exit.
 import ujson
 import utime
 from presto import Presto
 from picovector import PicoVector, Polygon, Transform, ANTIALIAS_X16  # by @SirFico
 import asyncio  # by @SirFico
-from umqtt.simple import MQTTClient
 import os
 import sys # See: https://github.com/dhylands/upy-examples/blob/master/print_exc.py
 import time
 import exc # own ERR class to print errors to a log file
+from topic_dispatch import TopicDispatcher, KIND_SENSOR, KIND_TOGGLE, KIND_AMB, KIND_DISP, KIND_METAR, KIND_SYS
+from msg_queue import MsgRing, MsgLanes, DROP_OLDEST, DROP_TOPIC, LANE_CTL, LANE_BULK
+from msg_record import MsgRecord
+from payload_schema import compile_schema, schema_keys
+from json_scan import loads_sections, compile_keys
+from mqtt_rx import MQTTClientRx
+from coalesce import Coalescer
+from msg_filter import DedupWindow, HighWaterMarks
+from msg_index import LatestIndex
+from hist_ring import HistRing
+from hist_codec import HistCodec
+from hist_index import HistIndex
+from rollup import Rollups, TIERS as ROLLUP_TIERS
+from ts_store import TsStore
+from state_snapshot import StateSnapshot
+from log_writer import LogWriter
+from fs_cache import FsCache
+from log_ring import LogRing
+from log_deflate import LogDeflate
+import mlog
 from random import randint
 # Force reload of the real re module
 # sys.modules.pop("re", None)
@@ -130,6 +208,17 @@ display.clear()
 presto.update()
 
 my_debug = False
+# Leveled logging of the per message functions (see lib/mlog.py)
+LOG_LEVEL = mlog.DEBUG if my_debug else mlog.INFO  # default threshold
+LOG_LEVELS = {} if my_debug else {"rx": mlog.WARN, "msg": mlog.WARN, "draw": mlog.WARN, "np": mlog.WARN}
+LOG_CONSOLE = True  # False: no output to the REPL/serial port
+LOG_MEM_LINES = 0  # > 0: keep the last LOG_MEM_LINES lines in RAM
+mlog.configure(LOG_LEVEL, LOG_LEVELS, print if LOG_CONSOLE else None,
+               mlog.RingSink(LOG_MEM_LINES) if LOG_MEM_LINES > 0 else None)
+log_rx = mlog.get_logger("rx")      # mqtt_callback(), rx_task()
+log_msg = mlog.get_logger("msg")    # split_msg(), process_task()
+log_draw = mlog.get_logger("draw")  # draw(), redraw()
+log_np = mlog.get_logger("np")      # NP_color(), disp_color_chg()
 wx_test = False # Temporary to test the metar msgs
 delete_logs = False
 msg_rcvd = False
@@ -138,8 +227,15 @@ datetime_rcvd = ""
 hh_rcvd = 0  # see: split_msg() and ...
 
 mqtt_connected = False # Flag to indicate if the MQTT client is connected   
+wifi_connected = False
 
-msg_hist_fn = "msg_hist.json"
+msg_hist_fn = "msg_hist.bin"  # ring buffer file, see lib/hist_ring.py
+msg_hist_json_fn = "msg_hist.json"  # history file of the versions before 2026-10-18. Imported once into msg_hist_fn
+msg_latest_fn = "msg_latest.json"  # sidecar file with the latest record per topic of msg_hist_fn
+msg_hist_idx_fn = "msg_hist.idx"     # sidecar file with the timestamp index of msg_hist_fn
+msg_roll_fn = "msg_roll.json"        # sidecar file with the open buckets of the rollups
+msg_ts_fn = "msg_ts.bin"             # time series file of the sensor readings
+presto_state_fn = "presto_state.json"  # snapshot of the entity objects and the display state, for a warm start
 
 # Create objects
 sensor_obj = SensorTPAH()
@@ -153,10 +249,10 @@ if my_debug:
 
 topic_rcvd = None
 topic_idx = -1
+topic_hdlr = None # TopicHandler of the topic received. See topic_in_lst()
 topicIdx_max = 0
 
 payload = None
-payloadLst = []
 temp = None
 pres = None
 alti = None
@@ -345,6 +441,26 @@ for key, value in mqtt_config_dict.items():
 if not my_debug:
     print(f"topicIdx_max = {topicIdx_max}")
 
+# Build the topic dispatcher once. Each handler knows its entity object.
+SYS_TOPICS_ALL = "$SYS/#" # Accept all received topics starting with '$SYS'
+kind_obj_dict = {KIND_SENSOR: sensor_obj,
+                 KIND_TOGGLE: toggle_obj,
+                 KIND_AMB:    amb_obj,
+                 KIND_DISP:   disp_obj,
+                 KIND_METAR:  metar_obj}
+dispatcher = TopicDispatcher()
+for tpc_idx in sorted(TOPIC_DICT.keys()):
+    hdlr = dispatcher.add(TOPIC_DICT[tpc_idx], tpc_idx)
+    hdlr.obj = kind_obj_dict.get(hdlr.kind)
+    hdlr.rec = MsgRecord(hdlr.kind)
+    hdlr.decode = compile_schema(hdlr.kind, hdlr.key)
+    hdlr.keys = compile_keys(schema_keys(hdlr.kind, hdlr.key))
+    hdlr.lane = LANE_CTL if hdlr.kind in (KIND_TOGGLE, KIND_AMB, KIND_DISP) else LANE_BULK
+    if my_debug:
+        print(TAG+f"dispatcher: {hdlr}, payload key: \'{hdlr.key}\'")
+if SYS_TOPICS_ALL not in TOPIC_DICT.values():
+    dispatcher.add(SYS_TOPICS_ALL, -1, KIND_SYS)
+
 
 uxTime = 0
 utc_offset = secrets['timezone']['tz_utc_offset']  # utc offset in hours
@@ -385,30 +501,35 @@ if not my_debug:
     print(f"PUBLISHER_ID1 = {PUBLISHER_ID1}")
 
 # Test the existance of a logfile
-log_fn = None # Note: log_fn is set in the function create_logfile()
+log_fn = None # Note: log_fn is set from log_ring, see create_logfile()
 log_path = None # "/sd/" + log_fn
 log_size_max = 50 * 1024  # 51200 bytes # 50 kB max log file size
+LOG_BUF_SIZE = 512   # lines are written to the log file per 512 bytes (one SD sector)
+LOG_FLUSH_MS = 2000  # maximum time a line waits in the buffer of log_writer
+log_writer = LogWriter(LOG_BUF_SIZE)  # keeps the active log file open, see add_to_log()
 log_obj = None
 log_exist = False
-new_log_fn = None
-new_log_path = None
-new_log_obj = None
-new_log_exist = False
 
 def get_prefix() -> str:
     return "/sd/"
 
+sd_cache = FsCache(get_prefix())  # names and sizes of the files in /sd/. Tell it about files created, renamed or removed
+
 # Note: err_log_fn is used in the function create_err_log_file()
 err_log_fn = "err_log.txt"
 err_log_path = get_prefix() + err_log_fn
 err_log_obj = None
-# Note: ref_fn is used in the function create_ref_file()
-ref_fn = "mqtt_latest_log_fn.txt"
-ref_path = get_prefix() + ref_fn
-ref_obj = None
-
-ref_file_checked = False
-log_file_checked = False
+# Log files: a ring of numbered files "mqtt_log_00.txt", "mqtt_log_01.txt", .. The oldest one is overwritten
+LOG_RING_SLOTS = 8         # number of log files
+LOG_RING_BUDGET_BYTES = 0  # if > 0: the space on SD for the log files in bytes. Overrules LOG_RING_SLOTS
+log_ring = LogRing(get_prefix(), LOG_RING_BUDGET_BYTES // (log_size_max + LOG_BUF_SIZE) if LOG_RING_BUDGET_BYTES > 0
+                   else LOG_RING_SLOTS)
+legacy_ref_fn = "mqtt_latest_log_fn.txt"  # the reference file of the previous versions, see del_logfiles()
+# The closed log files are compressed in the background into "mqtt_log_NN.txt.gz", see deflate_task()
+LOG_DEFLATE = True      # needs the deflate module with compression support in the firmware
+LOG_DEFLATE_WBITS = 10  # window of 1024 bytes
+log_deflate = LogDeflate(get_prefix(), LOG_DEFLATE_WBITS, LOG_BUF_SIZE)
+deflate_event = asyncio.Event()  # set by create_logfile() when a closed log file has been queued for compression
 
 def clean(): # Clear the screen to Black
     display.set_pen(BLACK)
@@ -418,8 +539,8 @@ def clean(): # Clear the screen to Black
 
 def NP_clear():  # NeoPixels clear (switch off)
     TAG = "NP_clear(): "
-    if not my_debug:
-        print(TAG+"🌈 ambient neopixels off")
+    if log_np.inf:
+        log_np.info(TAG+"🌈 ambient neopixels off")
     for i in range(NUM_LEDS):
         presto.set_led_rgb(i, 0, 0, 0)
     time.sleep(0.02)
@@ -435,15 +556,16 @@ def NP_color():
         r = blColorsDict[lightsColorIdx][0]
         g = blColorsDict[lightsColorIdx][1]
         b = blColorsDict[lightsColorIdx][2]
-        if not my_debug:
-            print(TAG+f"lightsColorIdx: {lightsColorIdx} = color \"{blColorNamesDict[lightsColorIdx]}\"")
-            print(TAG+f"🌈 ambient neopixels color set to: r = {r}, g = {g}, b = {b}")
+        if log_np.inf:
+            log_np.info(TAG+"lightsColorIdx: {} = color \"{}\"", lightsColorIdx, blColorNamesDict[lightsColorIdx])
+            log_np.info(TAG+"🌈 ambient neopixels color set to: r = {}, g = {}, b = {}", r, g, b)
         for n in range(NUM_LEDS):
             presto.set_led_rgb(n, r, g, b)
         time.sleep(0.02)
         lights_ON = True # set the lights_ON flag to True
       else:
-          print(f"lightColorIdx: {lightsColorIdx} not in blColorsDict.keys(): {blColorsDict.keys()}")
+          if log_np.inf:
+            log_np.info("lightColorIdx: {} not in blColorsDict.keys(): {}", lightsColorIdx, blColorsDict.keys())
     else:
       NP_clear()  # Switch off
      
@@ -461,24 +583,25 @@ def disp_color_chg(idx) -> int:
     TAG = "disp_color_chg(): "
     default = ORANGE # These color definitions are of type int
     new_pen_color = default
-    if not my_debug:
-        print(TAG+f"parameter idx = {idx}")
+    if log_np.inf:
+        log_np.info(TAG+"parameter idx = {}", idx)
     if lightsDclrMin <= idx <= lightsDclrMax:  
         if idx in dispColorDict0.keys():
             new_pen_color = dispColorDict0[idx]
             if idx in dispColorNamesDict.keys():
                 new_pen_color_name = dispColorNamesDict[idx]
             else:
-                print(TAG+f"⚠️ param idx: {idx} not found in dispColorNamesDict.keys()")
+                log_np.warn(TAG+"⚠️ param idx: {} not found in dispColorNamesDict.keys()", idx)
                 new_pen_color_name = "?"
             disp_obj.disp_color = new_pen_color  # CURRENT_COLOR # Save to the disp_obj
-            print(TAG+f"display color (CURRENT_COLOR) changed to {hex(new_pen_color)} = {new_pen_color_name}")
+            if log_np.inf:
+                log_np.info(TAG+"display color (CURRENT_COLOR) changed to {} = {}", hex(new_pen_color), new_pen_color_name)
             return new_pen_color
         else:
-            print(TAG+f"⚠️ param idx: {idx} not found in dispColorDict0.keys()")
+            log_np.warn(TAG+"⚠️ param idx: {} not found in dispColorDict0.keys()", idx)
             return default
     else:
-        print(TAG+f"⚠️ display color index {lightsDclrIdx} out of range!")
+        log_np.warn(TAG+"⚠️ display color index {} out of range!", lightsDclrIdx)
         
     return default
 
@@ -500,249 +623,82 @@ def create_err_log_file():
             # err_log_fn = "err_log.txt"
             if err_log_obj:
                 err_log_obj.close()
-            with open(err_log_path, 'w') as ref_obj:
+            with open(err_log_path, 'w') as err_log_obj:
                 err_log_obj.write('--- Error log file created on: {} ---\n'.format(get_iso_timestamp()))
                 print(TAG+f"Error log file: \"{err_log_fn}\" created")
+            sd_cache.created(err_log_fn)
             if err_log_obj:
                 err_log_obj.close() 
     except OSError as e:
         print(TAG+f"⚠️ OSError: {e}")
 
-def create_ref_file():
-    global ref_path, ref_obj, ref_fn
-    TAG = "create_ref_file(): "
-    try:
-        if ref_obj:
-            ref_obj.close()
-        with open(ref_path, 'w') as ref_obj:
-            ref_obj.write('--- Reference file created on: {} ---\n'.format(get_iso_timestamp()))
-            print(TAG+f"reference file: \"{ref_fn}\" created")
-    except OSError as e:
-        print(TAG+f"⚠️ OSError: {e}")
-        
-def ref_file_exists() -> bool:
-    global ref_path, ref_obj, ref_fn
-    ret = False
-    TAG = "ref_file_exists(): "
-    try:
-        if ref_obj:
-            ref_obj.close()
-        with open(ref_path, 'r') as ref_obj:
-            ret = True
-        if ref_obj:
-            ref_obj.close()
-    except OSError as e:
-        print(TAG+f"Reference file not found or unable to open. Error: {e}")
-    return ret
-
-def clear_ref_file():
-    global ref_path, ref_obj, ref_fn
-    TAG = "clear_ref_file(): "
-    txt1 = "reference file: "
-    try:
-        ref_exist = ref_file_exists() # Check if the reference file exists
-        if ref_exist:
-            if my_debug:
-                print(TAG+txt1+f"\"{ref_fn}\" exists, making it empty")
-            # If the reference file exists, make it empty
-            # Note: This will overwrite the existing file, so be careful!
-            if ref_obj:
-                ref_obj.close()
-            with open(ref_path, 'w') as ref_obj:
-                pass  # Create an empty reference file
-            ref_obj.close()
-            ref_size = os.stat(ref_path)[6]  # File size in bytes
-            if ref_size == 0:
-                print(TAG+txt1+f"\"{ref_fn}\" is empty")
-            else:
-                print(TAG+txt1+f"\"{ref_fn}\" is not empty, size: {ref_size} bytes")
-        else:
-            if my_debug:
-                print(TAG+txt1+f"\"{ref_fn}\" does not exist, creating it")
-            create_ref_file()    
-    except OSError as e:
-        print(TAG+f"OSError: {e}")
-
-def get_active_log_filename() -> str:
-    global ref_path, ref_obj, ref_fn, ref_file_checked, log_fn, log_path, log_exist
-    TAG = "get_active_log_filename(): "
-    txt1 = "Active log "
-    txt2 = "reference file"
-    txt3 = "in the directory:"
-    ret = ""
-    active_log_fn = None
-    active_log_path = None
-    active_log_exist = False
-    active_log_size = 0
-    try:
-        if ref_obj:
-            ref_obj.close()
-        with open(ref_path, 'r') as ref_obj:
-            active_log_fn = ref_obj.readline().strip()  # Read the first line and remove trailing newline
-        if ref_obj:
-            ref_obj.close()
-        ref_file_checked = True
-        
-        if active_log_fn:
-            if my_debug:
-              print(TAG + txt1 + f"filename read from " + txt2 + f": \"{active_log_fn}\"")
-            # Check if the log file exists in the specified directory
-            if active_log_fn in os.listdir(get_prefix()):
-                active_log_path = get_prefix() + active_log_fn
-                if my_debug:
-                  print(TAG + txt1 + f"file: \"{active_log_fn}\" exists in " + txt3 + f"\"{get_prefix()}\"")
-                active_log_size = os.stat(active_log_path)[6]  # File size in bytes
-                if my_debug:
-                  print(TAG + txt1 + f"Active log file: \"{active_log_fn}\" exists in " + txt3 + f"\"{get_prefix()}\"")
-                  print(TAG+f"Active log file size: {active_log_size} bytes")
-                # Set the log path and log exist flag
-                active_log_path = get_prefix() + active_log_fn
-                active_log_exist = True
-                #ret = active_log_fn  # Return the active log filename
-            else:
-                print(TAG + txt1 + f"file: \"{active_log_fn}\" does not exist " + txt3 + f"\"{get_prefix()}\"")
-                # If the log file does not exist, we can create a new one
-                active_log_exist = False
-                active_log_path = None
-                active_log_fn = None
-                clear_ref_file()
-
-            ret = active_log_fn
-            log_fn = active_log_fn
-            log_path = active_log_path 
-            log_exist = active_log_exist
-        else:
-            print(TAG + txt1 + "filename not found in the " + txt2)
-    except OSError as e:
-        print(TAG+f"⚠️ Error reading the " + txt2 + ": {e}")
-    
-    return ret
-
-def pr_ref() -> int:
-    global ref_path, ref_obj
-    ret = 0
-    TAG = "pr_ref(): "
-    try:
-        if ref_obj:
-            ref_obj.close()
-        
-        if ref_path:
-            if my_debug:
-              print(TAG+f"Contents of ref file: \"{ref_path}\":")
-            f_cnt = 0
-            with open(ref_path, 'r') as ref_obj:
-                for line in ref_obj:
-                    f_cnt += 1
-                    #f_cnt_str = "0" + str(f_cnt) if f_cnt < 10 else str(f_cnt)
-                    #print(f"   {f_cnt_str}) {line.strip()}") 
-                    if my_debug:
-                      print("{:s} {:02d}) {:s}".format(TAG, f_cnt, line.strip())) # Remove trailing newline for cleaner output
-                if my_debug:
-                  do_line()
-            ret = f_cnt  # Return the number of lines printed
-    except OSError as e:
-        print(TAG+f"⚠️ Reference file not found or unable to open. Error: {e}")
-    return ret
-
 # Function to get current datetime as an ISO string
 def get_iso_timestamp() -> str:
     t = time.localtime()
     return "{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}".format(*t[:6])
 
-def new_logname() -> str:
-    fn = "mqtt_log_{}.txt".format(get_iso_timestamp())
-    # Replace ":" with "" for compatibility with MS Windows file systems
-    return fn.replace(":", "")
-
 def ck_log(fn) -> bool:
     if isinstance(fn, str) and len(fn) > 0:
-        if fn in os.listdir(get_prefix()):
+        if sd_cache.exists(fn):
             return True
     return False
 
-# Create a new log file and add its filename to the ref file
+# Size of the log file fn in bytes, including the lines still buffered by log_writer. -1 if it does not exist
+def log_file_size(fn) -> int:
+    if log_writer.path == get_prefix() + fn:
+        return log_writer.size
+    return sd_cache.size(fn)
+
+# Move to the next log file of the ring (see lib/log_ring.py). The oldest log file is overwritten
 def create_logfile():
-    global log_fn, log_path, log_obj, log_exist, ref_path, ref_obj, new_log_fn, new_log_path, new_log_obj
+    global log_fn, log_path, log_exist
     TAG = "create_logfile(): "
-    
-    new_log_fn = new_logname()
-    if not my_debug:
-        print(f"new_logname() = {new_log_fn}")
-    
-    new_log_path = get_prefix() + new_log_fn
-    try:
-        if log_obj:
-            log_obj.close()
-        with open(new_log_path, 'w') as log_obj:
-            log_obj.write('---Log created on: {}---\n'.format(get_iso_timestamp()))
-        print(TAG+f"created new log file: \"{new_log_fn}\"")
-        # Check existance of the new log file
-        if ck_log(new_log_fn):
-            print(TAG+f"check: new log file: \"{new_log_fn}\" exists")
-        else:
-            print(TAG+f"⚠️ check: new log file: \"{new_log_fn}\" not found!")
-        # Make empty the ref file
-        if ref_obj:
-            ref_obj.close()
-        with open(ref_path, 'w') as ref_obj: # Make empty the ref file
-            pass
-        if ref_obj:
-            ref_obj.close()
-        # Add the filename of the new logfile to the ref file
-        with open(ref_path, "w") as ref_obj:
-            ref_obj.write(new_log_fn)
-            print(TAG+f"added to ref file: \"{ref_fn}\" the new active log filename \"{new_log_fn}\"")
-            pr_ref()  # Print the contents of the ref file
-    except OSError as e:
-        print(TAG+f"⚠️ OSError: {e}")
-    """
-    if new_log_fn is not None:
-        log_fn = new_log_fn # Update the global log_fn variable
-    if new_log_path is not None:
-        log_path = new_log_path # Update the global log_path variable
-    """
-
-# Function to close a log file that is too long
-# Then create a new log file
-# Add the new log filename in the ref file
+    if log_writer.path is not None:
+        sd_cache.resized(log_writer.path[len(get_prefix()):], log_writer.size)
+    log_writer.close() # write the lines still buffered to the current log file
+    closed_fn = log_ring.name() if log_ring.gen > 0 else None
+    next_fn = log_ring.name((log_ring.active + 1) % log_ring.slots) if log_ring.gen > 0 else log_ring.name(0)
+    log_deflate.cancel(next_fn) # the oldest log file is overwritten, compressed or not
+    if sd_cache.exists(next_fn + ".gz"):
+        sd_cache.remove(next_fn + ".gz")
+    size = log_ring.rotate(get_iso_timestamp())
+    if size < 0:
+        return
+    log_fn = log_ring.name() # Update the global log_fn variable
+    log_path = log_ring.path # Update the global log_path variable
+    log_exist = True
+    sd_cache.created(log_fn, size)
+    print(TAG+f"created new log file: \"{log_fn}\", generation: {log_ring.gen}")
+    if LOG_DEFLATE and closed_fn is not None and closed_fn != log_fn:
+        log_deflate.queue(closed_fn)
+        deflate_event.set()
+
+# Function to move to the next log file of the ring when the current one is too long
 def rotate_log_if_needed(show: bool = False):
-    global log_path, log_fn, log_size_max, log_obj, log_exist, ref_path, ref_fn, ref_obj, new_log_fn, new_log_path, new_log_obj
+    global log_path, log_fn, log_size_max
     TAG = "rotate_log_if_needed(): "
-    if new_log_fn is not None: # new_log_fn could have be created in the part MAIN
-        if ck_log(new_log_fn):
-            log_fn = new_log_fn # Update the global log_fn variable
-            current_log = new_log_fn # copy the current log filename
-            current_log_path = new_log_path # copy the current log path
-            log_exist = True
-    elif log_exist and log_fn is not None:
-        current_log = log_fn # copy the current log filename
-        current_log_path = get_prefix() + current_log # copy the current log path
-    if current_log:
-        if my_debug:
-            print(TAG+f"current log filename = \"{current_log}\"")
-        if ck_log(current_log):
-            log_size = os.stat(current_log_path)[6]  # File size in bytes
-            if my_debug or show:
-                print(TAG+f"size of \"{current_log}\" is: {log_size} bytes. Max size is: {log_size_max} bytes.")
-            if log_size > log_size_max:
-                if my_debug:
-                    print(TAG+f"Log file: \"{current_log}\" is too long, creating a new log file")
-                create_logfile()
-                if my_debug:
-                    print(TAG+f"Current log file: \"{current_log}\" is closed")
-                    print(TAG+f"Log rotated to new log file: \"{log_path}\"")  # log_fn, log_path changed in create_logfile()
-            else:
-                if my_debug:
-                  print(TAG+"rotate log file not needed yet")
-        else:
-            print(TAG+f"⚠️ log_file: \"{log_fn}\" not found in listdir(\"{get_prefix()}\")")
-            print(TAG+"creating a new log file")
-            create_logfile() # log_fn, log_path changed in create_logfile()
-    else:
-        # log_fn is None
+    if my_debug:
+        print(TAG+f"current log filename = \"{log_fn}\"")
+    log_size = log_file_size(log_fn) if log_fn is not None else -1  # File size in bytes, including the lines buffered
+    if log_size < 0:
+        print(TAG+f"⚠️ log_file: \"{log_fn}\" not found in \"{get_prefix()}\"")
         print(TAG+"creating a new log file")
         create_logfile() # log_fn, log_path changed in create_logfile()
-   
+    else:
+        if my_debug or show:
+            print(TAG+f"size of \"{log_fn}\" is: {log_size} bytes. Max size is: {log_size_max} bytes.")
+        if log_size > log_size_max:
+            current_log = log_fn
+            if my_debug:
+                print(TAG+f"Log file: \"{current_log}\" is too long, moving to the next log file")
+            create_logfile()
+            if my_debug:
+                print(TAG+f"Current log file: \"{current_log}\" is closed")
+                print(TAG+f"Log rotated to log file: \"{log_path}\"")  # log_fn, log_path changed in create_logfile()
+        else:
+            if my_debug:
+              print(TAG+"rotate log file not needed yet")
+
     if log_fn is None:
         print(TAG+"⚠️ Log rotation failed:")
 
@@ -751,90 +707,23 @@ def rotate_log_if_needed(show: bool = False):
 # but the code is structured to allow for easy integration into a larger system.
 TAG = "main(): "
 my_list = None 
-try:
-    # Note: os.listdir('/sd') and os.listdir('/sd/') have the same result! 
-    # Check the existance of a reference file
-    # in which we save the file name of the latest log file created
-    if ref_file_exists():
-        # Reference file exists;   
-        # File exists; open for appending
-        active_log_fn = None
-        active_log_path = None
-        active_log_exist = False
-        ref_exist = True
-        ref_size = os.stat(ref_path)[6]  # File size in bytes
-        if my_debug:
-            print(TAG+f"ref file: \"{ref_fn}\" exists. Size: {ref_size} bytes")
-        if ref_size > 0:
-            nr_log_files = pr_ref()
-            if my_debug:
-              print(TAG+f"Number of log files listed in reference file: {nr_log_files}")
-            if nr_log_files > 0:
-                # read the log filename from the reference file
-                active_log_fn = get_active_log_filename()  # Get the active log filename from the reference file
-                # print(TAG+f"Active log filename extracted from reference file: \"{log_fn}\"")
-                if active_log_fn is None:
-                    # No log filename found in the reference file
-                    print(TAG+f"⚠️ No active log filename found in the reference file: \"{ref_fn}\"")
-                else:
-                    # Check if the active log file exists
-                    if ck_log(active_log_fn):
-                        active_log_path = get_prefix() + log_fn
-                        active_log_exist = True
-               
-                # If the active log file exists, we can use it
-                # Otherwise, we create a new log file
-                if active_log_exist:
-                    if my_debug:
-                      print(TAG+f"⚠️ Active log file: \"{active_log_fn}\" does exist in the directory: \"{get_prefix()}\"")
-                    active_log_path = get_prefix() + active_log_fn
-                    active_log_size = os.stat(active_log_path)[6]  # File size in bytes 
-                    log_fn = active_log_fn  # Update the global log_fn variable
-                    log_path = active_log_path  # Update the global log_path variable
-                else:
-                    print(TAG+f"⚠️ Active log file: \"{active_log_fn}\" does not exist in the directory: \"{get_prefix()}\"")
-                    print(TAG+f"creating a new log file")
-                
-                    active_log_exist = False
-                    active_log_path = None
-                    create_logfile()
-        else:
-            # There is no last log filename in the ref file.
-            # Create a new log file and add to the ref file
-            if log_fn and ck_log(log_fn):
-                log_path = get_prefix() + log_fn
-                pass  # The log file exists, so we do not need to create a new one
-            else:
-                log_fn = new_logname() # "mqtt_log_{}.txt".format(get_iso_timestamp())
-                log_path = get_prefix() + log_fn
-            try:
-                if ref_obj:
-                    ref_obj.close()
-                with open(ref_path, 'w') as ref_obj:
-                    ref_obj.write(log_fn) # Add the log filename to the ref file
-            except OSError as e:
-                print(TAG+f"⚠️ OSError: {e}")
-    else:
-        # ref_fn does not exist; create and write header
-        # First:  create a new log filename
-        # Second: add the log filename to the ref file
-        log_fn = new_logname() # "mqtt_log_{}.txt".format(get_iso_timestamp())
-        log_path = get_prefix() + log_fn
-        try:
-            if ref_obj:
-                ref_obj.close()
-            with open(ref_path, 'w') as ref_obj:
-                ref_obj.write('--- Reference file created on: {} ---\n'.format(get_iso_timestamp()))
-                ref_obj.write(log_fn) # And add the log filename to the ref file
-            ref_exist = True
-            if not my_debug:
-                print(TAG+f"reference file: \"{ref_path}\" created")
-                print(TAG+f"current log filename: \"{log_fn}\" added to ref file")
-        except OSError as e:
-            print(TAG+f"⚠️ OSError: {e}")
-        # rotate_log_if_needed() # create a new log file and add it to th ref file
-except OSError as e:
-    print(TAG+f"⚠️ OSError occurred: {e}")
+# The active log file is read from the header file of the log ring, the directory is not listed.
+# The first line of the log file has to have the same generation, otherwise the next log file is started
+if log_ring.load() and log_ring.slot_gen(log_ring.active) == log_ring.gen:
+    log_fn = log_ring.name()
+    log_path = log_ring.path
+    log_exist = True
+    if not my_debug:
+        print(TAG+f"log ring: {log_ring.stats()}")
+else:
+    create_logfile()
+if LOG_DEFLATE and log_deflate.available:
+    # Compress the closed log files of which the compression was interrupted by a reset
+    for fn in sd_cache.names("mqtt_log_", ".gz.tmp"):
+        sd_cache.remove(fn)
+    for slot in range(log_ring.slots):
+        if slot != log_ring.active and sd_cache.exists(log_ring.name(slot)):
+            log_deflate.queue(log_ring.name(slot))
     
 def timestamp():
     t = time.localtime()
@@ -845,6 +734,8 @@ def timestamp():
     return tStr
  
 # Add data to log file
+# The line is added to the buffer of log_writer, that keeps the log file open (see lib/log_writer.py).
+# log_task() writes the buffer to the file at the latest after LOG_FLUSH_MS
 def add_to_log(txt:str = ""):
     global log_exist, log_path, log_fn, log_obj, log_size_max
     TAG = "add_to_log(): "
@@ -857,27 +748,18 @@ def add_to_log(txt:str = ""):
         return
     if isinstance(txt, str):
         if len(txt) > 0:
-            try:
-                size = os.stat(log_path)[6]  # File size in bytes
-            except OSError as e:
-                    print(TAG+f"⚠️ error while calling os.stat() {e}")
-                    return
-            if size >= log_size_max:
-                rotate_log_if_needed() # check if we need to create a new log file
-            
-            if log_obj:
-                log_obj.close()
-            if ck_log(log_fn):
-                try:
-                    ts = timestamp()
-                    with open(log_path, 'a') as log_obj:  # 'a' for append mode
-                        log_obj.write('\n '+ ts + " " + txt)  # Add received msg to file /sd/mqtt_log.txt
-                    if my_debug:
-                        print(TAG+f"data: \"{txt}\" appended successfully to the log file.")
-                except OSError as e:
-                    print(TAG+f"⚠️ error while trying to open or write to the log file: {e}")
-            else:
+            if log_writer.path != log_path and not log_writer.open(log_path):
                 print(TAG+f"⚠️ log file: \"{log_path}\" does not exist. Unable to add: \"{txt}\"")
+                return
+            if log_writer.size >= log_size_max:
+                rotate_log_if_needed() # check if we need to create a new log file
+                if log_writer.path != log_path and not log_writer.open(log_path):
+                    print(TAG+f"⚠️ log file: \"{log_path}\" does not exist. Unable to add: \"{txt}\"")
+                    return
+            ts = timestamp()
+            if log_writer.write('\n '+ ts + " " + txt):  # Add received msg to file /sd/mqtt_log.txt
+                if my_debug:
+                    print(TAG+f"data: \"{txt}\" appended successfully to the log file.")
     else:
         print(TAG+f"⚠️ parameter txt needs to be of type str, received a type: {param_type}")
 
@@ -890,17 +772,104 @@ payload_txt = "Waiting for Messages..."
 last_update_time = time.time()
 MESSAGE_DISPLAY_DURATION = 20  # Duration to display each message in seconds
 
-# WiFi setup
-
-# Eventually (if needed)
-ssid = secrets['wifi']['ssid']
-#password = secrets['wifi']['password']
+# Queue of received messages, filled by mqtt_callback() and drained in the loop() part.
+# Control topics (lights toggle, color and display color inc/dec) have their own lane, handled before the telemetry lane
+MSG_CTL_QUEUE_CAPACITY = 8  # number of messages in the control lane
+MSG_QUEUE_CAPACITY = 16     # number of messages in the telemetry lane
+MSG_QUEUE_POLICY = DROP_TOPIC  # when full: DROP_OLDEST, DROP_NEWEST or DROP_TOPIC (drop older msg of same topic)
+msg_queue = MsgLanes((MSG_CTL_QUEUE_CAPACITY, MSG_QUEUE_CAPACITY), MSG_QUEUE_POLICY)
+# Queue of records for the messages history file on SD, written by persist_task() when the message lanes are empty
+HIST_QUEUE_CAPACITY = 32  # number of records
+hist_queue = MsgRing(HIST_QUEUE_CAPACITY, DROP_OLDEST)
+PERSIST_DEFER_MS = 50     # recheck interval while messages are waiting in msg_queue
+DEDUP_WINDOW = 8  # number of msgIDs remembered per topic to drop repeated (e.g. retained) messages
+dedup = DedupWindow(DEDUP_WINDOW)
+hw_marks = HighWaterMarks()  # highest msgID handled per topic
+# Messages history file: a ring buffer of fixed size slots, one record per slot. The oldest records are overwritten
+HIST_SLOT_SIZE = 512          # bytes per record. A packed sensor record needs 34 bytes, a JSon record of the previous version ~400
+HIST_CAPACITY_RECORDS = 1440  # number of records, e.g.: one day of sensor messages at one per minute
+HIST_CAPACITY_BYTES = 0       # if > 0: the size of the history file in bytes. Overrules HIST_CAPACITY_RECORDS
+HIST_META_SIZE = 4096         # bytes for the record templates of hist_codec
+HIST_COMMIT_BYTES = 4096      # group commit buffer: records are written to SD per 4096 bytes (8 slots). 0: every record
+HIST_COMMIT_DELAY_MS = 5000   # maximum time a record waits in the group commit buffer
+hist = HistRing(get_prefix() + msg_hist_fn, HIST_SLOT_SIZE,
+                HIST_CAPACITY_BYTES // HIST_SLOT_SIZE if HIST_CAPACITY_BYTES > 0 else HIST_CAPACITY_RECORDS,
+                HIST_META_SIZE, HIST_COMMIT_BYTES)
+if not hist.open():
+    print(TAG+f"Created messages history file: \"{msg_hist_fn}\", {hist.stats()}")
+codec = HistCodec(hist)  # packs the records, with the templates read from the meta area of the history file
+try:
+    if not sd_cache.exists(msg_hist_json_fn):
+        raise OSError(2)  # ENOENT: nothing to import
+    # The progress is saved in msg_hist_json_fn + ".pos", an interrupted import continues after a restart
+    n = hist.import_json_lines(get_prefix() + msg_hist_json_fn, get_prefix() + msg_hist_json_fn + ".pos")
+    sd_cache.rename(msg_hist_json_fn, msg_hist_json_fn + ".old")
+    sd_cache.remove(msg_hist_json_fn + ".pos")
+    print(TAG+f"Imported {n} records from \"{msg_hist_json_fn}\" into \"{msg_hist_fn}\"")
+except OSError:
+    pass # nothing to import
+
+# Generator of the records of the messages history file, as dicts
+def hist_records(newest_first: bool = False):
+    for seq, t, topic_idx, kind, data in hist.records(newest_first):
+        record = codec.decode(kind, data, t, topic_idx)
+        if record is not None:
+            yield record
+
+hist_index = HistIndex(hist, get_prefix() + msg_hist_idx_fn)
+if not hist_index.load():
+    print(TAG+f"Building \"{msg_hist_idx_fn}\" from {hist_index.rebuild()} records in \"{msg_hist_fn}\"")
+    hist_index.save()
+
+# Generator of the records of topic_idx (None: all topics) received from uxTime t0 to t1 (inclusive), as dicts
+def hist_range(topic_idx: int = None, t0: int = 0, t1: int = 0xFFFFFFFF):
+    for seq, t, idx, kind, data in hist_index.range(t0, t1, topic_idx):
+        record = codec.decode(kind, data, t, idx)
+        if record is not None:
+            yield record
+
+# Generator of the n most recent records of topic_idx (None: all topics), newest first, as dicts
+def hist_latest(topic_idx: int = None, n: int = 1):
+    for seq, t, idx, kind, data in hist_index.latest(n, topic_idx):
+        record = codec.decode(kind, data, t, idx)
+        if record is not None:
+            yield record
+
+# The record of topic_idx that was the latest at uxTime t, e.g.: what was the temperature at 03:00. None if not found
+def hist_at(topic_idx: int, t: int) -> dict:
+    rec = hist_index.at(t, topic_idx)
+    if rec is None:
+        return None
+    return codec.decode(rec[3], rec[4], rec[1], rec[2])
+
+# Rollups of the sensor readings per minute, hour and day, one file per tier. See ROLLUP_TIERS in lib/rollup.py
+ROLLUP_COMMIT_BYTES = 640  # group commit buffer of each tier: 8 buckets
+rollups = Rollups(get_prefix(), ROLLUP_TIERS, get_prefix() + msg_roll_fn, 80, ROLLUP_COMMIT_BYTES)
+rollups.open()
+if not rollups.load():
+    print(TAG+f"No open rollup buckets in \"{msg_roll_fn}\"")
+
+latest_index = LatestIndex(get_prefix() + msg_latest_fn)
+if not latest_index.load():
+    print(TAG+f"Building \"{msg_latest_fn}\" from {latest_index.rebuild(hist_records())} records in \"{msg_hist_fn}\"")
+
+# Time series of the sensor readings: blocks of ~80 readings in one slot of TS_SLOT_SIZE bytes
+TS_SLOT_SIZE = 512
+TS_CAPACITY_BLOCKS = 720  # ~40 days of one sensor topic at one message per minute
+ts_store = TsStore(get_prefix() + msg_ts_fn, TS_SLOT_SIZE, TS_CAPACITY_BLOCKS)
+ts_store.open()
+# The readings of the blocks that were not sealed yet are added again from the messages history file
+for hdlr in dispatcher.handlers:
+    if hdlr.kind == KIND_SENSOR:
+        for record in hist_range(hdlr.idx, ts_store.last_t(hdlr.idx) + 1):
+            ts_store.add_reads(hdlr.idx, record["t"], record["payload"])
+if not my_debug:
+    print(TAG+f"time series: {ts_store.stats()}")
+RENDER_TICK_MS = 500  # minimum time between two draws of a received message. Newer messages replace waiting ones
+coalescer = Coalescer(RENDER_TICK_MS)
+MQTT_RECV_BUFFER = 1024  # bytes. Payloads are read into this buffer and decoded from there. The METAR payloads are the largest
 
-print(TAG+"Connecting to WiFi...")
-wifi = presto.connect()  # Ensure this is configured for your network
-print(TAG+"WiFi connected.")
-wifi_connected = True
-add_to_log("WiFi connected to: {}".format(ssid))
+snapshot = StateSnapshot(get_prefix() + presto_state_fn)
 
 msg_drawn = False
 
@@ -914,16 +883,14 @@ def list_logfiles():
     list_log_path = ""
 
     try:
-        files = os.listdir(get_prefix())
-        log_files = [f for f in files if f.startswith(list_log_prefix) and f.endswith('.txt')]
-        files = None  # Clear memory
+        log_files = sd_cache.names(list_log_prefix, '.txt') + sd_cache.names(list_log_prefix, '.txt.gz')
         # do_line()
         cnt = 0
         if my_debug:
           print(TAG+"MQTT log files:")
         if err_log_present:
             cnt +=1
-            log_size = os.stat(err_log_path)[6]
+            log_size = sd_cache.size(err_log_fn)
             if my_debug:
               print("{:2d}) {}, size {} bytes".format(cnt, err_log_fn, log_size), end='\n')
         for fname in log_files:
@@ -932,7 +899,7 @@ def list_logfiles():
             #print(TAG+f"fname = \"{fname}\"")
             #if ck_log(fname):
             list_log_path = get_prefix() + fname
-            log_size = os.stat(list_log_path)[6]
+            log_size = log_file_size(fname)
             if my_debug:
               print("{:2d}) {}, size {} bytes".format(cnt, fname, log_size), end='\n')
         if my_debug:
@@ -945,54 +912,27 @@ def list_logfiles():
     except OSError as e:
         print(TAG+"⚠️ Error accessing directory:", e)
 
+# Delete the log files of the previous versions ("mqtt_log_<timestamp>.txt") and their reference file.
+# The log files of the ring (see lib/log_ring.py) are kept
 def del_logfiles():
-    global ref_fn, ref_path, ref_obj, log_fn
     TAG = "del_logfiles(): "
-    
-    log_dir = get_prefix()
-    t = time.localtime()
-    # year, month, day = t[0], t[1], t[2]
-    # Or even more compactly:
-    yy, mo, dd, *_ = time.localtime()
-
-    print(TAG+f"log_dir = {log_dir}")
-    log_pfx = "mqtt_log_" + str(yy) + "-" + "0" + str(mo) if mo < 10 else str(mo)  # + "-" + "0" + str(dd) if dd < 10 else str(dd)  # Change to desired year-month-day
-    print(TAG+f"log_pfx = {log_pfx}")
     deleted_files = []
+    files = sd_cache.names("mqtt_log_2", ".txt") # e.g.: "mqtt_log_2025-09-07T204748.txt"
+    if sd_cache.exists(legacy_ref_fn):
+        files.append(legacy_ref_fn)
+    for fname in files:
+        try:
+            sd_cache.remove(fname)
+            deleted_files.append(fname)
+        except OSError as e:
+            print(TAG+f"⚠️ Failed to delete: {fname}, error: {e}")
 
-    try:
-        files = os.listdir(log_dir)
-        for fname in files:
-            if fname.startswith(log_pfx) and fname.endswith('.txt'):
-                if my_debug:
-                    print(TAG+f"fname = \"{fname}\", log_fn = \"{log_fn}\"")
-                if fname in log_fn:
-                    print(TAG+f"We\'re not deleting the current logfile: \"{log_fn}\"")
-                    continue
-                full_path = '{}/{}'.format(log_dir, fname)
-                try:
-                    os.remove(full_path)
-                    deleted_files.append(fname)
-                except OSError as e:
-                    print(TAG+f"⚠️ Failed to delete: {fname}, error: {e}")
-
-        if len(deleted_files) > 0:
-            print(TAG+"Deleted files:")
-            for f in deleted_files:
-                print("  ✔", f)
-            
-            if ref_obj:
-                ref_obj.close()
-            with open(ref_path, 'w') as ref_obj:  # Make empty the ref file
-                pass
-            ref_size = os.stat(ref_path)[6]  # File size in bytes
-            if my_debug:
-                print(TAG+f"check ref file: \"{ref_fn}\" after making empty. Size: {ref_size} bytes")
-        else:
-            print(TAG+f"⚠️ no logfile(s) found starting with \"{log_pfx}\" and ending with \".txt\"")
-    
-    except OSError as e:
-        print(TAG+f"⚠️ Could not list directory: {log_dir} for deletion. Error: {e}")
+    if len(deleted_files) > 0:
+        print(TAG+"Deleted files:")
+        for f in deleted_files:
+            print("  ✔", f)
+    else:
+        print(TAG+f"⚠️ no log file(s) of previous versions found")
         
 def save_broker_dict() -> int:
     global sBroker, sysBrokerDictModified
@@ -1025,60 +965,44 @@ def broker_topic_in_db() -> int:
             if "retained messages/count" == short_key: # correct this faulty topic (containing a space)
                 faulty_key = short_key
                 short_key = "messages/retained/count"
-                if not my_debug:
-                    print(TAG+f"changing faulty key: {faulty_key} into: {short_key}")
+                if log_rx.inf:
+                    log_rx.info(TAG+"changing faulty key: {} into: {}", faulty_key, short_key)
             if short_key in sys_broker_dict.keys():
                 ret = 1
                 sysBrokerDictModified = True
                 old_value = sys_broker_dict[short_key]
-                if my_debug:
-                    print(TAG+f"topic_rcvd = \"{topic_rcvd}\", key = \"{short_key}\", old value = {old_value}")
+                if log_rx.dbg:
+                    log_rx.debug(TAG+"topic_rcvd = \"{}\", key = \"{}\", old value = {}", topic_rcvd, short_key, old_value)
                 sys_broker_dict[short_key] = payload
                 new_value = sys_broker_dict[short_key]
-                if my_debug:
-                    print(TAG+f"topic_rcvd = \"{topic_rcvd}\", key = \"{short_key}\", value updated to: {new_value}")
+                if log_rx.dbg:
+                    log_rx.debug(TAG+"topic_rcvd = \"{}\", key = \"{}\", value updated to: {}", topic_rcvd, short_key, new_value)
             else:
                 sys_broker_dict[short_key] = payload
                 sysBrokerDictModified = True
                 ret = 1
         else:
-            print(TAG+f"msg topic: \"{topic_rcvd}\", payload empty? : {payload}")
+            if log_rx.inf:
+                log_rx.info(TAG+"msg topic: \"{}\", payload empty? : {}", topic_rcvd, payload)
             
         if sysBrokerDictModified:
-            if my_debug:
-                print(TAG+f"topic_rcvd = \"{topic_rcvd}\", short_key \"{short_key}\", added to: sys_broker_dict")
+            if log_rx.dbg:
+                log_rx.debug(TAG+"topic_rcvd = \"{}\", short_key \"{}\", added to: sys_broker_dict", topic_rcvd, short_key)
     return ret 
 
-def topic_in_lst() -> int:
-    if topic_rcvd.startswith("$SYS"):
-        return 1  # Accept all topic_rcvd starting with '$SYS'
+# Return the TopicHandler for topic_rcvd or None if not subscribed to
+def topic_in_lst():
     TAG = "topic_in_lst(): "
-    ret = -1
-    topic_idx = 0
-    le = len (TOPIC_DICT)
-    if my_debug:
-        print(TAG+f"TOPIC_DICT = {TOPIC_DICT.items()}")
-    if le > 0:
-        for k,v in TOPIC_DICT.items():
-            if my_debug:
-                print(TAG+f"v = {v}, topic_rcvd = {topic_rcvd}")
-            if v == topic_rcvd:
-                ret = k
-                break
-    if my_debug:
-        print(TAG+f"topic received: \"{topic_rcvd}\" ", end='')
-    if ret < 0:
-        if my_debug:
-            print(" not ", end='')
-    if my_debug:
-        print("found in TOPIC_DICT")
-        print(TAG+f"return value = {ret}")
+    ret = dispatcher.match(topic_rcvd)
+    if log_rx.dbg:
+        log_rx.debug(TAG+"topic received: \"{}\" {}found by the dispatcher", topic_rcvd, "not " if ret is None else "")
+        log_rx.debug(TAG+"return value = {}", ret)
     return ret
 
 
 # MQTT callback function
 def mqtt_callback(topic: str, msg: bytes):
-    global topic_rcvd, msg_rcvd, payload, last_update_time, topic_idx, redraw_done, sensor_obj, \
+    global topic_rcvd, msg_rcvd, payload, last_update_time, topic_idx, topic_hdlr, redraw_done, sensor_obj, \
         toggle_obj, amb_obj, disp_obj, metar_obj, lightsDclrChanged, ts, wx_test
     TAG = "mqtt_callback(): "
     wx = False # only for weather topic
@@ -1096,66 +1020,72 @@ def mqtt_callback(topic: str, msg: bytes):
             \"acc\":{\"st\": 1, \"cr\": 1201}, \
             \"metar\":{\"raw\":\"METAR LPPT 291930Z 34012KT CAVOK 30/10 Q1014\"}}",'utf-8')
 
-            topic = TOPIC_DICT[6] # "weather/PL2XLW/metar"
+            topic = dispatcher.first(KIND_METAR).topic # "weather/PL2XLW/metar"
         
-        if my_debug:
-            print(TAG+"MQTT msg: ", repr(msg))
-            print(TAG+f"topic = {topic}, type(topic) = {type(topic)}")
+        if log_rx.dbg:
+            log_rx.debug(TAG+"MQTT msg: {}", repr(msg))
+            log_rx.debug(TAG+"topic = {}, type(topic) = {}", topic, type(topic))
         
         if isinstance(topic, bytes):
             topic_rcvd = topic.decode("utf-8")
         elif isinstance(topic, str):
             topic_rcvd = topic # same
-        if my_debug:
-            print(TAG+f"topic_rcvd = {topic_rcvd}")
-        n =  topic_in_lst()
-        if n < 0:
-            if not my_debug:
-                print(TAG+f"⚠️ topic received {topic_rcvd} not subscribed to. Skipping...")
+        if log_rx.dbg:
+            log_rx.debug(TAG+"topic_rcvd = {}", topic_rcvd)
+        hdlr = topic_in_lst()
+        if hdlr is None:
+            if log_rx.inf:
+                log_rx.info(TAG+"⚠️ topic received {} not subscribed to. Skipping...", topic_rcvd)
             return
         else:
-            topic_idx = n
-            if my_debug:
-                print(TAG+f"topic_idx set to: {topic_idx}")
+            topic_hdlr = hdlr
+            topic_idx = hdlr.idx
+            if log_rx.dbg:
+                log_rx.debug(TAG+"topic_idx set to: {}", topic_idx)
       
-        if not my_debug:
-            print(TAG+f"type(msg): {type(msg)}")
+        if log_rx.inf:
+            log_rx.info(TAG+"type(msg): {}", type(msg))
 
-        if isinstance(msg, bytes):
-            msg_decd = msg.decode("utf-8")
-            payload = ujson.loads(msg_decd)
-            if not my_debug:
-                print(TAG+f"payload: {payload}")
+        if isinstance(msg, (bytes, bytearray, memoryview)):
+            # Decode straight from the receive buffer, only the sections the payload schema of this topic needs
+            payload = None
+            if hdlr.keys:
+                payload = loads_sections(msg, hdlr.keys)
+            if payload is None:  # e.g.: the integer value of a $SYS topic
+                payload = ujson.loads(msg)
+            if log_rx.inf:
+                log_rx.info(TAG+"payload: {}", payload)
             if isinstance(payload, dict):
                 head = payload.get("hd")
-            if my_debug:
-                print(TAG+f"head: {head}")
+            if log_rx.dbg:
+                log_rx.debug(TAG+"head: {}", head)
       
-        if my_debug:
-            print(TAG+f"type(payload): {type(payload)}")
+        if log_rx.dbg:
+            log_rx.debug(TAG+"type(payload): {}", type(payload))
             #print(TAG+"MQTT payload: ", repr(payload))
       
-        if topic_rcvd.startswith("sensors"):
+        if hdlr.kind == KIND_SENSOR:
             pass
-        elif topic_rcvd.startswith("lights"):
+        elif hdlr.kind in (KIND_TOGGLE, KIND_AMB, KIND_DISP):
             pass
-        elif topic_rcvd.startswith("weather"):
+        elif hdlr.kind == KIND_METAR:
             wx = True
-            if my_debug:
-              print(TAG+f"wx payload = {payload}. type(payload)= {type(payload)}")
+            if log_rx.dbg:
+              log_rx.debug(TAG+"wx payload = {}. type(payload)= {}", payload, type(payload))
         
-        elif topic_rcvd.startswith("$SYS"):
-            if my_debug:
-                print(TAG+f"$SYS msg, type(payload): {type(payload)}")
+        elif hdlr.kind == KIND_SYS:
+            if log_rx.dbg:
+                log_rx.debug(TAG+"$SYS msg, type(payload): {}", type(payload))
             if isinstance(payload, int):
                 payloadStr = str(payload)
             if broker_topic_in_db():
-                if not my_debug:
-                    print(TAG+f"$SYS topic_rcvd: \"{topic_rcvd}\", payloadStr: \"{payloadStr}\"")
+                if log_rx.inf:
+                    log_rx.info(TAG+"$SYS topic_rcvd: \"{}\", payloadStr: \"{}\"", topic_rcvd, payloadStr)
                 return
         else:
             payload = None
-            print(TAG+f"Incomplete message \"{msg}\" received, skipping.")
+            if log_rx.inf:
+                log_rx.info(TAG+"Incomplete message \"{}\" received, skipping.", msg)
             return
 
         if len(head) > 0:
@@ -1164,42 +1094,48 @@ def mqtt_callback(topic: str, msg: bytes):
             ts = datetime_empty
         if wx:
             use_localTime = False
-        if not my_debug:
-            print("\n"+TAG+f"Received a mqtt message on topic: \"{topic_rcvd}\", timestamp: {ts} = ", end='')
-            print(f"{unixToIso8601(ts, use_localTime)}") # all types of messages, convert ts to local time
+        if log_rx.inf:
+            log_rx.info("\n"+TAG+"Received a mqtt message on topic: \"{}\", timestamp: {} = {}", topic_rcvd, ts, unixToIso8601(ts, use_localTime)) # all types of messages, convert ts to local time
             #if wx:
             #    print(f"{unixToIso8601(ts, use_localTime)}")
             #else:
             #    print(f"{convert_to_dtStr(ts)}")
-        if my_debug:
-            print(f"msg: {msg}")
+        if log_rx.dbg:
+            log_rx.debug("msg: {}", msg)
+        # Drop a message already received, e.g.: a retained message delivered again after a reconnect
+        value = None
+        if hdlr.kind in (KIND_TOGGLE, KIND_AMB, KIND_DISP):
+            ctl = payload.get(hdlr.key)
+            if isinstance(ctl, dict):
+                value = ctl.get("v")
+        if dedup.check(hdlr, ts, value):
+            if log_rx.inf:
+                log_rx.info(TAG+"🔁 duplicate message on topic: \"{}\", msgID: {}. Skipped", topic_rcvd, ts)
+            return
         if len(msg) > 0:
-            print(TAG+f"length of received mqtt message: {len(msg)}")
+            if log_rx.inf:
+                log_rx.info(TAG+"length of received mqtt message: {}", len(msg))
+            if msg_queue.push(hdlr, topic_rcvd, payload, ts):
+                dedup.mark(hdlr, ts, value) # only a queued message counts as received
+            else:
+                log_rx.warn(TAG+"⚠️ message queue full. Message dropped. {}", msg_queue.stats())
             # ------------------ MESSAGE RECEIVE FLAG ----------------------------+
-            msg_rcvd = True #                                                     |
+            msg_rcvd = len(msg_queue) > 0 #                                      |
             # --------------------------------------------------------------------+
-            # If a new message received, switch off an eventually active lightsDclrChanged flag
-            if topic_rcvd.startswith("lights") and (topic_rcvd.endswith("dclr_dec") or topic_rcvd.endswith("dclr_inc")):
-                print(TAG+f"display color change message received")
-                lightsDclrChanged = True
-                disp_obj.disp_color_changed = lightsDclrChanged  # update the flag in the disp_obj
-            else:
-                lightsDclrChanged = False
-                disp_obj.disp_color_changed = lightsDclrChanged  # update the flag in the disp_obj
-        if my_debug:
+        if log_rx.dbg:
             if wx_test:
                 raw_msg = payload
             else:
-                raw_msg = msg.decode('utf-8')
-            print(TAG+f"Decoded raw_msg length: {len(raw_msg)}")
+                raw_msg = str(bytes(msg), 'utf-8')
+            log_rx.debug(TAG+"Decoded raw_msg length: {}", len(raw_msg))
             if isinstance(raw_msg, dict):
-                print(TAG+f"raw_msg keys: {raw_msg.keys()}")
-            print(TAG+f"raw_msg: {raw_msg}") # may reveal the broken JSON
+                log_rx.debug(TAG+"raw_msg keys: {}", raw_msg.keys())
+            log_rx.debug(TAG+"raw_msg: {}", raw_msg) # may reveal the broken JSON
     except ValueError as e:
-        print(TAG+f"⚠️ ValueError while decoding JSon msg: {e}")
+        log_rx.warn(TAG+"⚠️ ValueError while decoding JSon msg: {}", e)
         raise RuntimeError
     except Exception as e:
-        print(TAG+"⚠️ Unhandled exception:", str(e))
+        log_rx.error(TAG+"⚠️ Unhandled exception: {}", e)
         raise RuntimeError
 
 def uxMinimum(yr1970: bool = True):
@@ -1273,95 +1209,52 @@ def format_sensor_value(payload, key):
     value = round(float(payload[key]["v"]), 2)
     return f"{svDict[key]}: {value} {unit}"
 
-def save_to_obj(topIdx: int = 0, topic: str = "", payload: dict = {}) -> bool:
-    global sensor_obj, toggle_obj, amb_obj, disp_obj, metar_obj
+def save_to_obj(hdlr = None, topic: str = "", payload: dict = {}) -> bool:
     TAG = "save_to_obj(): "
     ret = False
     # Copy doc to respective class object
-    if topIdx < 0 or topIdx >= topicIdx_max:
-        print(TAG+f"⚠️ param topicIdx out of range. Exiting...")
+    if hdlr is None or hdlr.obj is None:
+        log_msg.warn(TAG+"⚠️ param hdlr has no entity object. Exiting...")
         return ret
     #if len(topic) == 0:
     #    print(TAG+f"⚠️ param topic is empty. Exiting...")
     #    return ret
     
     if not isinstance(payload, dict):
-        print(TAG+f"⚠️ param payload is not a dict. Exiting...")
+        log_msg.warn(TAG+"⚠️ param payload is not a dict. Exiting...")
         return ret
     else:
         if len(payload) > 0:
             head = payload.get("hd")
     
-    if topIdx == 0:
-        obj = sensor_obj
-        pl =  payload.get("reads")
-    elif topIdx == 1:
-        obj = toggle_obj
-        pl = payload.get("toggle")
-    elif topIdx in (2,3):
-        obj = amb_obj
-        if topIdx == 2:
-            pl = payload.get("colorInc")
-        elif topIdx == 3:
-            pl = payload.get("colorDecc")
-    elif topIdx in (4,5):
-        obj = disp_obj
-        if topIdx == 4:
-            pl = payload.get("dclrInc")
-        elif topIdx == 5:
-             pl = payload.get("dclrDec")
-    elif topIdx == 6:
-        obj = metar_obj
-        pl = payload.get("metar")
-        if my_debug:
-            print(TAG+f"payload.get(\'metar\') = {pl}")
-
-    if my_debug:
-        print(TAG+f"type(obj) = {type(obj)}")
+    obj = hdlr.obj
+    pl = payload.get(hdlr.key) # e.g.: "reads", "toggle", "colorInc", "dclrDec" or "metar"
+    if log_msg.dbg:
+        log_msg.debug(TAG+"payload.get(\'{}\') = {}", hdlr.key, pl)
+        log_msg.debug(TAG+"type(obj) = {}", type(obj))
         
     obj.head = head
     obj.topic = topic
-    obj.topicIdx = topIdx
+    obj.topicIdx = hdlr.idx
     obj.payload = pl
     
     return True
 
-def pr_obj(topIdx: int = 0):
-    global sensor_obj, toggle_obj, amb_obj, disp_obj, metar_obj
+def pr_obj(hdlr = None):
     TAG = "pr_obj(): "
-    obj = None
-    t = ""
-    # Copy doc to respective class object
-    if topIdx < 0 or topIdx >= topicIdx_max:
-        print(TAG+f"⚠️ param topIdx out of range. Exiting...")
+    if hdlr is None or hdlr.obj is None:
+        log_msg.warn(TAG+"⚠️ param hdlr has no entity object. Exiting...")
         return False
-    
-    if topIdx == 0:
-        obj = sensor_obj
-        t = "sensor"
-  
-    elif topIdx == 1:
-        obj = toggle_obj
-        t = "toggle"
-
-    elif topIdx in (2,3):
-        obj = amb_obj
-        t = "amb"
- 
-    elif topIdx in (4,5):
-        obj = disp_obj
-        t = "disp"
-
-    elif topIdx == 6:
-        obj = metar_obj
-        t = "metar"
-
-    print(TAG+f"type({t}_obj)    = {type(obj)}")
-    print(TAG+f"{t}_obj.topicIdx = {obj.topicIdx}")
-    print(TAG+f"{t}_obj.topic    = {obj.topic}")
-    print(TAG+f"{t}_obj.head     = {obj.head}")
-    print(TAG+f"{t}_obj.acc      = {obj.acc}")
-    print(TAG+f"{t}_obj.payload  = {obj.payload}")
+    obj = hdlr.obj
+    t = hdlr.kind_name # "sensor", "toggle", "amb", "disp" or "metar"
+
+    if log_msg.inf:
+        log_msg.info(TAG+"type({}_obj)    = {}", t, type(obj))
+        log_msg.info(TAG+"{}_obj.topicIdx = {}", t, obj.topicIdx)
+        log_msg.info(TAG+"{}_obj.topic    = {}", t, obj.topic)
+        log_msg.info(TAG+"{}_obj.head     = {}", t, obj.head)
+        log_msg.info(TAG+"{}_obj.acc      = {}", t, obj.acc)
+        log_msg.info(TAG+"{}_obj.payload  = {}", t, obj.payload)
     
 
 def get_disp_color_index(color: int=0) -> int:
@@ -1406,672 +1299,267 @@ def splitMetarforDisplay(metarData, max_chars_per_line=max_chr_per_line) -> list
     return lines
 
 def split_msg():
-    global topic_rcvd, payload, payloadLst, Publisher_ID, Publisher_ID0, Publisher_ID1, lightsColorIdx, lights_ON, lights_ON_old, lightsColorMax, \
+    global topic_rcvd, payload, Publisher_ID, Publisher_ID0, Publisher_ID1, lightsColorIdx, lights_ON, lights_ON_old, lightsColorMax, \
         lightsColorMin, lightsDclrIdx, lightsDclrMax, lightsDclrMin, lightsDclrChanged, CURRENT_COLOR, datetime_rcvd, hh_rcvd, \
-        sensor_obj, toggle_obj, amb_obj, disp_obj, metar_obj
+        topic_hdlr
     
     TAG = "split_msg(): "
-    topic_found = False
     wx = None
     
     try:
-        topicIdx = -1
-        for k,v in TOPIC_DICT.items():
-            if topic_rcvd == v:
-                topicIdx = k
-                break
-        if topicIdx >= 0:
-            if my_debug:
-                print(TAG+f"Topic rcvd: \'{topic_rcvd}\' found in TOPIC_DICT: \'{TOPIC_DICT[topicIdx]}\', topicIdx = {topicIdx}")
-            topic_found = True
-        else:
-            print(TAG+f"⚠️ topic rcvd: \'{topic_rcvd}\' not in TOPIC_DICT: \'{TOPIC_DICT.items()}\'")
-        
-        if not topic_found:
-            return 
+        hdlr = topic_hdlr # set in mqtt_callback() by the dispatcher
+        if hdlr is None:
+            log_msg.warn(TAG+"⚠️ topic rcvd: \'{}\' has no topic handler", topic_rcvd)
+            return
+        topicIdx = hdlr.idx
+        kind = hdlr.kind
+        if log_msg.dbg:
+            log_msg.debug(TAG+"Topic rcvd: \'{}\' dispatched to: {}, topicIdx = {}", topic_rcvd, hdlr, topicIdx)
       
-        owner = None
-        device_class = None
         uxTime = None
-        head = {}
                 
         # Step 1. Check if payload is not None
         if payload is None:
-            print(TAG+"⚠️ payload is None, skipping further processing.")
+            log_msg.warn(TAG+"⚠️ payload is None, skipping further processing.")
             return
         
-        if my_debug:
-            print(TAG+f"type global param payload = {type(payload)}")
+        if log_msg.dbg:
+            log_msg.debug(TAG+"type global param payload = {}", type(payload))
         
         # Step 1.1 Check is payload is of type dictionary
         if isinstance(payload, dict):
             # Step 1.2: Check if the payload dictionary is empty
-            le = len(payload)
-            if le > 0:
-                if not my_debug:
-                    print(TAG+f"len(payload) = {len(payload)}")
-                    print(TAG+f"payload.items() = {payload.items()}")
-                # Step 1.3 Get the header nested JSon object      
-                head = payload.get("hd", {})
-                if not isinstance(head, dict):
-                    print(TAG+f"⚠️ head is of type: {type(head)}. Exiting...")
-                    return
-                if my_debug:
-                  print(TAG+f"type(head) = {type(head)}, len(head) = {len(head)}")
-                  print(TAG+f"head = {head}")
-                if topicIdx == 6:
-                  acc = payload.get("acc", {})
-                  if not isinstance(acc, dict):
-                    print(TAG+f"⚠️ acc is of type: {type(acc)}. Exiting...")
-                    return
+            if len(payload) > 0:
+                if log_msg.inf:
+                    log_msg.info(TAG+"len(payload) = {}", len(payload))
+                    log_msg.info(TAG+"payload.items() = {}", payload.items())
             else:
-                print(TAG+"⚠️ Received an empty payload, skipping further processing.")
+                log_msg.warn(TAG+"⚠️ Received an empty payload, skipping further processing.")
                 return
         # When payload is an integer
         elif isinstance(payload, int):  # This happens with $SYS topic messages
-            if not my_debug:
-                print(TAG+f"payload = {payload}") # . Line 1359")
-        
-        payloadLst = []
-        datetime = datetime_empty
-        
-        if topicIdx == 6:
-            my_status = ""
-            my_credits = 0
-            if not my_debug:
-              print(TAG+f"type(acc) = {type(acc)}")
-            if isinstance(acc, dict):
-              if not my_debug:
-                print(TAG+f"acc.items() = {acc.items()}")
-              if len(acc) > 0:
-                for key, value in acc.items():
-                  if my_debug:
-                      print(TAG+f"{key}: {value}")
-                  if key == "st":  # account status
-                      my_status = "Active" if value == 1 else "Inactive"
-                      if not my_debug:
-                        print(TAG+f"my_status = {my_status}") #. Line 1367")
-                      lbl_k = key
-                      lbl_v = my_status # Example: 1 or 0
-                      output = {lbl_k: lbl_v}
-                      payloadLst.append(output)
-                  if key == "cr":  # account credits
-                      my_credits = value
-                      if not my_debug:
-                        print(TAG+f"my_credits = {my_credits}") #. Line 1367")
-                      lbl_k = key
-                      lbl_v = my_credits # Example: 1021
-                      output = {lbl_k: lbl_v}
-                      payloadLst.append(output)
-                
-            wx = payload.get("metar", "?")
-            if not my_debug:
-                print(TAG+f"wx = {wx}") #. Line 1502")
-        #if topic_rcvd == TOPIC_DICT[6] # "weather/PL2XLW/metar":
-        #    pass
-        #else:
-        if not isinstance(head, dict):
-            print(TAG+f"⚠️ head is of type: {type(head)}. Exiting...")
+            if log_msg.inf:
+                log_msg.info(TAG+"payload = {}", payload) # . Line 1359")
             return
         else:
-            # Step 2: Pull shared metadata 
-            for key, value in head.items():
-                if my_debug:
-                    print(TAG+f"{key}: {value}")
-                
-                if key == "ow" :
-                    owner = value # was: payload.get("ow", "?")
-                    if owner == "unknown":
-                        Publisher_ID = PUBLISHER_ID0  # if "unknown" we use the definition from secret.json
-                    else:
-                        Publisher_ID = owner  # use the owner from the payload
-                        # Step 2: Pull shared metadata
-                
-                    lbl_k = key
-                    lbl_v = value
-                    output = {lbl_k: lbl_v}
-                    payloadLst.append(output)
-                
-                if key == "de":  # description     
-                    description = value # payload.get("de", "unknown")
-                    lbl_k = key
-                    lbl_v = value # Example: "PC-Lab" or "Lab"
-                    output = {lbl_k: lbl_v}
-                    payloadLst.append(output)
-                
-                if key == "dc":  # device class
-                    lbl_k = key
-                    device_class = value # payload.get("dc", "unknown")
-                    if device_class == "BME280":
-                        lbl_v = device_class
-                    elif device_class == "home":
-                        lbl_v = device_class
-                    elif device_class == "colr":
-                        lbl_v = "color"
-                    elif device_class == "dclr":
-                        lbl_v = "dcolor"
-                    elif device_class == "wx":
-                        lbl_v = "weather"
-                    else:
-                        lbl_v = device_class
-                    output = {lbl_k: lbl_v}
-                    payloadLst.append(output)
-                
-                if key == "sc":
-                    lbl_k = key
-                    state_class = value # payload.get("sc", "unknown") # == "measure":
-                    if state_class == "meas":
-                        state_class = "measurement"
-                    elif state_class == "inc":
-                        state_class = "incr"
-                    elif state_class == "dec":
-                        state_class = "decr"
-                    elif state_class == "ligh":
-                        state_class = "lights"
-                    else:
-                        state_class = "unknown"
-            
-                    lbl_v = state_class
-                    output = {lbl_k: lbl_v}
-                    payloadLst.append(output)
-                
-                if key == "vt":
-                    lbl_k = key
-                    vt = value # payload.get("vt") # "vt" stands for value term
-                    if vt == "f":
-                        lbl_v = "float"
-                    elif vt == "i":
-                        lbl_v = "int"
-                    elif vt == "s":
-                        lbl_v = "str"
-                    elif vt == "b":
-                        lbl_v = "bool"
-                    output = {lbl_k: lbl_v}
-                    payloadLst.append(output)
-                
-                if key == "t":
-                    uxTime = value # payload.get("t", "unknown")
-                
-                    if uxTime <= uxMinimum() or uxTime >= uxMaximum(): # max for 32-bit
-                        uxTimeStr = "invalid"
-                    else:
-                        uxTimeStr = str(uxTime)
-                    
-                    if my_debug:
-                        print(TAG+f"uxTime = {uxTime}")
-                    if uxTime == 0:
-                        datetime = datetime_empty  # Default to 0 if unknown
-                    else: 
-                        #datetime = convert_to_dtStr(uxTime)
-                        datetime = unixToIso8601(uxTime, True) # convert to local time
-                        datetime_rcvd = datetime # make a global copy
-                        if my_debug:
-                            print(TAG+f"datetime = {datetime}")
-                        n = datetime.find("T")
-                        if n >= 0:
-                            timeStr = datetime[n+1:]
-                            if my_debug:
-                                print(TAG+f"timeStr = {timeStr}")
-                            hh_rcvd = int(timeStr[:2]) # make a global copy
-                            if my_debug:
-                                print(TAG+f"hh_rcvd = {hh_rcvd}")
-                                
-                    lbl_k = key
-                    lbl_v = uxTimeStr
-                    output = {lbl_k: lbl_v}
-                    payloadLst.append(output)
-                    
-                    if my_debug:
-                        print(TAG+f"Received msg from: {owner}, timestamp: {uxTime}") # was: "timestamp"
-
-                if my_debug:
-                    print(TAG+f"owner: {owner} [{device_class}], timestamp: {uxTime}")
-          
-        if topicIdx == 0: # sensors/Feath/ambient
-            # Step 3: Extract and flatten "reads"
-            readings = payload.get("reads", {})
-            if readings is not None:
-              if isinstance(readings, dict):
-                # sensor_obj.payload = readings # Store payload <<<=== moved to end of this function
-                for key, data in readings.items():
-                    label = key # key.upper()
-                    value = data.get("v", "??")
-                    unit = data.get("u", "")
-                    
-                    # min_val = data.get("mn", "?")
-                    # max_val = data.get("mx", "?")
-    
-                    lbl_k = None
-                    lbl_v = None
-                    
-                    if label == "t":
-                        t1 = "Temperature: "
-                        lbl_k = "temp"
-                        if vt == "f":
-                            lbl_v = t1 + "{:4.1f} °C".format(value) # + str(value) + " °C"
-                        elif vt == "i":
-                            lbl_v = t1 + str(value) + " °C"
-                        elif vt == "s":
-                            lbl_v = t1 + value + " °C"
-                    elif label == "p":
-                        t1 = "Pressure: "
-                        lbl_k = "pres"
-                        if vt == "f":
-                            lbl_v = t1 + "{:6.1f} {:s}".format(value, unit)
-                        elif vt == "i":
-                            lbl_v = t1 + str(value) + unit
-                        elif vt == "s":
-                            lbl_v = t1 + value + unit
-                    elif label == "a":
-                        t1 = "Altitude: "
-                        lbl_k = "alti"
-                        if vt == "f":
-                            lbl_v = t1 + "{:5.1f} {:s}".format(value, unit)
-                        elif vt == "i":
-                            lbl_v = t1 + str(value) + unit
-                        elif vt == "s":
-                            lbl_v = t1 + value + unit
-                    elif label == "h":
-                        t1 = "Humidity: "
-                        lbl_k = "humi"
-                        if vt == "f":
-                            lbl_v = t1 + "{:5.1f} {:s}".format(value, unit)
-                        elif vt == "i":
-                            lbl_v = t1 + str(value) + unit
-                        elif vt == "s":
-                            lbl_v = t1 + value + unit
-                    output = {lbl_k: lbl_v}
-                    payloadLst.append(output)
-                
-                if not my_debug:
-                    print(TAG+"header fields:")
-                    print(TAG+f"owner:        {owner}")
-                    print(TAG+f"description:  {description}")
-                    print(TAG+f"device_class: {device_class}")
-                    print(TAG+f"state_class:  {state_class}")
-                    print(TAG+f"msgID:        {uxTime}")
-                    #print(TAG+f"in ISO8601:   {convert_to_dtStr(uxTime)}") # show in Local time
-                    print(TAG+f"in ISO8601:   {unixToIso8601(uxTime, True)}") # show in Local time
-                if my_debug:
-                    print(TAG+"Reads fields")
-                    print(f"payloadLst: {payloadLst}")
-                if my_debug:
-                    # Copy the contents of payloadLst to a temperary dict: t_db
-                    t_db = {}
-                    for r in payloadLst:
-                        # print(TAG+f"payloadLst[r] = {r}")
-                        for k,v in r.items():
-                            t_db[k] = v  # Add a key and value to the temporary dict
-                    if len(t_db) > 0:
-                        # print(TAG+f"t_db.items() = {t_db.items()}")
-                        # print(TAG+f"t_db.values() = {t_db.values()}")
-                        for k,v in t_db.items():
-                            print(TAG+f"t_db[{k}] = {v}") # print the contents of the temporary dict
-                
+            if log_msg.inf:
+                log_msg.info(TAG+"payload is {}", type(payload))
+            return
+        
+        # Step 2: Decode the head and the sections of the payload into the record of this topic,
+        #         using the payload schema compiled for this topic handler (see lib/payload_schema.py)
+        rec = hdlr.rec  # fields for draw(), filled in place
+        rec.clear()
+        if not hdlr.decode(payload, rec):
+            log_msg.warn(TAG+"⚠️ head is of type: {}. Exiting...", type(payload.get('hd')))
+            return
+        if log_msg.dbg:
+            for k,v in rec.as_dict().items():
+                log_msg.debug(TAG+"rec.{} = {}", k, v)
+        
+        if rec.ow:
+            if rec.ow == "unknown":
+                Publisher_ID = PUBLISHER_ID0  # if "unknown" we use the definition from secret.json
+            else:
+                Publisher_ID = rec.ow  # use the owner from the payload
+        
+        uxTime = rec.ux
+        if uxTime > 0:
+            datetime_rcvd = unixToIso8601(uxTime, True) # convert to local time. Make a global copy
+            if log_msg.dbg:
+                log_msg.debug(TAG+"datetime = {}", datetime_rcvd)
+            n = datetime_rcvd.find("T")
+            if n >= 0:
+                hh_rcvd = int(datetime_rcvd[n+1:n+3]) # make a global copy
+                if log_msg.dbg:
+                    log_msg.debug(TAG+"hh_rcvd = {}", hh_rcvd)
+        
+        if kind == KIND_SENSOR: # sensors/Feath/ambient
+            if log_msg.inf:
+                log_msg.info(TAG+"header fields:")
+                log_msg.info(TAG+"owner:        {}", rec.ow)
+                log_msg.info(TAG+"description:  {}", rec.de)
+                log_msg.info(TAG+"device_class: {}", rec.dc)
+                log_msg.info(TAG+"state_class:  {}", rec.sc)
+                log_msg.info(TAG+"msgID:        {}", uxTime)
+                log_msg.info(TAG+"in ISO8601:   {}", unixToIso8601(uxTime, True)) # show in Local time
                     
-        elif topicIdx == 1: # lights/Feath/toggle:
-            """ 
-            Example output of code below:
-            split_msg(): toggle payload.keys() = dict_keys(['u', 'mx', 'mn', 'v'])
-            split_msg(): toggle payload.items() = dict_items([('u', 'i'), ('mx', 0), ('mn', 1), ('v', 0)])
-            split_msg():  key =  u, data =  i
-            split_msg():  key = mx, data =  0
-            split_msg():  key = mn, data =  1
-            split_msg():  key =  v, data =  0
-            """
-            toggle_mx_val = None
-            toggle_mn_val = None
-            unit = None
-            value = None
-            toggle = payload.get("toggle", {})  # "toggle":{"v":0,"u":"i","mn":1,"mx":0}
-            if toggle:
-              if isinstance(toggle, dict):
-                # toggle_obj.payload = toggle # Store payload  <<<=== moved to end of this function
-              
-                if my_debug:
-                    print(TAG+f"toggle payload.keys() = {toggle.keys()}")
-                    print(TAG+f"toggle payload.items() = {toggle.items()}")
-                
-                for key, data in toggle.items():
-                    if my_debug:
-                        if isinstance(data, int):
-                            print("{:s} key = {:>2s}, data = {:>2d}".format(TAG, key, data))
-                        elif isinstance(data, str):
-                            print("{:s} key = {:>2s}, data = {:>2s}".format(TAG, key, data))
-                    if key == "u": # unit of measurement
-                        unit = data
-                    elif key == "mx":
-                        toggle_mx_val = data
-                    elif key == "mn":
-                        toggle_mn_val = data
-                    if key == "v": # value
-                        if unit == "i":
-                            value = data
-                        elif unit == "s":
-                            value = int(data)
-                        lights_ON = True if value == 1 else False # set the global lights_ON flag
-                        toggle_obj.lights_toggle = value # set the object
-                        if lights_ON != lights_ON_old:  # Only change if value differs from last received value
-                            print(TAG+f"toggling ambient light neopixel leds {'on' if lights_ON == True else 'off'}")
-                            #lights_ON_old = lights_ON
-                            if lights_ON:
-                                NP_color()  # Switch bl leds off
-                            else:
-                                NP_clear()  # Switch bl leds on and set color of lightsColorIdx
-                        else:
-                            print(TAG+f"not toggling ambient light neopixel leds. lights_ON = {lights_ON}, lights_ON_old = {lights_ON_old}")
-        elif topicIdx in (2, 3):  # lights/Feath/color_inc or color_dec
+        elif kind == KIND_TOGGLE: # lights/Feath/toggle:
+            # Example: "toggle":{"v":0,"u":"i","mn":1,"mx":0}
+            value = rec.v
+            if isinstance(value, int):
+                lights_ON = True if value == 1 else False # set the global lights_ON flag
+                toggle_obj.lights_toggle = value # set the object
+                if lights_ON != lights_ON_old:  # Only change if value differs from last received value
+                    if log_msg.inf:
+                        log_msg.info(TAG+"toggling ambient light neopixel leds {}", 'on' if lights_ON == True else 'off')
+                    if lights_ON:
+                        NP_color()  # Switch bl leds on and set color of lightsColorIdx
+                    else:
+                        NP_clear()  # Switch bl leds off
+                else:
+                    if log_msg.inf:
+                        log_msg.info(TAG+"not toggling ambient light neopixel leds. lights_ON = {}, lights_ON_old = {}", lights_ON, lights_ON_old)
+        elif kind == KIND_AMB:  # lights/Feath/color_inc or color_dec
             if not lights_ON:
                 return
-            if isinstance(payload, dict):
-                colorData = payload.get("colorInc") if topicIdx == 2 else payload.get("colorDec")
-                if isinstance(colorData, dict):
-                    # amb_obj.payload = colorData # Store payload <<<=== moved to the end of this function  
-                    if my_debug:
-                        print(TAG + f"colorData payload.items() = {colorData.items()}")
-                  
-                    for key, data in colorData.items():
-                        if my_debug:
-                            if isinstance(data, int):
-                                print(TAG + "key = {:>2s}, data = {:>2d}".format(key, data))
-                            elif isinstance(data, str):
-                                print(TAG + "key = {:>2s}, data = {:>2s}".format(key, data))
-
-                        if key == "u":  # unit of measurement
-                            unit = data
-                        elif key == "mx":
-                            lightsColorMax = data
-                        elif key == "mn":
-                            lightsColorMin = data
-                        elif key == "v":  # value
-                            if unit == "i":
-                                value = data
-                            elif unit == "s":
-                                value = int(data)
-
-                            if my_debug:
-                                print(TAG + f"value = {value}, lightsColorMin = {lightsColorMin}, lightsColorMax = {lightsColorMax}")
-                          
-                            if lightsColorMin <= value <= lightsColorMax:
-                                lightsColorIdx = value
-                                # Save new lightsColorIdx in amb_obj
-                              
-                                if my_debug:
-                                    print(TAG + f"lightsColorIdx set to: {lightsColorIdx}")
-                                NP_color()
-                            else:
-                                lightsColorIdx = lightsColorMin+1 # not black!
-                            amb_obj.amb_color_current = lightsColorIdx
-        elif topicIdx in (4, 5):  # lights/Feath/dclr_inc or dclr_dec
-            #if not lights_ON:
-            #    return
-            if isinstance(payload, dict):
-                dColorData = payload.get("dclrInc") if topicIdx == 4 else payload.get("dclrDec")
-                # print(TAG + f"type(dColorData) = {type(dColorData)}")
-                if isinstance(dColorData, dict):
-                    # disp_obj.payload = dColorData # Store payload <<<=== moved to the end of this function
-                    if not my_debug:
-                        print(TAG + f"dColorData payload.items() = {dColorData.items()}")
-                
-                    for key, data in dColorData.items():
-                        if my_debug:
-                            if isinstance(data, int):
-                                print(TAG + "key = {:>2s}, data = {:>2d}".format(key, data))
-                            elif isinstance(data, str):
-                                print(TAG + "key = {:>2s}, data = {:>2s}".format(key, data))
-
-                        if key == "u":  # unit of measurement
-                            unit = data
-                        elif key == "mx":
-                            lightsDclrMax = data
-                        elif key == "mn":
-                            lightsDclrMin = data
-                        elif key == "v":  # value
-                            if unit == "i":
-                                value = data
-                            elif unit == "s":
-                                value = int(data)
-
-                            if not my_debug:
-                                print(TAG + f"value = {value}, lightsDclrMin = {lightsDclrMin}, lightsDclrMax = {lightsDclrMax}")
-                            if lightsDclrMin <= value <= lightsDclrMax:
-                                lightsDclrIdx = value
-                                if not lightsDclrChanged: # Can be set in mqtt_callback()
-                                    lightsDclrChanged = True
-                                if lightsDclrIdx == -1:
-                                    print(TAG+f"⚠️ lightsDClrIdx = {lightsDclrIdx}. Unacceptable. Going to change to 2 (BLUE)")
-                                    lightsDclrIdx = 2 # BLUE
-                                if not my_debug:
-                                    print(TAG+f"going to call disp_color_chg() with new color index: {lightsDclrIdx}")
-                                CURRENT_COLOR_IDX = get_disp_color_idx()
-                                if not my_debug:
-                                    print(TAG+f"CURRENT_COLOR_IDX (from get_disp_color_idx() = {hex(CURRENT_COLOR_IDX)})")
-                                if lightsDclrIdx != CURRENT_COLOR_IDX:
-                                    CURRENT_COLOR = disp_color_chg(lightsDclrIdx)
-                                else:
-                                    CURRENT_COLOR = disp_color_chg(CURRENT_COLOR_IDX)
-                                # Save the the new CURRENT_COLOR in the disp.obj
-                                # disp_obj.disp_color = CURRENT_COLOR  # Moved to function () disp_color_chg()
-                                if not my_debug:
-                                    print(TAG + f"lightsDclrIdx set to: {lightsDclrIdx}")
-                                    current_color_to_name(TAG)
-                                    print(TAG+f"CURRENT_COLOR changed to: {hex(CURRENT_COLOR)} = {dispColorNamesDict[lightsDclrIdx]}")
-                                    # dispColorDict2[lightsDclrIdx]
+            # Example: "colorInc": {"u": "i", "mx": 9, "mn": 0, "v": 3}
+            if isinstance(rec.mx, int):
+                lightsColorMax = rec.mx
+            if isinstance(rec.mn, int):
+                lightsColorMin = rec.mn
+            value = rec.v
+            if isinstance(value, int):
+                if log_msg.dbg:
+                    log_msg.debug(TAG + "value = {}, lightsColorMin = {}, lightsColorMax = {}", value, lightsColorMin, lightsColorMax)
+                if lightsColorMin <= value <= lightsColorMax:
+                    lightsColorIdx = value
+                    if log_msg.dbg:
+                        log_msg.debug(TAG + "lightsColorIdx set to: {}", lightsColorIdx)
+                    NP_color()
                 else:
-                    print(TAG+f"⚠️ not handling: type(dColorData) = {type(dColorData)}")
-        elif topic_idx == 6:
-            metarData = payload.get("metar")
-            for key, data in metarData.items():
-                if my_debug:
-                    if isinstance(data, str):
-                        print(TAG + "key = {:s}, data = {:s}".format(key, data))
-                lbl_k = key
-                if key == "raw":
-                    lbl_v = data
-                    break # "metar" has only one key: "raw"
-            output = {lbl_k: lbl_v}
-            payloadLst.append(output)
-            if my_debug:
-                print(TAG+"metar fields:")
-                print(f"payloadLst: {payloadLst}")
+                    lightsColorIdx = lightsColorMin+1 # not black!
+                amb_obj.amb_color_current = lightsColorIdx # Save new lightsColorIdx in amb_obj
+        elif kind == KIND_DISP:  # lights/Feath/dclr_inc or dclr_dec
+            # Example: "dclrInc": {"u": "i", "mx": 11, "mn": 1, "v": 10}
+            if isinstance(rec.mx, int):
+                lightsDclrMax = rec.mx
+            if isinstance(rec.mn, int):
+                lightsDclrMin = rec.mn
+            value = rec.v
+            if isinstance(value, int):
+                if log_msg.inf:
+                    log_msg.info(TAG + "value = {}, lightsDclrMin = {}, lightsDclrMax = {}", value, lightsDclrMin, lightsDclrMax)
+                if lightsDclrMin <= value <= lightsDclrMax:
+                    lightsDclrIdx = value
+                    if not lightsDclrChanged: # Can be set in msg_from_queue()
+                        lightsDclrChanged = True
+                    if lightsDclrIdx == -1:
+                        log_msg.warn(TAG+"⚠️ lightsDClrIdx = {}. Unacceptable. Going to change to 2 (BLUE)", lightsDclrIdx)
+                        lightsDclrIdx = 2 # BLUE
+                    if log_msg.inf:
+                        log_msg.info(TAG+"going to call disp_color_chg() with new color index: {}", lightsDclrIdx)
+                    CURRENT_COLOR_IDX = get_disp_color_idx()
+                    if log_msg.inf:
+                        log_msg.info(TAG+"CURRENT_COLOR_IDX (from get_disp_color_idx() = {})", hex(CURRENT_COLOR_IDX))
+                    if lightsDclrIdx != CURRENT_COLOR_IDX:
+                        CURRENT_COLOR = disp_color_chg(lightsDclrIdx)
+                    else:
+                        CURRENT_COLOR = disp_color_chg(CURRENT_COLOR_IDX)
+                    # Save the the new CURRENT_COLOR in the disp.obj
+                    # disp_obj.disp_color = CURRENT_COLOR  # Moved to function () disp_color_chg()
+                    if log_msg.inf:
+                        log_msg.info(TAG + "lightsDclrIdx set to: {}", lightsDclrIdx)
+                        current_color_to_name(TAG)
+                        log_msg.info(TAG+"CURRENT_COLOR changed to: {} = {}", hex(CURRENT_COLOR), dispColorNamesDict[lightsDclrIdx])
+            else:
+                log_msg.warn(TAG+"⚠️ not handling: type(dColorData) = {}", type(payload.get(hdlr.key)))
+        elif kind == KIND_METAR:
+            if log_msg.inf:
+                log_msg.info(TAG+"my_status = {}, my_credits = {}", rec.st, rec.cr)
+                log_msg.info(TAG+"wx = {}", payload.get(hdlr.key, '?'))
                 
         # Copy payload to respective class object
-        if payload is not None:
-            if isinstance(payload, dict):
-                # Add new key, topicIdx pair to mqtt messages history dict
-                if my_debug:
-                    pr_obj(topicIdx)
-                
-                if len(payload) > 0:
-                    try:
-                        # Save to object (for example sensor_obj)
-                        if my_debug:
-                            print(TAG+f"payload = {payload}")
-                        save_to_obj(topicIdx, topic_rcvd, payload)
-                        if clean_file_if_too_large():
-                            print(TAG+f"✅ Cleanup messages history file successful")
-                        else:
-                            print(TAG+f"🧹 Not needed to cleanup messages history file")
-                        
-                        if prep_and_save_record_to_sd(topicIdx, uxTime):
-                            print(TAG+"✅ record saved to file on SD")
-                        else:
-                            print(TAG+f"⚠️ Failed to save record onto SD")
-                        # And check the save
-                        if my_debug:
-                            # Search the file on SD-card for the latest record for this topicIdx
-                            # record = find_record_by_topicIdx(topicIdx) # alternative method
-                            record = find_latest_by_topic(topicIdx)
-                            if isinstance(record, dict):
-                                if len(record) > 0:
-                                    print(TAG+f"✅ Last record read from SD: {record}")
-                    except ValueError as e:
-                        print(TAG+f"ValueError: {e}")
-                        raise RuntimeError
-                    except Exception as e:
-                        print(TAG+f"error: {e}")
-                        raise RuntimeError
-            else:
-                print(TAG+f"type(head) = {type(head)}")
-                print(TAG+f"type(payload) = {type(payload)}")
-        else:
-            print(TAG+f"payload is {type(payload)}")
+        if log_msg.dbg:
+            pr_obj(hdlr)
+        
+        if len(payload) > 0:
+            try:
+                # Save to object (for example sensor_obj)
+                if log_msg.dbg:
+                    log_msg.debug(TAG+"payload = {}", payload)
+                save_to_obj(hdlr, topic_rcvd, payload)
+                # The record is written to SD later, by persist_task()
+                record = prep_record(hdlr, uxTime)
+                if record is not None:
+                    if not hist_queue.push(hdlr, topic_rcvd, record, uxTime):
+                        log_msg.warn(TAG+"⚠️ Failed to queue record for SD")
+            except ValueError as e:
+                log_msg.error(TAG+"ValueError: {}", e)
+                raise RuntimeError
+            except Exception as e:
+                log_msg.error(TAG+"error: {}", e)
+                raise RuntimeError
     
     except ValueError as e:
-        print(TAG+f"ValueError: {e}")
+        log_msg.error(TAG+"ValueError: {}", e)
         raise RuntimeError
     except AttributeError as e:
-        print(TAG+f"AttibuteError: {e}")
+        log_msg.error(TAG+"AttibuteError: {}", e)
         raise RuntimeError
     except Exception as e:
-        print(TAG+f"Other Exception error: {e}")
+        log_msg.error(TAG+"Other Exception error: {}", e)
         raise RuntimeError
     
-def get_payload_member(key):
-    global payloadLst, topic_idx
-    TAG = "get_payload_member(): "
-    if isinstance(payloadLst, list):
-        if len(payloadLst) > 0:
-            for entry in payloadLst:
-                if my_debug:
-                    print(TAG+f"entry: {entry}, payloadLst: {payloadLst}")
-                if key in entry:
-                    if my_debug:
-                        print(TAG+f"key \'{key}\' found in entry {entry}")
-                    return entry[key]
-                else:
-                    if my_debug:
-                        print(TAG+f"⚠️ key \'{key}\' not found in entry {entry}")
-                        
-    return ""  # if key not found
-
 def current_color_to_name(tg):
     TAG = "current_color_to_name(): "
     if tg is None:
         tg = ""
-    if my_debug:
-        print(TAG+f"CURRENT_COLOR = {CURRENT_COLOR} dec = {hex(CURRENT_COLOR)} hex")
-        print(TAG+f"dispColorDict2.keys() = {dispColorDict2.keys()}")
+    if log_msg.dbg:
+        log_msg.debug(TAG+"CURRENT_COLOR = {} dec = {} hex", CURRENT_COLOR, hex(CURRENT_COLOR))
+        log_msg.debug(TAG+"dispColorDict2.keys() = {}", dispColorDict2.keys())
     if CURRENT_COLOR in dispColorDict2.keys():
         dispColorDict2_value = dispColorDict2[CURRENT_COLOR]
-        if my_debug:
-          print(TAG+"called from: "+tg)
-          print(TAG+f"lightsDclrIdx = {lightsDclrIdx}")
-          print(TAG+f"dispColorDict2_value = {dispColorDict2_value}")
+        if log_msg.dbg:
+          log_msg.debug(TAG+"called from: "+tg)
+          log_msg.debug(TAG+"lightsDclrIdx = {}", lightsDclrIdx)
+          log_msg.debug(TAG+"dispColorDict2_value = {}", dispColorDict2_value)
         if dispColorDict2_value in dispColorNamesDict.keys():
             dispColorNamesDict_value = dispColorNamesDict[dispColorDict2_value]
-            if my_debug:
-              print(TAG+f"CURRENT_COLOR = {dispColorNamesDict_value}")
+            if log_msg.dbg:
+              log_msg.debug(TAG+"CURRENT_COLOR = {}", dispColorNamesDict_value)
         else:
-            print(TAG+f"⚠️ index: {dispColorDict2_value} not found in: {dispColorNamesDict.keys()}")
+            log_msg.warn(TAG+"⚠️ index: {} not found in: {}", dispColorDict2_value, dispColorNamesDict.keys())
     else:
-        print(TAG+f"⚠️ CURRENT_COLOUR: {CURRENT_COLOR} not found in: {dispColorDict2.keys()}")
+        log_msg.warn(TAG+"⚠️ CURRENT_COLOUR: {} not found in: {}", CURRENT_COLOR, dispColorDict2.keys())
 
 
 # 🔍 2. Find Latest Record by TopicIdx
 def find_latest_by_topic(topic_idx: int = 0) -> dict:
     TAG = "find_latest_by_topic(): "
-    file_path = get_prefix() + msg_hist_fn
-    latest_record = None  # Start with None for clarity
-
-    try:
-        with open(file_path, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue  # Skip empty lines
-                try:
-                    record = ujson.loads(line)
-                    if record.get("topicIdx") == topic_idx:
-                        if (latest_record is None) or (record["t"] > latest_record["t"]):
-                            latest_record = record
-                except Exception as parse_err:
-                    print(TAG + f"⚠️ Parse error: {parse_err}")
-    except Exception as read_error:
-        print(TAG + f"⚠️ Error reading from SD: {read_error}")
-
-    return latest_record or {}
-
-# 🧹 3. Clean File if Record Count > 180 but leave only 20
-def clean_file_if_too_large(max_records: int = 180, retain_records: int = 20) -> bool:
-    TAG = "clear_file_if_too_large(): "
-    file_path = get_prefix() + msg_hist_fn
-    ret = False
-    try:
-        with open(file_path, "r") as f:
-            lines = f.readlines()
-
-        total_records = len(lines)
-        print(TAG + f"received msg records on file: {total_records}")
-        
-        if total_records >= max_records:
-            # Parse each line into a dict
-            records = [ujson.loads(line) for line in lines]
-
-            # Keep only the latest `retain_records` entries
-            records = records[-retain_records:]
-
-            # Write back as JSON lines
-            with open(file_path, "w") as f:
-                for record in records:
-                    f.write(ujson.dumps(record) + "\n")
-
-            print(TAG + f"✅ File cleaned. Retained last {retain_records} records.")
-            ret = True
-    except Exception as e:
-        print(TAG + f"⚠️ Error cleaning file: {e}")
-    return ret
-
+    # From the index of the latest record per topic (see lib/msg_index.py), no need to read the messages history file
+    latest_record = latest_index.get(topic_idx)
+    if my_debug:
+        print(TAG+f"latest record of topicIdx {topic_idx}: {latest_record}")
+    return latest_record
 
-# 📁 1. Write a Record to SD File
-def prep_and_save_record_to_sd(topIdx: int = 0, uxTime: int = 0) -> bool:
-    global sensor_obj, toggle_obj, amb_obj, disp_obj, metar_obj
-    TAG = "prep_and_save_record_to_sd(): "
-    ret = False
+# 📁 1. Prepare a Record for the SD File. Returns None if the entity object has no valid head
+def prep_record(hdlr = None, uxTime: int = 0) -> dict:
+    TAG = "prep_record(): "
+    ret = None
     obj = None
     topic = None
     topicIdx = None
     head = None
     payload = None
-    dtStr = ""
-    # rcvd_iso = ""
-    # yy = mm = dd = hh = mi = ss = 0
-    record = {}
-    json_str = ""
-    file_path = ""
-    f = None
     
-    if topIdx < 0 or topIdx >= topicIdx_max:
-        print(TAG+"⚠️ topicIdx is out of range. Exiting...")
+    if hdlr is None or hdlr.obj is None:
+        log_msg.warn(TAG+"⚠️ topic handler has no entity object. Exiting...")
         return ret
     
-    if topIdx == 0:
-        obj = sensor_obj
-    elif topIdx == 1:
-        obj = toggle_obj
-    elif topIdx in (2,3):
-        obj = amb_obj
-    elif topIdx in (4,5):
-        obj = disp_obj
-    elif topIdx == 6:
-        obj = metar_obj
-    
+    obj = hdlr.obj
     topic    = obj.topic
-    topicIdx = obj.topicIdx
+    topicIdx = hdlr.idx
     head     = obj.head
     payload  = obj.payload
     
     if head is None:
-        print(TAG+f"⚠️ head is None! Exiting...")
+        log_msg.warn(TAG+"⚠️ head is None! Exiting...")
         return ret
     if not isinstance(head, dict):
-        print(TAG+f"⚠️ head is not a dict! Exiting...")
+        log_msg.warn(TAG+"⚠️ head is not a dict! Exiting...")
         return ret
         
+    return new_record(topic, topicIdx, uxTime, head, payload)
+
+# Build a record for the messages history file
+def new_record(topic: str, topicIdx: int, uxTime: int, head: dict, payload) -> dict:
+    TAG = "new_record(): "
+    dtStr = ""
     if uxTime > 0:
         dtStr = convert_to_dtStr(uxTime)
-    if my_debug:
-        print(TAG+f"dtStr = {dtStr}")
+    if log_msg.dbg:
+        log_msg.debug(TAG+"dtStr = {}", dtStr)
     
     record = {
         "topic": topic,
@@ -2081,23 +1569,115 @@ def prep_and_save_record_to_sd(topIdx: int = 0, uxTime: int = 0) -> bool:
         "hd": head,
         "payload": payload
     }
+    return record
+
+# Queue the record of a message older than the last handled one of its topic.
+# It goes to the history file only: the entity object and the MsgRecord are not changed
+def queue_stale_record(hdlr, topic: str, payload, uxTime: int) -> bool:
+    TAG = "queue_stale_record(): "
+    if not isinstance(payload, dict) or not isinstance(payload.get("hd"), dict):
+        log_msg.warn(TAG+"⚠️ payload has no valid head. Exiting...")
+        return False
+    record = new_record(topic, hdlr.idx, uxTime, payload["hd"], payload.get(hdlr.key))
+    if not hist_queue.push(hdlr, topic, record, uxTime):
+        log_msg.warn(TAG+"⚠️ Failed to queue record for SD")
+        return False
+    return True
 
-    json_str = ujson.dumps(record)
-    file_path = get_prefix() + msg_hist_fn # "msg_hist.json"
-    if not my_debug:
-        print(TAG+f"Attempting to write to file: \'{file_path}\'")
+# Write a Record to SD File
+def save_record_to_sd(record: dict) -> bool:
+    TAG = "save_record_to_sd(): "
+    ret = False
+    if log_msg.inf:
+        log_msg.info(TAG+"Attempting to write to file: \'{}\'", hist.path)
 
     try:
-        with open(file_path, "a") as f:
-            f.write(json_str + "\n")
+        kind, data = codec.encode(record)
+        seq = hist.append(kind, data, record["t"], record["topicIdx"])
+        if seq > 0:
+            hist_index.add(seq, record["t"])
             ret = True
+        else:
+            log_msg.warn(TAG+"⚠️ record of {} bytes is too large for a slot of {} bytes", len(data), hist.slot_size)
     except OSError as e:
-        print(TAG+f"⚠️ Failed to write to SD: {e}")
+        log_msg.error(TAG+"⚠️ Failed to write to SD: {}", e)
         # Optional: log to fallback memory, blink LED, or retry later
     except Exception as e:
-        print(TAG+f"⚠️ Error: {e}")
+        log_msg.error(TAG+"⚠️ Error: {}", e)
     return ret
 
+# Write the oldest record from hist_queue to SD. Returns False if hist_queue is empty
+def save_next_record() -> bool:
+    TAG = "save_next_record(): "
+    if not hist_queue.pop():
+        return False
+    if save_record_to_sd(hist_queue.payload):
+        if log_msg.inf:
+            log_msg.info(TAG+"✅ record saved to file on SD")
+        latest_index.update(hist_queue.payload, False)
+        if hist_queue.hdlr.kind == KIND_SENSOR:
+            rollups.add_reads(hist_queue.hdlr.idx, hist_queue.payload["t"], hist_queue.payload["payload"])
+            ts_store.add_reads(hist_queue.hdlr.idx, hist_queue.payload["t"], hist_queue.payload["payload"])
+        if hist.pending == 0: # the group of records has been written, save the indexes with it
+            latest_index.save()
+            hist_index.save()
+            rollups.commit()
+    else:
+        log_msg.warn(TAG+"⚠️ Failed to save record onto SD")
+    # And check the save
+    if my_debug:
+        # Search the file on SD-card for the latest record for this topicIdx
+        # record = find_record_by_topicIdx(topicIdx) # alternative method
+        record = find_latest_by_topic(hist_queue.hdlr.idx)
+        if isinstance(record, dict):
+            if len(record) > 0:
+                print(TAG+f"✅ Last record read from SD: {record}")
+    hist_queue.payload = None
+    return True
+
+# Write the records waiting in the group commit buffer of hist to SD, and the indexes of the history file
+def commit_records():
+    hist.commit()
+    if latest_index.dirty:
+        latest_index.save()
+    hist_index.save()
+    rollups.commit()
+
+# Save the entity objects and the display state for a warm start, see lib/state_snapshot.py
+def save_state() -> bool:
+    return snapshot.save(dispatcher.handlers, time.time(), {
+        "topic_idx": topic_idx, "topic_rcvd": topic_rcvd, "datetime_rcvd": datetime_rcvd, "hh_rcvd": hh_rcvd,
+        "Publisher_ID": Publisher_ID, "publisher_time": publisher_time, "publisher_msgID": publisher_msgID,
+        "lightsColorIdx": lightsColorIdx, "lightsDclrIdx": lightsDclrIdx, "CURRENT_COLOR": CURRENT_COLOR})
+
+# Restore the entity objects and the display state saved by save_state().
+# Returns True if the message of the snapshot can be drawn
+def load_state() -> bool:
+    global topic_idx, topic_rcvd, topic_hdlr, datetime_rcvd, hh_rcvd, Publisher_ID, publisher_time, publisher_msgID, \
+        lightsColorIdx, lightsDclrIdx, CURRENT_COLOR
+    TAG = "load_state(): "
+    g = snapshot.load(dispatcher.handlers)
+    if g is None:
+        print(TAG+f"no snapshot in \"{presto_state_fn}\"")
+        return False
+    hdlr = dispatcher.get(g.get("topic_idx", -1))
+    if hdlr is None or hdlr.rec is None or hdlr.rec.t == "":
+        return False
+    topic_hdlr = hdlr
+    topic_idx = hdlr.idx
+    topic_rcvd = g.get("topic_rcvd") or hdlr.topic
+    datetime_rcvd = g.get("datetime_rcvd", "")
+    hh_rcvd = g.get("hh_rcvd", 0)
+    Publisher_ID = g.get("Publisher_ID")
+    publisher_time = g.get("publisher_time")
+    publisher_msgID = g.get("publisher_msgID")
+    lightsColorIdx = g.get("lightsColorIdx", lightsColorIdx)
+    lightsDclrIdx = g.get("lightsDclrIdx", lightsDclrIdx)
+    CURRENT_COLOR = g.get("CURRENT_COLOR", CURRENT_COLOR)
+    if not my_debug:
+        print(TAG+f"warm start from snapshot of {convert_to_dtStr(snapshot.t)}, topic: \"{topic_rcvd}\"")
+    return True
+
 def get_disp_color_idx(color: int = ORANGE) -> int:
     global disp_color_idx_default
     TAG = "get_disp_color_idx(): "
@@ -2107,8 +1687,8 @@ def get_disp_color_idx(color: int = ORANGE) -> int:
     else:
         if color in dispColorDict2.keys():
             pen_colorIdx = dispColorDict2[color]
-            if not my_debug:
-                print(TAG+f"pen_colorIdx set to: {pen_colorIdx}")
+            if log_msg.dbg:
+                log_msg.debug(TAG+"pen_colorIdx set to: {}", pen_colorIdx)
     return pen_colorIdx
 
 def set_disp_color(hh: int = 0, time_draw: str = "--:--:--"):
@@ -2143,7 +1723,7 @@ def set_disp_color(hh: int = 0, time_draw: str = "--:--:--"):
 # however a display color change command could have been received,
 # so we want to redraw the screen in the new display color
 def redraw() -> bool:
-    global payload_txt, payloadLst, msg_drawn, Publisher_ID, publisher_time, publisher_msgID, topic_idx, \
+    global payload_txt, msg_drawn, Publisher_ID, publisher_time, publisher_msgID, topic_idx, \
         lights_ON, lights_ON_old, CURRENT_COLOR, lightsDclrChanged, lightsColorIdx, lightsDclrIdx, \
         lightsDclrMax, lightsDclrMin, td_default, redraw_done
     TAG = "redraw(): "
@@ -2159,22 +1739,23 @@ def redraw() -> bool:
     latest_topicIdx = -1
     record = {}
     
-    latest_topicIdx = 0 # force to topic 0
+    sensor_hdlr = dispatcher.first(KIND_SENSOR)
+    latest_topicIdx = sensor_hdlr.idx if sensor_hdlr else 0 # force to the sensors topic (topic 0)
 
-    record = find_latest_by_topic(latest_topicIdx) # force topic 0     was: (topIdx_found)
+    record = find_latest_by_topic(latest_topicIdx) # force sensors topic     was: (topIdx_found)
 
     if isinstance(record, dict):
         latest_uxTime = record["t"]
-        if my_debug:
-            print(TAG+f"✅ latest record on topic: {latest_topicIdx}, record: {record}")
+        if log_draw.dbg:
+            log_draw.debug(TAG+"✅ latest record on topic: {}, record: {}", latest_topicIdx, record)
     else:
-        print(TAG+f"⚠️ record is not of type dict but of type: {type(record)}. Exiting...")
+        log_draw.warn(TAG+"⚠️ record is not of type dict but of type: {}. Exiting...", type(record))
         return ret
     
     if latest_uxTime > 0:
         dtStr = record["rcvd"]
-        if my_debug:
-            print(TAG+f"dtStr = {dtStr}")
+        if log_draw.dbg:
+            log_draw.debug(TAG+"dtStr = {}", dtStr)
         #dtStr = convert_to_dtStr(latest_uxTime)
         if isinstance(dtStr, str):
             if len(dtStr) > 0:
@@ -2187,33 +1768,33 @@ def redraw() -> bool:
                 time_draw = td_default
         else:
             time_draw = td_default # Also used for setting the day or night text colour
-        if not my_debug:
-            print(TAG+f"time from latest mqtt msg with uxTime: {latest_uxTime} = {time_draw}")
+        if log_draw.inf:
+            log_draw.info(TAG+"time from latest mqtt msg with uxTime: {} = {}", latest_uxTime, time_draw)
     else:
-        print(TAG+f"⚠️ latest_uxTime: {latest_uxTime}. Exiting...")
+        log_draw.warn(TAG+"⚠️ latest_uxTime: {}. Exiting...", latest_uxTime)
         return ret
     
     if latest_topicIdx == -1:
-        print(TAG+f"⚠️ latest_topicIdx: {latest_topicIdx}. Exiting...")
+        log_draw.warn(TAG+"⚠️ latest_topicIdx: {}. Exiting...", latest_topicIdx)
         return ret
         
     topIdx = latest_topicIdx 
 
     if topIdx == 0:
         if not isinstance(record, dict):
-            print(TAG+f"⚠️ record is not a dict. Exiting...")
+            log_draw.warn(TAG+"⚠️ record is not a dict. Exiting...")
             return ret
         else:
             dtStr_rcvd = record["rcvd"]
             
             head = record["hd"]
             if not isinstance(head, dict):
-                print(TAG+f"⚠️ head is not a dictionary. Exiting ...")
+                log_draw.warn(TAG+"⚠️ head is not a dictionary. Exiting ...")
                 return ret
     
             payload = record["payload"]    
             if not isinstance(payload, dict):
-                print(TAG+f"⚠️ payload is not a dictionary. Exiting ...")
+                log_draw.warn(TAG+"⚠️ payload is not a dictionary. Exiting ...")
                 return ret
 
             # using var names "top" and "topIdx" to keep local,
@@ -2231,7 +1812,8 @@ def redraw() -> bool:
             pres_draw = format_sensor_value(payload, "p")  # Pressure: 1004.1 mB
             alti_draw = format_sensor_value(payload, "a")   # Altitude: 101.1 m
             humi_draw = format_sensor_value(payload, "h")   # Humidity:  49.7
-            print(TAG+f"Topic = \'{top}\', topicIdx = {topIdx}")
+            if log_draw.inf:
+                log_draw.info(TAG+"Topic = \'{}\', topicIdx = {}", top, topIdx)
             
   
         vector.set_font(font_type, font_size)
@@ -2239,25 +1821,25 @@ def redraw() -> bool:
         # Assuming that the display text color already has been set
         # at moment of boot/reset and by receiving a first MQTT message of topicIdx = 0
         CURR_COLOR = disp_obj.disp_color
-        if my_debug:
-            print(TAG+f"CURR_COLOR fm disp_obj.disp_color = {CURR_COLOR}")
+        if log_draw.dbg:
+            log_draw.debug(TAG+"CURR_COLOR fm disp_obj.disp_color = {}", CURR_COLOR)
         if CURR_COLOR in dispColorDict2.keys():
-            if my_debug:
-                print(TAG+f"CURR_COLOR found in dispColorDict2.keys()")
+            if log_draw.dbg:
+                log_draw.debug(TAG+"CURR_COLOR found in dispColorDict2.keys()")
             pen_colorIdx = dispColorDict2[CURR_COLOR]
-            if my_debug:
-                print(TAG+f"pen_colorIdx = {pen_colorIdx}")
+            if log_draw.dbg:
+                log_draw.debug(TAG+"pen_colorIdx = {}", pen_colorIdx)
             if pen_colorIdx in dispColorNamesDict.keys():
-                if my_debug:
-                    print(TAG+f"pen_colorIdx found in dispColorNamesDict.keys()")
+                if log_draw.dbg:
+                    log_draw.debug(TAG+"pen_colorIdx found in dispColorNamesDict.keys()")
                 pen_color_name = dispColorNamesDict[pen_colorIdx]
-                if my_debug:
-                    print(TAG+f"pen_color_name (new) = {pen_color_name}")
+                if log_draw.dbg:
+                    log_draw.debug(TAG+"pen_color_name (new) = {}", pen_color_name)
         else:
             pen_color_name = ""
         
-        if my_debug:
-            print(TAG+f"CURR_COLOR = {CURR_COLOR} = {hex(CURR_COLOR)} hex, color: {pen_color_name}")
+        if log_draw.dbg:
+            log_draw.debug(TAG+"CURR_COLOR = {} = {} hex, color: {}", CURR_COLOR, hex(CURR_COLOR), pen_color_name)
         
         display.set_pen(BLACK)
         display.clear() # clear background
@@ -2288,8 +1870,8 @@ def redraw() -> bool:
   
         y += (2 * line_space)
 
-        if my_debug:
-            print(TAG+f"topic_idx: {topIdx} = topic: \"{top}\"") # TOPIC_DICT[topIdx]}\"")
+        if log_draw.dbg:
+            log_draw.debug(TAG+"topic_idx: {} = topic: \"{}\"", topIdx, top) # TOPIC_DICT[topIdx]}\"")
 
         vector.text(temp_draw, x, y) #, WIDTH, scale = my_scale)
         y += line_space
@@ -2300,14 +1882,14 @@ def redraw() -> bool:
         vector.text(humi_draw, x, y) #, WIDTH, scale = my_scale)        
         presto.update()
         
-        if not my_debug:
-            print(TAG+f"{temp_draw}")
-            print(TAG+f"{pres_draw}")
-            print(TAG+f"{alti_draw}")
-            print(TAG+f"{humi_draw}")
+        if log_draw.inf:
+            log_draw.info(TAG+"{}", temp_draw)
+            log_draw.info(TAG+"{}", pres_draw)
+            log_draw.info(TAG+"{}", alti_draw)
+            log_draw.info(TAG+"{}", humi_draw)
         ret = True
 
-        if not my_debug:
+        if log_draw.inf:
             do_line()
         
         utime.sleep(3)
@@ -2316,7 +1898,7 @@ def redraw() -> bool:
     return ret
 
 def draw(mode:int = 1):
-    global payload_txt, payloadLst, msg_drawn, Publisher_ID, publisher_time, publisher_msgID, topic_idx, \
+    global payload_txt, msg_drawn, Publisher_ID, publisher_time, publisher_msgID, topic_idx, topic_hdlr, \
         lights_ON, lights_ON_old, disp_obj, CURRENT_COLOR, lightsDclrChanged, lightsColorIdx, lightsDclrIdx, \
         lightsDclrMax, lightsDclrMin, td_default
     TAG = "draw(): "
@@ -2332,8 +1914,8 @@ def draw(mode:int = 1):
             time_draw = td_default
     else:
         time_draw = td_default # Also used for setting the day or night text colour
-    if my_debug:
-        print(TAG+f"time derived from datetime_rcvd = {time_draw}")
+    if log_draw.dbg:
+        log_draw.debug(TAG+"time derived from datetime_rcvd = {}", time_draw)
     
     if hh_rcvd is not None:
         if isinstance(hh_rcvd, int):
@@ -2362,13 +1944,13 @@ def draw(mode:int = 1):
     # Display the message
     # See: https://doc-tft-espi.readthedocs.io/tft_espi/colors/
     # NOTE: NAVY gives less brightness than ORANGE
-    if my_debug:
-        print(TAG+f"topic_idx = {topic_idx}")
+    if log_draw.dbg:
+        log_draw.debug(TAG+"topic_idx = {}", topic_idx)
 
     hh = time_draw_hh
     
-    if my_debug:
-        print(TAG+f"hh = {hh}")
+    if log_draw.dbg:
+        log_draw.debug(TAG+"hh = {}", hh)
     
     CURRENT_COLOR = disp_obj.disp_color # get the current display color
     set_disp_color(hh, time_draw)
@@ -2393,24 +1975,24 @@ def draw(mode:int = 1):
     #vector.text("hh = " + str(hh),  10, 160, WIDTH) # scale=2)
     #vector.text(hdg + Publisher_ID, 10, 25, WIDTH)        
         
-    if my_debug:
-        print(TAG+f"msg_rcvd = {msg_rcvd}, lightsDclrChanged = {lightsDclrChanged}")
+    if log_draw.dbg:
+        log_draw.debug(TAG+"msg_rcvd = {}, lightsDclrChanged = {}", msg_rcvd, lightsDclrChanged)
     if msg_rcvd or lightsDclrChanged:
         if not lightsDclrChanged:
             clean()
-        if my_debug:
-            print(TAG+f"hh_received = {hh_rcvd}, type(hh_rcvd) = {type(hh_rcvd)}")
+        if log_draw.dbg:
+            log_draw.debug(TAG+"hh_received = {}, type(hh_rcvd) = {}", hh_rcvd, type(hh_rcvd))
         if  hh_rcvd is not None:
             if isinstance(datetime_rcvd, int):
                 time_draw_hh = hh_rcvd
         else:
 
-            time_draw = get_payload_member("t")
-            if my_debug:
-                print(TAG+f"time_draw = {time_draw}")
+            time_draw = topic_hdlr.rec.t if topic_hdlr else ""
+            if log_draw.dbg:
+                log_draw.debug(TAG+"time_draw = {}", time_draw)
             if time_draw != td_default: # "--:--:--"
-                if not my_debug:
-                    print(TAG+f"time_draw = \'{time_draw}\', type(time_draw) = {type(time_draw)}")
+                if log_draw.inf:
+                    log_draw.info(TAG+"time_draw = \'{}\', type(time_draw) = {}", time_draw, type(time_draw))
                 if isinstance(time_draw, str):
                     if len(time_draw) >= 3:
                         time_draw_hh = int(time_draw[:2])
@@ -2423,9 +2005,9 @@ def draw(mode:int = 1):
     
         hh = time_draw_hh
         
-        if my_debug:
-            print(TAG+f"datetime_rcvd = {datetime_rcvd}, datetime_empty = {datetime_empty}")
-            print(TAG+f"hh = {hh}, DISPLAY_HOUR_WAKEUP = {DISPLAY_HOUR_WAKEUP}, DISPLAY_HOUR_GOTOSLEEP = {DISPLAY_HOUR_GOTOSLEEP}")
+        if log_draw.dbg:
+            log_draw.debug(TAG+"datetime_rcvd = {}, datetime_empty = {}", datetime_rcvd, datetime_empty)
+            log_draw.debug(TAG+"hh = {}, DISPLAY_HOUR_WAKEUP = {}, DISPLAY_HOUR_GOTOSLEEP = {}", hh, DISPLAY_HOUR_WAKEUP, DISPLAY_HOUR_GOTOSLEEP)
 
         vector.text(hdg, 10, 25) #, WIDTH)        
         set_disp_color(hh, time_draw)
@@ -2455,32 +2037,37 @@ def draw(mode:int = 1):
             
     elif mode == 1: # do the PaulskPt method
         try:
+            if topic_hdlr is None:
+                return # No message received yet
+            kind = topic_hdlr.kind
+            rec = topic_hdlr.rec
             #                                             Examples:
             # Read the "doc" members
             #if topic_idx != 6:
-            ow_draw = get_payload_member("ow")        # → "Feather" or "UnoR4W" (or use the global var PUBLISHER_ID)
-            de_draw = get_payload_member("de")        # → "Lab"
-            dc_draw = get_payload_member("dc")        # → "BME280", "home", "colr", "colr"
-            # sc_draw = get_payload_member("sc");     # → "meas", "ligh", "inc", "dec"
-            timestamp_draw = get_payload_member("t")  # → "1748945128" = Tue Jun 03 2025 10:05:28 GMT+0000
-            if my_debug:
-                print(TAG+f"timestamp_draw = {timestamp_draw}")
+            ow_draw = rec.ow        # → "Feather" or "UnoR4W" (or use the global var PUBLISHER_ID)
+            de_draw = rec.de        # → "Lab"
+            dc_draw = rec.dc        # → "BME280", "home", "colr", "colr"
+            # sc_draw = rec.sc     # → "meas", "ligh", "inc", "dec"
+            timestamp_draw = rec.t  # → "1748945128" = Tue Jun 03 2025 10:05:28 GMT+0000
+            if log_draw.dbg:
+                log_draw.debug(TAG+"timestamp_draw = {}", timestamp_draw)
             
-            if topic_idx == 0:
-                temp_draw = get_payload_member("temp")    # → "Temperature: 30.3 °C"
-                pres_draw = get_payload_member("pres")    # → "Pressure: 1002.1 rHa"
-                alti_draw = get_payload_member("alti")    # → "Altitude: 93.3m"
-                humi_draw = get_payload_member("humi")    # → "Humidity: 42.2 %rH"
-            elif topic_idx == 1:
-                toggle_draw1 = "lights_ON = {:s},".format("Yes" if lights_ON else "No") #  get_payload_member("v")
+            if kind == KIND_SENSOR:
+                temp_draw = rec.temp    # → "Temperature: 30.3 °C"
+                pres_draw = rec.pres    # → "Pressure: 1002.1 rHa"
+                alti_draw = rec.alti    # → "Altitude: 93.3m"
+                humi_draw = rec.humi    # → "Humidity: 42.2 %rH"
+            elif kind == KIND_TOGGLE:
+                toggle_draw1 = "lights_ON = {:s},".format("Yes" if lights_ON else "No") 
                 toggle_draw2 = "lights_ON_old = {:s}".format("Yes" if lights_ON_old else "No")
                 if lights_ON != lights_ON_old:
                     lights_ON_old = lights_ON
-                if not my_debug:
-                    print(TAG+f"toggle_draw1 = {toggle_draw1}")
-                    print(TAG+f"toggle_draw2 = {toggle_draw2}")
-            elif topic_idx in (2,3):
-                print(TAG+f"topic_idx = {topic_idx}, lighstColorIdx = {lightsColorIdx}")
+                if log_draw.inf:
+                    log_draw.info(TAG+"toggle_draw1 = {}", toggle_draw1)
+                    log_draw.info(TAG+"toggle_draw2 = {}", toggle_draw2)
+            elif kind == KIND_AMB:
+                if log_draw.inf:
+                    log_draw.info(TAG+"topic_idx = {}, lighstColorIdx = {}", topic_idx, lightsColorIdx)
                 if lightsColorIdx == -1:
                     lightsColorIdx = 0  # change to BLUE
                 color_txt1_draw = "lightsColorIdx = {:d}".format(lightsColorIdx)
@@ -2488,38 +2075,34 @@ def draw(mode:int = 1):
                     color_txt2_draw = blColorNamesDict[lightsColorIdx]
                 else:
                     color_txt2_draw = ""
-                if topic_idx == 2:
-                    t2 = "inc"
-                elif topic_idx == 3:
-                    t2 = "dec"
-                if not my_debug:
-                    print(TAG+f"color_txt1_draw = \"{color_txt1_draw}\"")
-                    print(TAG+f"color_txt2_draw = \"{color_txt2_draw}\"")
-            elif topic_idx == (4,5):
+                t2 = topic_hdlr.step # "inc" or "dec"
+                if log_draw.inf:
+                    log_draw.info(TAG+"color_txt1_draw = \"{}\"", color_txt1_draw)
+                    log_draw.info(TAG+"color_txt2_draw = \"{}\"", color_txt2_draw)
+            elif kind == KIND_DISP:
                 dclr_txt1_draw = "lightsDclrIdx = {:d}".format(lightsDclrIdx)
-                print(TAG+f"topic_idx = {topic_idx}, lighstDclrIdx = {lightsDclrIdx}")
+                if log_draw.inf:
+                    log_draw.info(TAG+"topic_idx = {}, lighstDclrIdx = {}", topic_idx, lightsDclrIdx)
                 if lightsDclrIdx in dispColorNamesDict.keys():
                     dclr_txt2_draw = dispColorNamesDict[lightsDclrIdx]
                 else:
-                    print(TAG+f"lightsDclrIdx: {lightsColorIdx} not found in dispColorNamesDict")
+                    if log_draw.inf:
+                        log_draw.info(TAG+"lightsDclrIdx: {} not found in dispColorNamesDict", lightsColorIdx)
                     dclr_txt2_draw = ""
-                if topic_idx == 4:
-                    t2 = "inc"
-                elif topic_idx == 5:
-                    t2 = "dec"
-                if not my_debug:
-                    print(TAG+f"dclr_txt1_draw = \"{dclr_txt1_draw}\"")
-                    print(TAG+f"dclr_txt2_draw = \"{dclr_txt2_draw}\"")
-            elif topic_idx == 6:
-                if my_debug:
-                    print(TAG+"we passed here. line 2512. topic_idx = 6 (metar)")
-                wx_metar_txt_draw1 = get_payload_member("raw")  # msg['metar']['raw']
-                wx_metar_txt_draw2 = "Status:  " + get_payload_member("st") # msg["acc"]["st"]
-                wx_metar_txt_draw3 = "Credits: " + str(get_payload_member("cr")) # msg["acc"]["cr"]
-                if not my_debug:
-                    print(TAG+f"wx_metar_txt_draw1 = \"{wx_metar_txt_draw1}\"")
-                    print(TAG+f"wx_metar_txt_draw2 = \"{wx_metar_txt_draw2}\"")
-                    print(TAG+f"wx_metar_txt_draw3 = \"{wx_metar_txt_draw3}\"")
+                t2 = topic_hdlr.step # "inc" or "dec"
+                if log_draw.inf:
+                    log_draw.info(TAG+"dclr_txt1_draw = \"{}\"", dclr_txt1_draw)
+                    log_draw.info(TAG+"dclr_txt2_draw = \"{}\"", dclr_txt2_draw)
+            elif kind == KIND_METAR:
+                if log_draw.dbg:
+                    log_draw.debug(TAG+"we passed here. line 2512. topic_idx = 6 (metar)")
+                wx_metar_txt_draw1 = rec.raw  # msg['metar']['raw']
+                wx_metar_txt_draw2 = "Status:  " + rec.st # msg["acc"]["st"]
+                wx_metar_txt_draw3 = "Credits: " + str(rec.cr) # msg["acc"]["cr"]
+                if log_draw.inf:
+                    log_draw.info(TAG+"wx_metar_txt_draw1 = \"{}\"", wx_metar_txt_draw1)
+                    log_draw.info(TAG+"wx_metar_txt_draw2 = \"{}\"", wx_metar_txt_draw2)
+                    log_draw.info(TAG+"wx_metar_txt_draw3 = \"{}\"", wx_metar_txt_draw3)
                     
             else:
                 return # No valid topic_idx
@@ -2530,22 +2113,22 @@ def draw(mode:int = 1):
                 clean()
             
             display.set_pen(CURRENT_COLOR)
-            if my_debug:
-              print(TAG+f"time_draw = {time_draw}")
+            if log_draw.dbg:
+              log_draw.debug(TAG+"time_draw = {}", time_draw)
         
             vector.text(hdg + " " + time_draw, x, y) #, WIDTH, scale = my_scale)
             y += line_space
-            if topic_idx == 6:
-              vector.text(TOPIC_DICT[topic_idx], x, y) #, WIDTH, scale = my_scale)
+            if kind == KIND_METAR:
+              vector.text(topic_rcvd, x, y) #, WIDTH, scale = my_scale)
             else:
               vector.text(ow_draw + " " + de_draw + " " + dc_draw, x, y) #, WIDTH, scale = my_scale)
             y += line_space
             vector.text("msgID: " + timestamp_draw, x, y) # , WIDTH, scale = my_scale)
-            if topic_idx != 6:
+            if kind != KIND_METAR:
               y += (2 * line_space)  # no more line space below msgID for METAR topic
-            if my_debug:
-                print(TAG+f"topic_idx: {topic_idx} = topic: \"{TOPIC_DICT[topic_idx]}\"")
-            if topic_idx == 0: # sensors/Feath/ambient
+            if log_draw.dbg:
+                log_draw.debug(TAG+"topic_idx: {} = topic: \"{}\"", topic_idx, topic_rcvd)
+            if kind == KIND_SENSOR: # sensors/Feath/ambient
                 vector.text(temp_draw, x, y) #, WIDTH, scale = my_scale)
                 y += line_space
                 vector.text(pres_draw, x, y) #, WIDTH, scale = my_scale)
@@ -2553,40 +2136,40 @@ def draw(mode:int = 1):
                 vector.text(alti_draw, x, y) #, WIDTH, scale = my_scale)
                 y += line_space
                 vector.text(humi_draw, x, y) #, WIDTH, scale = my_scale)
-                if not my_debug:
-                    print(TAG+f"{temp_draw}")
-                    print(TAG+f"{pres_draw}")
-                    print(TAG+f"{alti_draw}")
-                    print(TAG+f"{humi_draw}")
-            elif topic_idx == 1: # lights/Feath/toggle
+                if log_draw.inf:
+                    log_draw.info(TAG+"{}", temp_draw)
+                    log_draw.info(TAG+"{}", pres_draw)
+                    log_draw.info(TAG+"{}", alti_draw)
+                    log_draw.info(TAG+"{}", humi_draw)
+            elif kind == KIND_TOGGLE: # lights/Feath/toggle
                 vector.text(toggle_draw1, x, y) #, WIDTH, scale = my_scale)
                 y += line_space + 5
                 vector.text(toggle_draw2, x, y) #, WIDTH, scale = my_scale)
                 y += line_space
-                if my_debug:
-                    print(TAG+f"{toggle_draw1}")
-                    print(TAG+f"{toggle_draw2}")
-            elif topic_idx in (2,3): # lights/Feath/color_inc or lights/Feath/color_dec
+                if log_draw.dbg:
+                    log_draw.debug(TAG+"{}", toggle_draw1)
+                    log_draw.debug(TAG+"{}", toggle_draw2)
+            elif kind == KIND_AMB: # lights/Feath/color_inc or lights/Feath/color_dec
                 vector.text(color_txt1_draw, x, y) #, WIDTH, scale = my_scale) 
                 y += line_space + 5
                 vector.text(color_txt2_draw, x, y) #, WIDTH, scale = my_scale)
                 y += line_space
-                if not my_debug:
-                    print(TAG+f"{color_txt1_draw}")
-                    print(TAG+f"{color_txt2_draw}")
+                if log_draw.inf:
+                    log_draw.info(TAG+"{}", color_txt1_draw)
+                    log_draw.info(TAG+"{}", color_txt2_draw)
                 if not lights_ON:
                     vector.text("Remote: press Btn B!", x, y) #, WIDTH, scale = my_scale)
-            elif topic_idx in (4,5): # lights/Feath/dclr_inc or lights/Feath/dclr_dec
+            elif kind == KIND_DISP: # lights/Feath/dclr_inc or lights/Feath/dclr_dec
                 vector.text(dclr_txt1_draw, x, y) #, WIDTH, scale = my_scale) 
                 y += line_space + 5
                 vector.text(dclr_txt2_draw, x, y) #, WIDTH, scale = my_scale)
                 y += line_space
-                if not my_debug:
-                    print(TAG+f"{dclr_txt1_draw}")
-                    print(TAG+f"{dclr_txt2_draw}")
+                if log_draw.inf:
+                    log_draw.info(TAG+"{}", dclr_txt1_draw)
+                    log_draw.info(TAG+"{}", dclr_txt2_draw)
                 #if not lights_ON:
                 #  vector.text("Remote: press Btn B!", x, y) # , WIDTH, scale = my_scale)
-            elif topic_idx == 6:
+            elif kind == KIND_METAR:
                 y += (2 * line_space)  # no more line space below msgID for METAR topic
                 #y += line_space  # no more line space below msgID for METAR topic
                 # payload: '{"metar": {"raw": "METAR LPPT 310100Z 33007KT CAVOK 27/11 Q1015"}}'
@@ -2594,23 +2177,23 @@ def draw(mode:int = 1):
                 for line in wx_metar_txt_draw_lst:
                     vector.text(line, x, y) #, WIDTH, scale = my_scale)
                     y += line_space
-                    if not my_debug:
-                        print(TAG+f"{line}")
+                    if log_draw.inf:
+                        log_draw.info(TAG+"{}", line)
                 #y += (2*line_space)
                 y += line_space
                 vector.text(wx_metar_txt_draw2 + ", " + wx_metar_txt_draw3, x, y)
-                if not my_debug:
-                  print(TAG+f"{wx_metar_txt_draw2}, {wx_metar_txt_draw3}")
+                if log_draw.inf:
+                  log_draw.info(TAG+"{}, {}", wx_metar_txt_draw2, wx_metar_txt_draw3)
                 #y += line_space
         except Exception as e:
-            print(TAG+f"error: {e}")
+            log_draw.error(TAG+"error: {}", e)
             raise
     
     presto.update()
     
     msg_drawn = True
     
-    if not my_debug:
+    if log_draw.inf:
         do_line()
 
 def print_file_contents(tag, file_path, file_label):
@@ -2639,6 +2222,7 @@ def pr_log():
     # Close log object if open
     if log_obj:
         log_obj.close()
+    log_writer.flush() # write the lines still buffered
 
     # Print log file contents
     print_file_contents(TAG, log_path, "log file")
@@ -2651,9 +2235,7 @@ def clr_displays():
     presto.update()
         
 def cleanup():
-    global ref_exist, ref_obj, ref_path, log_exist, log_obj, log_path, lightsDclrChanged
-    if ref_obj: # and ref_path is not None and ref_exist:
-        ref_obj.close()
+    global log_exist, log_obj, log_path, lightsDclrChanged
     if log_obj: # and log_path is not None and log_exist:
         log_obj.close()
     #display.set_pen(ORANGE)
@@ -2690,11 +2272,10 @@ def setup():
     if not my_debug:
         print(TAG+f"Display hours wakeup: {DISPLAY_HOUR_WAKEUP}, gotosleep: {DISPLAY_HOUR_GOTOSLEEP}")
     
-    #rx_bfr=1024  # ← Increase to 1024 or higher
-    #print(TAG+f"Connecting to MQTT broker at {BROKER} on port {PORT}") # , recv_buffer {rx_bfr}")
-    print(TAG+f"Connecting to MQTT {"local" if use_local_broker else "external"} broker on port {PORT}") # , recv_buffer {rx_bfr}")
+    #print(TAG+f"Connecting to MQTT broker at {BROKER} on port {PORT}, recv_buffer {MQTT_RECV_BUFFER}")
+    print(TAG+f"Connecting to MQTT {"local" if use_local_broker else "external"} broker on port {PORT}, recv_buffer {MQTT_RECV_BUFFER}")
     
-    client = MQTTClient(CLIENT_ID, BROKER, port=PORT) #, recv_buffer=rx_bfr)
+    client = MQTTClientRx(CLIENT_ID, BROKER, port=PORT, recv_buffer=MQTT_RECV_BUFFER)
     
     client.set_callback(mqtt_callback)
     #display.clear()
@@ -2747,148 +2328,339 @@ def setup():
         print(TAG+f"⚠️ KeyboardInterrupt. Exiting...\n")
         add_to_log("Session interrupted by user — logging and exiting.")
         cleanup()
-        pr_ref()
+        print(TAG+f"log ring: {log_ring.stats()}")
         pr_log()
         raise
 
+# Take the oldest message from the queue and set the globals used by split_msg() and draw()
+def msg_from_queue() -> bool:
+    global topic_rcvd, topic_idx, topic_hdlr, payload, ts, lightsDclrChanged
+    TAG = "msg_from_queue(): "
+    if not msg_queue.pop():
+        return False
+    topic_hdlr = msg_queue.hdlr
+    topic_idx = topic_hdlr.idx
+    topic_rcvd = msg_queue.topic
+    payload = msg_queue.payload
+    ts = msg_queue.ts
+    # If a new message received, switch off an eventually active lightsDclrChanged flag
+    if topic_hdlr.kind == KIND_DISP:
+        if log_msg.inf:
+            log_msg.info(TAG+"display color change message received")
+        lightsDclrChanged = True
+    else:
+        lightsDclrChanged = False
+    disp_obj.disp_color_changed = lightsDclrChanged  # update the flag in the disp_obj
+    return True
+
 # -------------Here begins the "loop()" part: ---------------------------
 # def main():
 # global client, msg_rcvd, last_update_time, publisher_msgID
 # for compatibility with the Presto "system" the line "def main()" and below it the "globals" line have been removed
+#
+# The loop() part runs as asyncio tasks, instead of spinning on client.check_msg():
+# - rx_task():      waits until the MQTT socket is readable, then client.check_msg() puts the messages in msg_queue;
+# - process_task(): takes the messages from msg_queue, control lane first: split_msg() for each (objects, lights);
+# - persist_task(): writes the records queued by split_msg() to the history file on SD, when msg_queue is empty;
+# - render_task():  draws the newest message, at most once per RENDER_TICK_MS, and refreshes the screen
+#                   every MESSAGE_DISPLAY_DURATION seconds;
+# - maint_task():   log rotation, saving the broker dict and the msg rx timeout, each at its own deadline.
+# Warm start: draw the last message saved by save_state(), before WiFi and MQTT are set up
+warm_start = load_state()
+draw(1 if warm_start else 0)
+
+# WiFi setup
+
+# Eventually (if needed)
+ssid = secrets['wifi']['ssid']
+#password = secrets['wifi']['password']
+
+print(TAG+"Connecting to WiFi...")
+wifi = presto.connect()  # Ensure this is configured for your network
+print(TAG+"WiFi connected.")
+wifi_connected = True
+add_to_log("WiFi connected to: {}".format(ssid))
+
 rotate_log_if_needed() # check if we need to create a new log file
 list_logfiles()
 setup()
-draw(0) # Ensure the default message "Waiting for Messages..." is displayed
+if not warm_start:
+    draw(0) # Ensure the default message "Waiting for Messages..." is displayed
 TAG = "loop(): "
-start_t = time.time()
-current_t = start_t
-elapsed_t = 0
-interval_t = 5 * 60  # Interval to check for call rotate_log_if_needed() in seconds (300 seconds = 5 minutes)
-
-save_broker_dict_interval_t = 15 * 60 # 15 minutes
-save_broker_dict_start_t = 0
-save_broker_dict_curr_t = 0
-save_broker_dict_elapsed_t = 0
-
-msg_rx_timeout_interval_t = 3 * 60 # 3 minutes
-msg_rx_timeout_start_t = start_t # same as start_t
-msg_rx_timeout_curr_t = 0
-msg_rx_timeout_elapsed_t = 0
-msg_rx_timeout = False
-last_triggered = -1
-show_size = True  # Show the size of the current log file
-while True:
-    try:
+
+LOG_ROTATE_INTERVAL_T = 5 * 60        # Interval to check for call rotate_log_if_needed() in seconds (300 seconds = 5 minutes)
+SAVE_BROKER_DICT_INTERVAL_T = 15 * 60 # 15 minutes
+MSG_RX_TIMEOUT_INTERVAL_T = 3 * 60    # 3 minutes
+SAVE_STATE_INTERVAL_T = 5 * 60        # 5 minutes. Saves the snapshot for a warm start, when messages have been handled
+msg_rx_last_t = time.time()           # time of the last received message. Set by rx_task()
+
+msg_event = asyncio.Event()     # set by rx_task() when messages have been queued
+render_event = asyncio.Event()  # set by process_task() when a message is ready to be drawn
+hist_event = asyncio.Event()    # set by process_task() when records for SD have been queued
+
+# Handle an exception raised in one of the tasks
+def task_error(tg: str, e: Exception):
+    if e.args and e.args[0] == 103:
+        print(tg+f"⚠️ Error ECONNABORTED") # = Software caused connection abort
+        err.log(e) # print exception to the err.log
+        print(tg+f"Reconnecting to MQTT broker...")
+        setup()
+    elif e.args and e.args[0] == 104: # ECONNRESET
+        print(tg+f"⚠️ Error ECONNRESET") # = Software caused connection abort
+        err.log(e) # print exception to the err.log
+        print(tg+f"Reconnecting to MQTT broker...")
+        setup()
+    else:
+        print(tg+f"⚠️ Error: {repr(e)}")
+        print(tg+f"Error: {e}")
+        err.log(e) # print exception to the err.log
+        if mlog.sink() is not None:
+            print(tg+f"last {min(mlog.sink().count, LOG_MEM_LINES)} log lines:")
+            mlog.sink().dump() # the lines before the error
+        commit_records()
+        save_state()
+        log_writer.close()
+        cleanup()
+        raise RuntimeError
+
+async def rx_task():
+    global msg_rx_last_t
+    TAG = "rx_task(): "
+    rx_sock = None
+    reader = None
+    while True:
+        try:
+            if client.sock is not rx_sock: # (re)connected by setup()
+                rx_sock = client.sock
+                reader = asyncio.StreamReader(rx_sock)
+            # read(0) returns, without reading, as soon as the socket is readable.
+            # Until then the other tasks run, or the device idles
+            await reader.read(0)
+            # Collect the message(s) waiting in the socket into the queue. A full lane does not stop
+            # the reading: msg_queue.push() applies the drop policy of that lane
+            while client.check_msg() is not None:
+                if msg_queue.is_full(): # give process_task() a turn
+                    msg_rx_last_t = time.time()
+                    msg_event.set()
+                    await asyncio.sleep_ms(0)
+            if len(msg_queue) > 0:
+                msg_rx_last_t = time.time()
+                msg_event.set()
+            await asyncio.sleep_ms(0)
+        except OSError as e:
+            log_rx.error(TAG+"OSError occurred (Lost connection with MQTT Broker? {})", e)
+            task_error(TAG, e) # reconnects on ECONNABORTED and ECONNRESET
+        except Exception as e:
+            task_error(TAG, e)
+
+async def process_task():
+    TAG = "process_task(): "
+    while True:
+        await msg_event.wait()
+        msg_event.clear()
+        try:
+            while msg_from_queue():
+                if not hw_marks.advance(topic_hdlr, ts):
+                    # Older than the last handled message of this topic: to the history file only
+                    if log_msg.inf:
+                        log_msg.info(TAG+"⏪ stale message on topic: \"{}\", msgID: {} < {}", topic_rcvd, ts, hw_marks.get(topic_hdlr))
+                    if queue_stale_record(topic_hdlr, topic_rcvd, payload, ts):
+                        hist_event.set()
+                    await asyncio.sleep_ms(0)
+                    continue
+                split_msg() # every message goes to its object and is queued for the history file on SD
+                coalescer.mark(topic_hdlr, topic_rcvd, lightsDclrChanged) # but only the newest one will be drawn
+                if log_msg.inf:
+                    if publisher_msgID:
+                        log_msg.info(TAG+"MQTT message received from: {}", publisher_msgID)
+                    else:
+                        log_msg.info(TAG+"MQTT message received")
+                render_event.set()
+                if len(hist_queue) > 0:
+                    hist_event.set()
+                await asyncio.sleep_ms(0) # let rx_task() and render_task() run between two messages
+            # Cleanup
+            if log_msg.dbg:
+                log_msg.debug(TAG+"Cleaning up:")
+            cleanup()
+        except Exception as e:
+            task_error(TAG, e)
+
+async def render_task():
+    global topic_hdlr, topic_idx, topic_rcvd, lightsDclrChanged, msg_rcvd, last_update_time
+    TAG = "render_task(): "
+    while True:
+        try:
+            await asyncio.wait_for(render_event.wait(), MESSAGE_DISPLAY_DURATION)
+        except asyncio.TimeoutError:
+            pass
+        render_event.clear()
+        try:
+            if coalescer.pending():
+                # Draw the newest message, at most once per RENDER_TICK_MS
+                wait_ms = coalescer.wait_ms(time.ticks_ms())
+                if wait_ms > 0:
+                    await asyncio.sleep_ms(wait_ms) # messages processed meanwhile replace this one
+                topic_hdlr, topic_rcvd, lightsDclrChanged = coalescer.take(time.ticks_ms())
+                topic_idx = topic_hdlr.idx
+                msg_rcvd = True
+                if lightsDclrChanged and not redraw_done:
+                    while save_next_record(): # redraw() reads the latest sensor record
+                        pass
+                    commit_records()
+                    redraw()
+                if not redraw_done: # do not call draw when redraw was called
+                    draw(1) # Display the new message in mode "PaulskPt"
+                clean_rd()
+                msg_rcvd = len(msg_queue) > 0
+            elif len(msg_queue) == 0 and time.time() - last_update_time > MESSAGE_DISPLAY_DURATION:
+                # Refresh the display periodically
+                draw(1)  # Refresh the screen with the current message
+                last_update_time = time.time()
+        except Exception as e:
+            task_error(TAG, e)
+
+async def persist_task():
+    TAG = "persist_task(): "
+    commit_t = 0  # ticks_ms when the oldest record in the group commit buffer was saved
+    while True:
+        if hist.pending > 0:
+            # Wait for more records, but not longer than HIST_COMMIT_DELAY_MS after the oldest one
+            wait_ms = HIST_COMMIT_DELAY_MS - time.ticks_diff(time.ticks_ms(), commit_t)
+            try:
+                if wait_ms <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for_ms(hist_event.wait(), wait_ms)
+            except asyncio.TimeoutError:
+                try:
+                    commit_records()
+                except Exception as e:
+                    task_error(TAG, e)
+                continue
+        else:
+            await hist_event.wait()
+        hist_event.clear()
+        try:
+            while len(hist_queue) > 0:
+                while len(msg_queue) > 0: # received messages go first
+                    await asyncio.sleep_ms(PERSIST_DEFER_MS)
+                pending = hist.pending
+                save_next_record()
+                if pending == 0 and hist.pending > 0:
+                    commit_t = time.ticks_ms()
+                await asyncio.sleep_ms(0)
+        except Exception as e:
+            task_error(TAG, e)
+
+async def maint_task():
+    global msg_rx_last_t
+    TAG = "maint_task(): "
+    show_size = True  # Show the size of the current log file
+    log_rotate_t = time.time()
+    save_broker_dict_t = log_rotate_t
+    save_state_t = log_rotate_t
+    state_marked = coalescer.marked  # number of messages handled at the last save of the snapshot
+    while True:
         current_t = time.time()
-        elapsed_t = current_t - start_t
-        
-        save_broker_dict_elapsed_t = save_broker_dict_curr_t - save_broker_dict_start_t
-        if save_broker_dict_elapsed_t >= save_broker_dict_interval_t:
-            save_broker_dict_start_t = save_broker_dict_curr_t
-            save_broker_dict()
-            
-        if my_debug:
-            if elapsed_t % 10 == 0 and (elapsed_t != last_triggered or last_triggered == -1):
-                last_triggered = elapsed_t
-                print(TAG+f"elapsed_t = {elapsed_t:.2f} seconds")
-                # print(TAG+f"current_t = {current_t}, start_t = {start_t}, elapsed_t = {elapsed_t:.2f} seconds")
-        if elapsed_t >= interval_t:
-            start_t = current_t  # Reset the start time
+        if current_t - log_rotate_t >= LOG_ROTATE_INTERVAL_T:
+            log_rotate_t = current_t
             # Check if we need to create a new log file
             # and show the size of the current log file
             rotate_log_if_needed(show=show_size)
-            show_size = not show_size  # Toggle the display of the log file size  
-        
-        # Wait for MQTT messages (non-blocking check)
-        while True:
-   
-            msg_rx_timeout_current_t = time.time()
-            client.check_msg()
-            # print(TAG+"we passed the client.check_msg(). Line 2687")
-            if msg_rcvd:
-                msg_rx_timeout_start_t = msg_rx_timeout_current_t # update the start time
-                break
-            if lightsDclrChanged:
-                break
-            msg_rx_timeout_elapsed_t = msg_rx_timeout_current_t - msg_rx_timeout_start_t
-            if msg_rx_timeout_elapsed_t >= msg_rx_timeout_interval_t:
-                msg_rx_timeout_start_t = msg_rx_timeout_current_t
-                msg_rx_timeout = True
-                break
-        
-        if msg_rx_timeout:
-            msg_rx_timeout = False # reset flag
+            show_size = not show_size  # Toggle the display of the log file size
+        if current_t - save_broker_dict_t >= SAVE_BROKER_DICT_INTERVAL_T:
+            save_broker_dict_t = current_t
+            save_broker_dict()
+        if current_t - save_state_t >= SAVE_STATE_INTERVAL_T:
+            save_state_t = current_t
+            if coalescer.marked != state_marked:
+                state_marked = coalescer.marked
+                save_state()
+        if current_t - msg_rx_last_t >= MSG_RX_TIMEOUT_INTERVAL_T:
+            msg_rx_last_t = current_t
             print(TAG+"⚠️ msg rx timedout!")
-            continue # loop
-
-        # Refresh the display periodically
-
-        if msg_rcvd:
-            split_msg()
-            if lightsDclrChanged and not redraw_done:
-                redraw()
-       
-            if not my_debug:
-                if publisher_msgID:
-                    print(TAG+f"MQTT message received from: {publisher_msgID}")
-                else:
-                    print(TAG+f"MQTT message received")
-
-            if not redraw_done: # do not call draw when redraw was called
-                draw(1) # Display the new message in mode "PaulskPt"
-            clean_rd() 
-            # msg_rcvd = False
-        elif time.time() - last_update_time > MESSAGE_DISPLAY_DURATION:
-            # clean_rd()
-            draw(1)  # Refresh the screen with the current message
-            last_update_time = time.time()
-        if msg_rcvd:
-            # Cleanup
-            if my_debug:
-                print(TAG+"Cleaning up:")
-            cleanup()
-            msg_rcvd = False # reset this flag
-    
-    except OSError as e:
-        print(TAG+f"OSError occurred (Lost connection with MQTT Broker? {e})")
-        raise RuntimeError
-    except Exception as e:
-        if e.args[0] == 103:
-            print(TAG+f"⚠️ Error ECONNABORTED") # = Software caused connection abort
-            # add_to_log(e)
-            err.log(e) # print exception to the err.log
-            print(TAG+f"Reconnecting to MQTT broker...")
-            setup()
-            #cleanup()
-            #raise RuntimeError
-        elif e.args[0] == 104: # ECONNRESET
-            print(TAG+f"⚠️ Error ECONNRESET") # = Software caused connection abort
-            # sys.print_exception(e)
-            #add_to_log(e)
-            err.log(e) # print exception to the err.log
-            print(TAG+f"Reconnecting to MQTT broker...")
-            setup()
-        else:
-            print(TAG+f"⚠️ Error: {repr(e)}")
-            print(TAG+f"Error: {e}")
-            #err_txt = f"Error while waiting for MQTT messages:"
-            #if my_debug:
-            #    print(TAG+f"{err_txt} {e}")
-            #else:
-            #    print(TAG+f"{err_txt} {e.__class__.__name__}: {e}")
-            err.log(e) # print exception to the err.log
-            cleanup()        
-            raise RuntimeError
-    except KeyboardInterrupt as e:
-        print(TAG+f"⚠️ KeyboardInterrupt: exiting...\n")
-        # sys.print_exception(e)
-        # err.log(e)
-        add_to_log("Session interrupted by user — logging and exiting.")
-        save_broker_dict()
-        cleanup()
-        pr_ref()
-        pr_log()
-        raise
+        # Sleep until the nearest deadline
+        next_t = min(log_rotate_t + LOG_ROTATE_INTERVAL_T,
+                     save_broker_dict_t + SAVE_BROKER_DICT_INTERVAL_T,
+                     save_state_t + SAVE_STATE_INTERVAL_T,
+                     msg_rx_last_t + MSG_RX_TIMEOUT_INTERVAL_T)
+        if my_debug:
+            print(TAG+f"next deadline in {next_t - current_t} seconds")
+        await asyncio.sleep(max(1, next_t - time.time()))
+
+# Compress the closed log files queued by create_logfile(), one chunk at a time. Received messages go first
+async def deflate_task():
+    TAG = "deflate_task(): "
+    while True:
+        if log_deflate.pending == 0:
+            await deflate_event.wait()
+        deflate_event.clear()
+        try:
+            while log_deflate.pending > 0:
+                while len(msg_queue) > 0:
+                    await asyncio.sleep_ms(PERSIST_DEFER_MS)
+                fn = log_deflate.step()
+                if fn is not None:
+                    sd_cache.removed(fn)
+                    sd_cache.created(fn + ".gz", log_deflate.last_size)
+                    if not my_debug:
+                        print(TAG+f"log file: \"{fn}\" compressed, {log_deflate.stats()}")
+                await asyncio.sleep_ms(0)
+        except Exception as e:
+            task_error(TAG, e)
+
+# Write the lines buffered by add_to_log() to the log file, at the latest LOG_FLUSH_MS after the oldest one
+async def log_task():
+    TAG = "log_task(): "
+    while True:
+        await asyncio.sleep_ms(max(1, LOG_FLUSH_MS - log_writer.age_ms()))
+        try:
+            if log_writer.pending > 0 and log_writer.age_ms() >= LOG_FLUSH_MS:
+                log_writer.flush()
+        except Exception as e:
+            task_error(TAG, e)
+
+async def main():
+    tasks = [asyncio.create_task(t()) for t in (rx_task, process_task, render_task, persist_task, maint_task, log_task, deflate_task)]
+    await asyncio.gather(*tasks)
+
+try:
+    asyncio.run(main())
+except KeyboardInterrupt as e:
+    print(TAG+f"⚠️ KeyboardInterrupt: exiting...\n")
+    # sys.print_exception(e)
+    # err.log(e)
+    add_to_log("Session interrupted by user — logging and exiting.")
+    print(TAG+f"message queue: {msg_queue.stats()}")
+    print(TAG+f"receive buffer: {client.rx_stats()}")
+    print(TAG+f"coalescer: {coalescer.stats()}")
+    print(TAG+f"history queue: {hist_queue.stats()}")
+    print(TAG+f"dedup: {dedup.stats()}")
+    print(TAG+f"high-water marks: {hw_marks.stats()}")
+    while save_next_record(): # write the records still queued
+        pass
+    commit_records()
+    save_state()
+    print(TAG+f"messages history: {hist.stats()}")
+    print(TAG+f"history codec: {codec.stats()}")
+    print(TAG+f"history index: {hist_index.stats()}")
+    print(TAG+f"rollups: {rollups.stats()}")
+    print(TAG+f"time series: {ts_store.stats()}")
+    print(TAG+f"log writer: {log_writer.stats()}")
+    print(TAG+f"sd cache: {sd_cache.stats()}")
+    print(TAG+f"log compression: {log_deflate.stats()}")
+    if mlog.sink() is not None:
+        print(TAG+f"last {min(mlog.sink().count, LOG_MEM_LINES)} log lines:")
+        mlog.sink().dump()
+    hist.close()
+    rollups.close()
+    ts_store.close()
+    save_broker_dict()
+    log_writer.close()
+    cleanup()
+    print(TAG+f"log ring: {log_ring.stats()}")
+    pr_log()
+    raise
 
 # for compatibility with the Presto "system" the next two lines have been commented out
 # if __name__ == '__main__':